@@ -0,0 +1,138 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+/**
+ * Pool of long-lived `pipeline_runner.py --serve` workers.
+ *
+ * Each worker handles one job at a time over a JSON-lines protocol. A job's
+ * timeout starts when it is dispatched to a worker; on timeout the worker is
+ * killed (the only way to stop an in-flight job) and replaced lazily, so the
+ * governor's TIMEOUT semantics match the one-process-per-request path.
+ */
+class PipelineWorkerPool {
+  constructor({ pythonPath, runnerPath, cwd, env, size = 1 }) {
+    this.pythonPath = pythonPath;
+    this.runnerPath = runnerPath;
+    this.cwd = cwd;
+    this.env = env;
+    this.size = Math.max(1, size);
+    this.workers = [];
+    this.queue = [];
+    this.closed = false;
+  }
+
+  /**
+   * Queues a job and resolves with { exitCode, stdout, stderr, timedOut, pid }.
+   * `onDispatch(pid)` fires once a worker has accepted the job.
+   */
+  submit(job, { timeoutMs, onDispatch } = {}) {
+    return new Promise((resolve) => {
+      this.queue.push({ job, timeoutMs, onDispatch, resolve });
+      this.dispatch();
+    });
+  }
+
+  close() {
+    this.closed = true;
+    this.workers.forEach((worker) => worker.child.kill('SIGKILL'));
+    this.workers = [];
+  }
+
+  dispatch() {
+    while (this.queue.length > 0) {
+      const worker = this.idleWorker();
+      if (!worker) return;
+      this.assign(worker, this.queue.shift());
+    }
+  }
+
+  idleWorker() {
+    const idle = this.workers.find((w) => !w.current && !w.dead);
+    if (idle) return idle;
+    if (this.closed || this.workers.length >= this.size) return null;
+    return this.startWorker();
+  }
+
+  startWorker() {
+    const child = spawn(this.pythonPath, [this.runnerPath, '--serve'], {
+      shell: false,
+      cwd: this.cwd,
+      env: this.env,
+    });
+    const worker = { child, current: null, dead: false };
+
+    readline.createInterface({ input: child.stdout }).on('line', (line) => this.onEvent(worker, line));
+    child.stdin.on('error', () => {});
+    child.stderr.on('data', (d) => {
+      if (worker.current) worker.current.stderr += d.toString();
+    });
+    child.on('error', (err) => this.onExit(worker, -1, err.message));
+    child.on('close', (code) => this.onExit(worker, code, null));
+
+    this.workers.push(worker);
+    return worker;
+  }
+
+  assign(worker, task) {
+    const current = { ...task, stderr: '', timer: null, settled: false };
+    worker.current = current;
+
+    if (current.timeoutMs) {
+      current.timer = setTimeout(() => {
+        this.settle(worker, { exitCode: -1, stdout: '', timedOut: true });
+        this.retire(worker);
+        worker.child.kill('SIGKILL');
+      }, current.timeoutMs);
+    }
+
+    if (current.onDispatch) {
+      // Runs inside stdout/exit handlers: a throw here would leave the job unsettled and the worker busy.
+      try {
+        current.onDispatch(worker.child.pid);
+      } catch (e) {
+        console.error(`[WORKER] onDispatch callback failed for ${current.job.execution_id}: ${e.message}`);
+      }
+    }
+    worker.child.stdin.write(`${JSON.stringify(current.job)}\n`);
+  }
+
+  onEvent(worker, line) {
+    let event;
+    try {
+      event = JSON.parse(line);
+    } catch {
+      return;
+    }
+    const current = worker.current;
+    if (event.event !== 'result' || !current || event.execution_id !== current.job.execution_id) return;
+
+    current.stderr += event.stderr || '';
+    this.settle(worker, { exitCode: event.exit_code, stdout: event.stdout || '', timedOut: false });
+    this.dispatch();
+  }
+
+  onExit(worker, code, message) {
+    this.retire(worker);
+    if (worker.current) {
+      if (message) worker.current.stderr += message;
+      this.settle(worker, { exitCode: code === null ? -1 : code, stdout: '', timedOut: false });
+    }
+    this.dispatch();
+  }
+
+  settle(worker, outcome) {
+    const current = worker.current;
+    if (!current || current.settled) return;
+    current.settled = true;
+    clearTimeout(current.timer);
+    worker.current = null;
+    current.resolve({ ...outcome, stderr: current.stderr, pid: worker.child.pid });
+  }
+
+  retire(worker) {
+    worker.dead = true;
+    this.workers = this.workers.filter((w) => w !== worker);
+  }
+}
+
+module.exports = { PipelineWorkerPool };
@@ -7,6 +7,7 @@ const cors = require('cors');
 const { spawn } = require('child_process');
 const audit = require('./audit');
 const db = require('./db');
+const { PipelineWorkerPool } = require('./pipelineWorker');
 require('dotenv').config();
 
 const app = express();
@@ -52,6 +53,16 @@ const LOG_PATH = path.resolve(
 const PYTHON_PATH = process.env.PYTHON_PATH || (IS_WINDOWS ? 'python' : 'python3');
 const PIPELINE_RUNNER_PATH = process.env.PIPELINE_RUNNER_PATH || path.resolve(__dirname, '../pipelines/pipeline_runner.py');
 const PYTHON_TIMEOUT_MS = parseInt(process.env.PYTHON_TIMEOUT_MS || '30000', 10);
+const PIPELINE_DAEMON = ['1', 'true', 'yes', 'on'].includes(
+  String(process.env.IDMS_PIPELINE_DAEMON || '0').trim().toLowerCase()
+);
+const PIPELINE_WORKERS = parseInt(process.env.IDMS_PIPELINE_WORKERS || '1', 10);
+const SEARCH_SERVICE = ['1', 'true', 'yes', 'on'].includes(
+  String(process.env.IDMS_SEARCH_SERVICE || '0').trim().toLowerCase()
+);
+const SEARCH_SERVICE_PATH = process.env.SEARCH_SERVICE_PATH || path.resolve(__dirname, '../pipelines/search_service.py');
+const SEARCH_WORKERS = parseInt(process.env.IDMS_SEARCH_WORKERS || '1', 10);
+const SEARCH_TIMEOUT_MS = parseInt(process.env.IDMS_SEARCH_TIMEOUT_MS || '5000', 10);
 const MAX_FILE_SIZE_MB = parseInt(process.env.MAX_FILE_SIZE_MB || '50', 10);
 const FILE_REGEX = new RegExp(process.env.ALLOWED_FILE_REGEX || '^[a-zA-Z0-9_\\-\\.]+\\.pdf$');
 
@@ -103,6 +114,31 @@ try {
   process.exit(1);
 }
 
+const pipelineWorkers = PIPELINE_DAEMON
+  ? new PipelineWorkerPool({
+      pythonPath: PYTHON_PATH,
+      runnerPath: PIPELINE_RUNNER_PATH,
+      cwd: BASE_IDMS,
+      env: { ...process.env, NODE_ENV: 'production' },
+      size: PIPELINE_WORKERS,
+    })
+  : null;
+// Hybrid search runs in long-lived search_service.py workers (same JSON-lines protocol) so its
+// result cache persists between requests.
+const searchWorkers = SEARCH_SERVICE
+  ? new PipelineWorkerPool({
+      pythonPath: PYTHON_PATH,
+      runnerPath: SEARCH_SERVICE_PATH,
+      cwd: BASE_IDMS,
+      env: { ...process.env, NODE_ENV: 'production' },
+      size: SEARCH_WORKERS,
+    })
+  : null;
+process.on('exit', () => {
+  if (pipelineWorkers) pipelineWorkers.close();
+  if (searchWorkers) searchWorkers.close();
+});
+
 function checkRateLimit(ip) {
   const now = Date.now();
   let entry = ipRequests.get(ip);
@@ -337,6 +373,35 @@ app.post('/api/rag/search', async (req, res) => {
   const requestedTopK = parseInt(req.body?.topK || process.env.IDMS_RAG_DEFAULT_TOP_K || '5', 10);
   const topK = Number.isFinite(requestedTopK) ? Math.max(1, Math.min(requestedTopK, 50)) : 5;
 
+  if (searchWorkers) {
+    const outcome = await searchWorkers.submit(
+      {
+        execution_id: uuidv4(),
+        query: q,
+        top_k: topK,
+        category: req.body?.category || null,
+        entity: req.body?.entity || null,
+      },
+      { timeoutMs: SEARCH_TIMEOUT_MS }
+    );
+    if (outcome.exitCode === 0) {
+      try {
+        const result = JSON.parse(outcome.stdout);
+        return res.json({
+          query: q,
+          topK,
+          count: result.count,
+          rows: result.rows,
+          source: 'hybrid',
+          cached: result.cached,
+          warnings: result.warnings,
+        });
+      } catch {
+        // Fall through to the SQL path below.
+      }
+    }
+  }
+
   try {
     let rows = [];
 
@@ -481,6 +546,76 @@ const handleExecutionRequest = async (req, res, sourceDir) => {
     const workingPath = path.join(WORKING_PATH, filename);
     fs.renameSync(stagingPath, workingPath);
 
+    if (pipelineWorkers) {
+      pipelineWorkers
+        .submit(
+          { execution_id, file: workingPath },
+          {
+            timeoutMs: PYTHON_TIMEOUT_MS,
+            onDispatch: (pid) =>
+              audit.appendEntry(LOG_PATH, {
+                execution_id,
+                status: 'EXECUTING',
+                mode: EXECUTION_MODE,
+                timestamp: new Date().toISOString(),
+                file: absPath,
+                file_hash_before: hash,
+                pid,
+              }),
+          }
+        )
+        .then(({ exitCode, stdout, stderr, timedOut }) => {
+          if (timedOut) {
+            handleTerminalOutcome(
+              execution_id,
+              'TIMEOUT',
+              'TIMEOUT',
+              'TIMEOUT',
+              -1,
+              PYTHON_TIMEOUT_MS,
+              ['Timeout'],
+              stdout,
+              stderr,
+              absPath,
+              absPath,
+              hash
+            );
+          } else if (exitCode === 0) {
+            handleTerminalOutcome(
+              execution_id,
+              'COMPLETED_SUCCESS',
+              'SUCCESS',
+              'NONE',
+              0,
+              Date.now() - startTime,
+              [],
+              stdout,
+              stderr,
+              absPath,
+              absPath,
+              hash
+            );
+          } else {
+            handleTerminalOutcome(
+              execution_id,
+              'COMPLETED_FAILURE',
+              'FAILURE',
+              'RUNTIME_ERROR',
+              exitCode,
+              Date.now() - startTime,
+              [`Exit ${exitCode}`],
+              stdout,
+              stderr,
+              absPath,
+              absPath,
+              hash
+            );
+          }
+        });
+
+      return res.status(202).json({ message: 'Authorized', execution_id, audit_entry: startEntry });
+    }
+
     const child = spawn(PYTHON_PATH, [PIPELINE_RUNNER_PATH, '--file', workingPath], {
       shell: false,
       cwd: BASE_IDMS,
@@ -0,0 +1,986 @@
+import os
+import sys
+import json
+import time
+import argparse
+import random
+import re
+import statistics
+
+
+def timed(fn, *args, **kwargs):
+    """Returns (result, elapsed_ms) for a single call."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return {"runs": 0}
+    return {
+        "runs": len(samples_ms),
+        "first_ms": round(samples_ms[0], 2),
+        "mean_ms": round(statistics.mean(samples_ms), 2),
+        "median_ms": round(statistics.median(samples_ms), 2),
+        "min_ms": round(min(samples_ms), 2),
+        "max_ms": round(max(samples_ms), 2),
+    }
+
+
+def pdf_files(paths):
+    """Expands directories into the PDFs they contain, keeping a stable order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".pdf")))
+        else:
+            files.append(path)
+    return files
+
+
+def bench_runner(args):
+    """Compares in-process and subprocess stage execution per document (dry-run, no side effects)."""
+    import pipeline_runner
+
+    report = []
+    for file_path in pdf_files(args.files):
+        entry = {"file": file_path}
+        for mode in pipeline_runner.STAGE_MODES:
+            samples = []
+            status = None
+            for _ in range(args.repeat):
+                result, elapsed = timed(pipeline_runner.process_file, file_path, dry_run=True, stage_mode=mode)
+                status = result.get("status")
+                samples.append(elapsed)
+            entry[mode] = {"status": status, **summarize(samples)}
+
+        inproc = entry["inprocess"].get("median_ms")
+        subproc = entry["subprocess"].get("median_ms")
+        if inproc and subproc:
+            entry["speedup"] = round(subproc / inproc, 2)
+        report.append(entry)
+    return report
+
+
+def bench_batch(args):
+    """Wall-clock time of a dry-run inbox batch for each worker count."""
+    import pipeline_runner
+
+    files = pdf_files(args.files)
+    report = []
+    for workers in args.workers:
+        results, elapsed = timed(pipeline_runner.process_batch, files, workers=workers, dry_run=True)
+        report.append({
+            "workers": workers,
+            "files": len(files),
+            "wall_ms": round(elapsed, 2),
+            "docs_per_sec": round(len(files) / (elapsed / 1000.0), 2) if elapsed else None,
+            "failed": sum(1 for r in results if r.get("status") in {"aborted", "error"}),
+        })
+    return report
+
+
+def bench_ocr(args):
+    """Uncached extraction time and OCR pages/sec per OCR engine and worker count."""
+    import extractor
+
+    report = []
+    for file_path in pdf_files(args.files):
+        entry = {"file": file_path, "runs": []}
+        for engine in args.engines:
+            for workers in args.workers:
+                extractor.OCR_ENGINE = engine
+                extractor.OCR_WORKERS = workers
+                result, elapsed = timed(extractor.extract_content, file_path, use_cache=False)
+                ocr_pages = len(result.get("ocr_page_timings_ms", []))
+                entry["runs"].append({
+                    "engine": extractor.resolve_ocr_engine(engine),
+                    "ocr_workers": workers,
+                    "status": result.get("status"),
+                    "extraction_method": result.get("extraction_method"),
+                    "pages": result.get("pages_processed", 0),
+                    "ocr_pages": ocr_pages,
+                    "wall_ms": round(elapsed, 2),
+                    "ocr_pages_per_sec": round(ocr_pages / (elapsed / 1000.0), 2) if elapsed else None,
+                    "ocr_page_timings_ms": result.get("ocr_page_timings_ms", []),
+                })
+        report.append(entry)
+    return report
+
+
+def bench_backends(args):
+    """Text-layer pages/sec per extraction backend over a sample corpus."""
+    import extractor
+
+    files = pdf_files(args.files)
+    report = []
+    for backend in args.backends:
+        pages = 0
+        chars = 0
+        errors = []
+        elapsed_total = 0.0
+        for file_path in files:
+            for _ in range(args.repeat):
+                try:
+                    page_texts, elapsed = timed(extractor.text_layer_pages, file_path, backend)
+                except Exception as exc:
+                    errors.append({"file": file_path, "message": str(exc)})
+                    break
+                elapsed_total += elapsed
+                pages += len(page_texts)
+                chars += sum(len(t) for t in page_texts)
+        report.append({
+            "backend": backend,
+            "files": len(files),
+            "pages": pages,
+            "chars": chars,
+            "total_ms": round(elapsed_total, 2),
+            "pages_per_sec": round(pages / (elapsed_total / 1000.0), 2) if elapsed_total else None,
+            "errors": errors,
+        })
+    return report
+
+
+def reference_categorize(content, rules):
+    """The original per-pattern re.search categorizer, kept as the benchmark baseline."""
+    header_text = content[:int(len(content) * 0.2)]
+    detected_entity, entity_conf = "Unknown", 0.0
+    for text, conf in ((header_text, 0.98), (content, 0.70)):
+        for entity_name, patterns in rules["entities"].items():
+            if any(re.search(p, text, re.IGNORECASE) for p in patterns):
+                detected_entity, entity_conf = entity_name, conf
+                break
+        if detected_entity != "Unknown":
+            break
+
+    detected_type, type_conf = "Document", 0.1
+    for doc_type, patterns in rules["signals"].items():
+        matches = sum(1 for p in patterns if re.search(p, content, re.IGNORECASE))
+        if matches > 0 and 0.4 + (min(matches, 3) * 0.15) > type_conf:
+            detected_type, type_conf = doc_type, 0.4 + (min(matches, 3) * 0.15)
+
+    final_confidence = (entity_conf + type_conf) / 2
+    if detected_type == "Invoice":
+        if not any(re.search(s, content, re.IGNORECASE) for s in rules["invoice_signals"]):
+            final_confidence *= 0.5
+            detected_type = "Unclassified"
+
+    return {
+        "entity": detected_entity,
+        "doc_type": detected_type,
+        "confidence": round(final_confidence, 2),
+        "signals_detected": [
+            s for s in sum(rules["signals"].values(), []) if re.search(s, content, re.IGNORECASE)
+        ],
+    }
+
+
+def synthetic_text(size_chars, rules, seed=0):
+    """Filler prose with rule phrases sprinkled in, roughly size_chars long."""
+    rng = random.Random(seed)
+    filler = "the of and statement account balance payment reference customer period total page".split()
+    phrases = [p for plist in rules["entities"].values() for p in plist]
+    phrases += [p for plist in rules["signals"].values() for p in plist]
+    words = []
+    length = 0
+    while length < size_chars:
+        word = rng.choice(phrases) if rng.random() < 0.002 else rng.choice(filler)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def bench_categorizer(args):
+    """Compiled single-pass categorizer vs the per-pattern baseline on large texts."""
+    import categorizer
+
+    rules = categorizer.load_rules()["rules"]
+    report = []
+    for size_kb in args.sizes_kb:
+        text = synthetic_text(size_kb * 1024, rules, seed=size_kb)
+        fast, fast_ms = timed(categorizer.categorize_document, text)
+        slow, slow_ms = timed(reference_categorize, text, rules)
+        fast_samples = [fast_ms] + [timed(categorizer.categorize_document, text)[1] for _ in range(args.repeat - 1)]
+        slow_samples = [slow_ms] + [timed(reference_categorize, text, rules)[1] for _ in range(args.repeat - 1)]
+        report.append({
+            "size_kb": size_kb,
+            "compiled": summarize(fast_samples),
+            "reference": summarize(slow_samples),
+            "speedup": round(statistics.median(slow_samples) / statistics.median(fast_samples), 2),
+            "identical": all(fast.get(k) == v for k, v in slow.items()),
+        })
+    return report
+
+
+def bench_categorize_batch(args):
+    """Archive re-categorisation: one process per document vs in-process loop vs categorize_many."""
+    import subprocess
+    import categorizer
+
+    rules = categorizer.load_rules()["rules"]
+    texts = [synthetic_text(args.size_kb * 1024, rules, seed=i) for i in range(args.docs)]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorizer.py")
+
+    sample = texts[:args.process_sample]
+    _, process_ms = timed(lambda: [
+        subprocess.run([sys.executable, script, t], capture_output=True, check=False) for t in sample
+    ])
+    categorizer.categorize_many(texts[:1])  # import NumPy and build the scoring matrices outside the timing
+    _, loop_ms = timed(lambda: [categorizer.categorize_document(t) for t in texts])
+    _, many_ms = timed(categorizer.categorize_many, texts)
+
+    per_process_ms = process_ms / len(sample) if sample else 0.0
+    return {
+        "docs": len(texts),
+        "size_kb": args.size_kb,
+        "process_per_doc_ms": round(per_process_ms, 2),
+        "process_projected_ms": round(per_process_ms * len(texts), 2),
+        "inprocess_loop_ms": round(loop_ms, 2),
+        "categorize_many_ms": round(many_ms, 2),
+        "docs_per_sec": round(len(texts) / (many_ms / 1000.0), 2) if many_ms else None,
+    }
+
+
+def bench_centroids(args):
+    """Second-stage centroid lookup latency as the number of filed labels grows."""
+    import tempfile
+    import numpy as np
+    import centroid_classifier
+
+    rng = np.random.default_rng(0)
+    text = synthetic_text(args.size_kb * 1024, {"entities": {}, "signals": {"Filler": ["invoice"]}}, seed=1)
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for labels in args.labels:
+            path = os.path.join(tmp_dir, f"centroids_{labels}.npz")
+            centroid_classifier.write_store({
+                "labels": [centroid_classifier.label_key(f"cat-{i}", f"entity-{i}", "Document") for i in range(labels)],
+                "counts": np.full(labels, 10.0),
+                "sums": rng.standard_normal((labels, centroid_classifier.CENTROID_DIMS)),
+            }, path)
+            _, load_ms = timed(centroid_classifier.load_centroids, path)
+            samples = [timed(centroid_classifier.classify, text, path)[1] for _ in range(args.repeat)]
+            report.append({"labels": labels, "load_ms": round(load_ms, 2), "classify": summarize(samples)})
+    return report
+
+
+def bench_vector_ingest(args):
+    """Per-document ingest cost vs index size: segment append vs whole-index shadow rewrite."""
+    import tempfile
+    import numpy as np
+    import faiss_vectorizer
+
+    rng = np.random.default_rng(0)
+    content = synthetic_text(args.doc_kb * 1024, {"entities": {}, "signals": {"Filler": ["invoice"]}}, seed=2)
+    faiss_vectorizer.AUTO_COMPACT = False
+    report = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, "index")
+            lock_path = os.path.join(tmp_dir, "index.lock")
+            os.makedirs(index_path)
+            main = rng.standard_normal((rows, faiss_vectorizer.VECTOR_DIMS)).astype(np.float32)
+            faiss_vectorizer.write_part(index_path, "main-0", main, ["seed"] * rows, np.zeros(rows))
+            faiss_vectorizer.write_manifest(index_path, {**faiss_vectorizer.read_manifest(index_path), "main": "main-0"})
+
+            append = [
+                timed(faiss_vectorizer.update_vector_index, f"doc-{i}", content, index_path, lock_path)[1]
+                for i in range(args.repeat)
+            ]
+
+            # Baseline: the old placeholder's design, load everything, add, write a shadow, swap.
+            _, vectors = faiss_vectorizer.embed_chunks(content)
+            shadow_path = os.path.join(tmp_dir, "shadow.npy")
+
+            def rewrite():
+                full = np.load(os.path.join(index_path, "main-0.vectors.npy"))
+                np.save(shadow_path + ".tmp.npy", np.vstack([full, vectors]))
+                os.replace(shadow_path + ".tmp.npy", shadow_path)
+
+            shadow = [timed(rewrite)[1] for _ in range(args.repeat)]
+            report.append({
+                "index_rows": rows,
+                "segment_append": summarize(append),
+                "shadow_rewrite": summarize(shadow),
+            })
+    return report
+
+
+def ingest_worker(index_path, lock_path, group_commit, worker, docs, content):
+    import faiss_vectorizer
+
+    faiss_vectorizer.AUTO_COMPACT = False
+    results = [
+        faiss_vectorizer.update_vector_index(f"w{worker}-{i}", content, index_path, lock_path, group_commit)
+        for i in range(docs)
+    ]
+    return [r.get("status") for r in results], [r.get("group_size", 0) for r in results if r.get("commit") == "self"]
+
+
+def bench_vector_throughput(args):
+    """Parallel ingest throughput into one local vector index, per-document publish vs group commit."""
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    content = synthetic_text(args.doc_kb * 1024, {"entities": {}, "signals": {"Filler": ["invoice"]}}, seed=3)
+    report = []
+    for workers in args.workers:
+        for group_commit in (False, True):
+            with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+                index_path = os.path.join(tmp_dir, "index")
+                lock_path = os.path.join(tmp_dir, "index.lock")
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    start = time.perf_counter()
+                    futures = [
+                        pool.submit(ingest_worker, index_path, lock_path, group_commit, w, args.docs, content)
+                        for w in range(workers)
+                    ]
+                    outcomes = [f.result() for f in futures]
+                    elapsed = time.perf_counter() - start
+                groups = [g for _, sizes in outcomes for g in sizes]
+                total = workers * args.docs
+                report.append({
+                    "workers": workers,
+                    "mode": "group_commit" if group_commit else "per_document",
+                    "docs": total,
+                    "failed": sum(1 for statuses, _ in outcomes for st in statuses if st != "success"),
+                    "wall_ms": round(elapsed * 1000.0, 2),
+                    "docs_per_sec": round(total / elapsed, 2),
+                    "manifest_commits": len(groups),
+                    "mean_group_size": round(statistics.mean(groups), 2) if groups else None,
+                })
+    return report
+
+
+def bench_embedding(args):
+    """Chunks/sec of per-chunk pseudo_embedding vs batched embed_batch (cold and warm token cache)."""
+    import numpy as np
+    import qdrant_vectorizer
+
+    report = []
+    for chunks in args.chunks:
+        text = synthetic_text(chunks * 900, {"entities": {}, "signals": {"Filler": ["invoice"]}}, seed=chunks)
+        texts = qdrant_vectorizer.chunk_text(text)[:chunks]
+
+        reference, loop_ms = timed(lambda: [qdrant_vectorizer.pseudo_embedding(t) for t in texts])
+        qdrant_vectorizer._TOKEN_CACHE.clear()
+        batch, cold_ms = timed(qdrant_vectorizer.embed_batch, texts, dtype=np.float64)
+        warm = [timed(qdrant_vectorizer.embed_batch, texts)[1] for _ in range(args.repeat)]
+
+        report.append({
+            "chunks": len(texts),
+            "loop_ms": round(loop_ms, 2),
+            "batch_cold_ms": round(cold_ms, 2),
+            "batch_warm": summarize(warm),
+            "speedup_cold": round(loop_ms / cold_ms, 2) if cold_ms else None,
+            "speedup_warm": round(loop_ms / statistics.median(warm), 2),
+            "chunks_per_sec_warm": round(len(texts) / (statistics.median(warm) / 1000.0), 2),
+            "identical": all(row.tolist() == ref for row, ref in zip(batch, reference)),
+        })
+    return report
+
+
+def start_qdrant_standin(latency_ms=0.0, apply_ms=0.0):
+    """
+    Minimal local stand-in for the Qdrant REST endpoints the vectorizer uses. Every request costs
+    latency_ms; a wait=true upsert additionally costs apply_ms. Returns (server, base_url, state).
+    """
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    state = {"collections": set(), "points": {}, "requests": 0, "connections": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out as separate writes; without this, Nagle + delayed ACK stall keep-alive.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with lock:
+                state["connections"] += 1
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def route(self, method):
+            with lock:
+                state["requests"] += 1
+            time.sleep(latency_ms / 1000.0)
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "collections":
+                if method == "GET":
+                    found = parts[1] in state["collections"]
+                    return self.reply(200 if found else 404, {"result": {"status": "green"} if found else None})
+                self.body()
+                state["collections"].add(parts[1])
+                return self.reply(200, {"result": True})
+            if len(parts) == 3 and parts[2] == "points" and method == "PUT":
+                points = self.body().get("points", [])
+                wait = parse_qs(url.query).get("wait", ["false"])[0] == "true"
+                if wait:
+                    time.sleep(apply_ms / 1000.0)
+                with lock:
+                    for point in points:
+                        state["points"][point["id"]] = point["payload"]
+                status = "completed" if wait else "acknowledged"
+                return self.reply(200, {"result": {"operation_id": state["requests"], "status": status}})
+            return self.reply(404, {"status": {"error": "not found"}})
+
+        def do_GET(self):
+            self.route("GET")
+
+        def do_PUT(self):
+            self.route("PUT")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+def legacy_qdrant_index(base_url, collection, doc, qdrant_vectorizer):
+    """The previous per-document path: fresh connections, collection GET, one wait=true upsert."""
+    import requests
+
+    points = qdrant_vectorizer.document_points(doc["doc_id"], doc["content"], doc["metadata"])
+    headers = qdrant_vectorizer.qdrant_headers()
+    r = requests.get(f"{base_url}/collections/{collection}", timeout=10, headers=headers)
+    if r.status_code != 200:
+        payload = {"vectors": {"size": 384, "distance": "Cosine"}}
+        requests.put(f"{base_url}/collections/{collection}", json=payload, timeout=15, headers=headers).raise_for_status()
+    url = f"{base_url}/collections/{collection}/points?wait=true"
+    requests.put(url, json={"points": points}, timeout=30, headers=headers).raise_for_status()
+    return len(points)
+
+
+def bench_qdrant(args):
+    """Bulk re-index points/sec against a local Qdrant stand-in: legacy vs pooled/batched client."""
+    import qdrant_vectorizer
+
+    docs = [
+        {"doc_id": f"doc-{i}", "content": synthetic_text(args.doc_kb * 1024, {"entities": {}, "signals": {"Filler": ["invoice"]}}, seed=i),
+         "metadata": {"category": "bench", "entity": "Bench", "status": "processed"}}
+        for i in range(args.docs)
+    ]
+    # Embedding cost is the same for every mode; keep it out of the comparison.
+    qdrant_vectorizer.embed_batch([d["content"] for d in docs])
+
+    report = []
+    modes = [
+        ("legacy_per_document", None, None),
+        ("client_per_document", True, False),
+        ("client_batched_wait", True, True),
+        ("client_batched_nowait_confirm", False, True),
+    ]
+    for mode, wait, batched in modes:
+        server, base_url, state = start_qdrant_standin(args.latency_ms, args.apply_ms)
+        try:
+            start = time.perf_counter()
+            if wait is None:
+                points = sum(legacy_qdrant_index(base_url, "bench", d, qdrant_vectorizer) for d in docs)
+            else:
+                client = qdrant_vectorizer.QdrantClient(base_url, "bench", batch_points=args.batch_points, wait=wait)
+                if batched:
+                    points = qdrant_vectorizer.index_documents(docs, client)["points"]
+                else:
+                    points = sum(qdrant_vectorizer.index_document(d["doc_id"], d["content"], d["metadata"], client)["chunks_indexed"] for d in docs)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+        report.append({
+            "mode": mode,
+            "documents": len(docs),
+            "points": points,
+            "stored_points": len(state["points"]),
+            "requests": state["requests"],
+            "connections": state["connections"],
+            "elapsed_ms": round(elapsed * 1000.0, 2),
+            "points_per_sec": round(points / elapsed, 2) if elapsed else None,
+        })
+    return report
+
+
+def bench_embedding_cache(args):
+    """
+    Ingest and re-ingest a boilerplate-heavy corpus through the embedding cache. --model-ms adds a
+    per-chunk delay to stand in for a transformer, where cache hits matter most.
+    """
+    import tempfile
+    import embedding_cache
+    import qdrant_vectorizer
+
+    rng = random.Random(0)
+    vocab = {"entities": {}, "signals": {"Filler": ["invoice"]}}
+    boilerplate = [synthetic_text(1000, vocab, seed=10_000 + i) for i in range(args.templates)]
+    documents = []
+    for i in range(args.docs):
+        chunks = [synthetic_text(1000, vocab, seed=i * 100 + c) for c in range(args.chunks_per_doc)]
+        chunks = [rng.choice(boilerplate) if rng.random() < args.boilerplate else c for c in chunks]
+        documents.append(chunks)
+
+    def model(batch):
+        if args.model_ms:
+            time.sleep(args.model_ms * len(batch) / 1000.0)
+        return qdrant_vectorizer.embed_batch(batch)
+
+    report = {"documents": args.docs, "chunks": args.docs * args.chunks_per_doc, "boilerplate_share": args.boilerplate}
+    _, report["uncached_ms"] = timed(lambda: [model(chunks) for chunks in documents])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "embeddings.sqlite3")
+        for run in ("first_ingest", "reingest"):
+            before = dict(embedding_cache.STATS)
+            _, elapsed = timed(lambda: [embedding_cache.embed(chunks, "bench", model, cache_path) for chunks in documents])
+            hits = embedding_cache.STATS["hits"] - before["hits"]
+            misses = embedding_cache.STATS["misses"] - before["misses"]
+            report[run] = {"ms": round(elapsed, 2), "hit_rate": round(hits / max(1, hits + misses), 4)}
+    report["uncached_ms"] = round(report["uncached_ms"], 2)
+    return report
+
+
+def scratch_dsn(schema):
+    """The configured Postgres DSN with search_path pointed at a scratch schema (extensions stay in public)."""
+    from urllib.parse import quote
+    import postgres_logger
+
+    dsn = postgres_logger.get_dsn()
+    return dsn + ("&" if "?" in dsn else "?") + "options=" + quote(f"-csearch_path={schema},public")
+
+
+def create_scratch_schema(schema):
+    """Recreates `schema` with the production tables from sql/001_init.sql; returns its DSN."""
+    import psycopg2
+
+    dsn = scratch_dsn(schema)
+    sql_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "sql", "001_init.sql")
+    with open(sql_path, "r", encoding="utf-8") as handle:
+        init_sql = handle.read()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(init_sql)
+    finally:
+        conn.close()
+    return dsn
+
+
+def drop_scratch_schema(schema):
+    import psycopg2
+
+    conn = psycopg2.connect(scratch_dsn(schema))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    finally:
+        conn.close()
+
+
+def bench_pg_latency(args):
+    """
+    Per-document log_to_postgres latency with a fresh connection per document vs the pooled
+    connection manager, sequentially and from concurrent threads, in a scratch schema.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import postgres_logger
+
+    dsn = create_scratch_schema(args.schema)
+    rules = {"entities": {}, "signals": {"Filler": ["invoice"]}}
+    content = "Invoice number: INV-1\nInvoice date: 01/02/2026\nTotal: GBP 120.00\nVAT: GBP 20.00\n"
+    content += synthetic_text(args.doc_kb * 1024, rules)
+
+    def log(mode, n, tag=""):
+        metadata = {"doc_id": f"{mode}{tag}-{n}", "doc_type": "invoice", "entity": "Bench", "category": "bench", "status": "processed"}
+        return timed(postgres_logger.log_to_postgres, metadata, content, dsn=dsn, pooled=mode == "pooled")[1]
+
+    report = []
+    try:
+        for mode in ("connect_per_document", "pooled"):
+            sequential = [log(mode, n) for n in range(args.docs)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                concurrent = list(pool.map(lambda n: log(mode, n, "-threaded"), range(args.docs)))
+            elapsed = time.perf_counter() - start
+            ordered = sorted(sequential)
+            report.append({
+                "mode": mode,
+                "sequential": {**summarize(sequential), "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 2)},
+                "threads": args.threads,
+                "concurrent_median_ms": round(statistics.median(concurrent), 2),
+                "concurrent_docs_per_sec": round(args.docs / elapsed, 2),
+            })
+        report.append({"pool": postgres_logger.get_pool(dsn).stats})
+    finally:
+        postgres_logger.close_pools()
+        if not args.keep:
+            drop_scratch_schema(args.schema)
+    return report
+
+
+def bench_pg_bulk(args):
+    """
+    Archive import throughput in a scratch schema: pooled per-document log_to_postgres vs
+    log_many_to_postgres at each batch size, in documents per minute.
+    """
+    import postgres_logger
+
+    dsn = create_scratch_schema(args.schema)
+    rules = {"entities": {}, "signals": {"Filler": ["invoice"]}}
+    content = "Invoice number: INV-1\nInvoice date: 01/02/2026\nBill To: Bench Ltd\nTotal: GBP 120.00\nVAT: GBP 20.00\n"
+    content += synthetic_text(args.doc_kb * 1024, rules)
+
+    def records(tag):
+        for n in range(args.docs):
+            metadata = {"doc_id": f"{tag}-{n}", "doc_type": "invoice", "entity": "Bench", "category": "bench", "status": "processed"}
+            yield metadata, content
+
+    report = []
+    try:
+        start = time.perf_counter()
+        for metadata, text in records("per_document"):
+            postgres_logger.log_to_postgres(metadata, text, dsn=dsn, pooled=True)
+        elapsed = time.perf_counter() - start
+        report.append({"mode": "per_document", "docs": args.docs, "docs_per_min": round(args.docs / elapsed * 60.0, 1)})
+
+        for batch_docs in args.batch_docs:
+            result = postgres_logger.log_many_to_postgres(records(f"bulk{batch_docs}"), batch_docs=batch_docs, dsn=dsn, pooled=True)
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
+            report.append({
+                "mode": "bulk",
+                "batch_docs": batch_docs,
+                "docs": result["documents"],
+                "batches": result["batches"],
+                "docs_per_min": result["docs_per_min"],
+            })
+    finally:
+        postgres_logger.close_pools()
+        if not args.keep:
+            drop_scratch_schema(args.schema)
+    return report
+
+
+def synthetic_words(count, seed=0):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(count)]
+
+
+def seed_search_corpus(conn, args):
+    """Scratch documents/document_chunks tables with the production indexes, filled with synthetic chunks."""
+    from psycopg2.extras import execute_values
+    import qdrant_vectorizer
+    import postgres_logger
+
+    rng = random.Random(1)
+    words = synthetic_words(args.vocabulary)
+    # Zipf-like word frequencies, so chunks share common words and differ in rare ones.
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    docs = max(1, args.chunks // args.chunks_per_doc)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {args.schema}")
+        cur.execute("CREATE TABLE documents (doc_id TEXT PRIMARY KEY, category TEXT, entity TEXT, storage_path TEXT)")
+        cur.execute(
+            """
+            CREATE TABLE document_chunks (
+                id BIGSERIAL PRIMARY KEY,
+                doc_id TEXT NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                chunk_text TEXT NOT NULL,
+                embedding VECTOR(384),
+                metadata JSONB DEFAULT '{}'::jsonb,
+                UNIQUE (doc_id, chunk_index)
+            )
+            """
+        )
+        execute_values(
+            cur,
+            "INSERT INTO documents (doc_id, category, entity, storage_path) VALUES %s",
+            [(f"doc-{d}", f"category-{d % 8}", f"Entity {d % 50}", f"06-long-term-memory/doc-{d}.pdf") for d in range(docs)],
+            page_size=1000,
+        )
+        for start in range(0, docs, 1000):
+            batch = []
+            for d in range(start, min(start + 1000, docs)):
+                for c in range(args.chunks_per_doc):
+                    batch.append((f"doc-{d}", c, " ".join(rng.choices(words, weights, k=args.chunk_words))))
+            vectors = qdrant_vectorizer.embed_batch([text for _, _, text in batch])
+            execute_values(
+                cur,
+                "INSERT INTO document_chunks (doc_id, chunk_index, chunk_text, embedding) VALUES %s",
+                [(doc_id, c, text, postgres_logger.vector_literal(v)) for (doc_id, c, text), v in zip(batch, vectors)],
+                template="(%s, %s, %s, %s::vector)",
+                page_size=1000,
+            )
+        cur.execute("CREATE INDEX ON document_chunks USING GIN (chunk_text gin_trgm_ops)")
+        cur.execute("CREATE INDEX ON document_chunks USING hnsw (embedding vector_cosine_ops)")
+        cur.execute("ANALYZE")
+
+
+def bench_search(args):
+    """
+    Hybrid search latency on a synthetic chunk corpus in a scratch schema of the configured
+    Postgres (pgvector + pg_trgm required): legacy similarity() scan vs each query alone vs
+    the fused search, cold and cached.
+    """
+    import psycopg2
+    import search_service
+
+    dsn = scratch_dsn(args.schema)
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        if not args.reuse:
+            _, seed_ms = timed(seed_search_corpus, conn, args)
+        else:
+            seed_ms = 0.0
+        with conn.cursor() as cur:
+            cur.execute("SELECT doc_id, chunk_index, chunk_text FROM document_chunks ORDER BY random() LIMIT %s", (args.queries,))
+            samples = cur.fetchall()
+
+        rng = random.Random(2)
+        queries = []
+        for doc_id, chunk_index, text in samples:
+            words = text.split()
+            start = rng.randrange(max(1, len(words) - args.query_words))
+            queries.append(((doc_id, chunk_index), " ".join(words[start:start + args.query_words])))
+
+        def legacy(query):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT c.doc_id, c.chunk_index, similarity(c.chunk_text, %s) AS score
+                    FROM document_chunks c
+                    ORDER BY score DESC
+                    LIMIT %s
+                    """,
+                    (query, args.top_k),
+                )
+                return [{"doc_id": d, "chunk_index": c} for d, c, _ in cur.fetchall()]
+
+        def run(label, fn, subset):
+            latencies = []
+            found = 0
+            for source, query in subset:
+                rows, elapsed = timed(fn, query)
+                latencies.append(elapsed)
+                found += any((r["doc_id"], r["chunk_index"]) == source for r in rows[:args.top_k])
+            ordered = sorted(latencies)
+            return {
+                "mode": label,
+                **summarize(latencies),
+                "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 2),
+                "source_chunk_in_top_k": round(found / len(subset), 4),
+            }
+
+        limit = max(args.top_k * search_service.CANDIDATE_FACTOR, search_service.MIN_CANDIDATES)
+        filters = {"category": None, "entity": None}
+
+        def embed(query):
+            return search_service.embed_batch([query], dims=search_service.SEARCH_DIMS)[0]
+
+        def hybrid(use_cache):
+            return lambda query: search_service.search(query, args.top_k, use_cache=use_cache, dsn=dsn)["rows"]
+
+        report = [
+            run("legacy_similarity_scan", legacy, queries[:args.legacy_queries]),
+            run("vector_only", lambda q: search_service.pgvector_candidates(q, embed(q), limit, filters, dsn), queries),
+            run("trigram_only", lambda q: search_service.trigram_candidates(q, None, limit, filters, dsn), queries),
+            run("hybrid_cold", hybrid(False), queries),
+        ]
+        for _, query in queries:
+            hybrid(True)(query)
+        report.append(run("hybrid_cached", hybrid(True), queries))
+        return {"chunks": args.chunks, "seed_ms": round(seed_ms, 2), "schema": args.schema, "results": report}
+    finally:
+        if args.drop:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        conn.close()
+
+
+def synthetic_rule_pack(base_rules, vendors, seed=0):
+    """The shipped pack plus `vendors` generated entities with three aliases each."""
+    rng = random.Random(seed)
+    rules = json.loads(json.dumps(base_rules))
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for i in range(vendors):
+        stem = "".join(rng.choice(letters) for _ in range(8))
+        name = f"{stem.title()} Holdings {i}"
+        rules["entities"][name] = [name, f"{stem} ltd {i}", f"{stem}-{i}"]
+    return rules
+
+
+def bench_rules(args):
+    """Rule-pack compile and match cost as the vendor list grows."""
+    import tempfile
+    import categorizer
+
+    base = categorizer.load_rules()["rules"]
+    text = synthetic_text(args.size_kb * 1024, base, seed=args.size_kb)
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for vendors in args.vendors:
+            pack_path = os.path.join(tmp_dir, f"rules_{vendors}.json")
+            with open(pack_path, "w", encoding="utf-8") as handle:
+                json.dump(synthetic_rule_pack(base, vendors, seed=vendors), handle)
+
+            categorizer.RULE_PACK_PATH = pack_path
+            snapshot = categorizer.load_rules()
+            match_samples = []
+            call_samples = []
+            for _ in range(args.repeat):
+                result, elapsed = timed(categorizer.categorize_document, text)
+                call_samples.append(elapsed)
+                match_samples.append(result.get("match_ms", 0.0))
+            report.append({
+                "vendors": vendors,
+                "rule_count": snapshot["rule_count"],
+                "compile_ms": snapshot["compile_ms"],
+                "match": summarize(match_samples),
+                "call": summarize(call_samples),
+                "recompiled_per_call": categorizer.load_rules() is not snapshot,
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IDMS pipeline micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    runner = sub.add_parser("runner", help="In-process vs subprocess stage execution per document")
+    runner.add_argument("files", nargs="+", help="PDF files or directories of PDFs")
+    runner.add_argument("--repeat", type=int, default=3)
+    runner.set_defaults(func=bench_runner)
+
+    batch = sub.add_parser("batch", help="Inbox batch wall-clock time per worker count")
+    batch.add_argument("files", nargs="+", help="PDF files or directories of PDFs")
+    batch.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    batch.set_defaults(func=bench_batch)
+
+    ocr = sub.add_parser("ocr", help="Uncached extraction throughput per OCR engine and worker count")
+    ocr.add_argument("files", nargs="+", help="PDF files or directories of PDFs")
+    ocr.add_argument("--engines", nargs="+", default=["pytesseract", "tesserocr"])
+    ocr.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    ocr.set_defaults(func=bench_ocr)
+
+    backends = sub.add_parser("backends", help="Text-layer pages/sec per extraction backend")
+    backends.add_argument("files", nargs="+", help="PDF files or directories of PDFs")
+    backends.add_argument("--backends", nargs="+", default=["pdfplumber", "pdfminer", "pypdf"])
+    backends.add_argument("--repeat", type=int, default=1)
+    backends.set_defaults(func=bench_backends)
+
+    cat = sub.add_parser("categorizer", help="Compiled rule matcher vs per-pattern baseline")
+    cat.add_argument("--sizes-kb", type=int, nargs="+", default=[4, 64, 512, 2048])
+    cat.add_argument("--repeat", type=int, default=5)
+    cat.set_defaults(func=bench_categorizer)
+
+    many = sub.add_parser("categorize-batch", help="Bulk categorize_many vs per-document launches")
+    many.add_argument("--docs", type=int, default=2000)
+    many.add_argument("--size-kb", type=int, default=8)
+    many.add_argument("--process-sample", type=int, default=20, help="Documents timed via subprocess launches")
+    many.set_defaults(func=bench_categorize_batch)
+
+    cent = sub.add_parser("centroids", help="Centroid classifier lookup latency vs label count")
+    cent.add_argument("--labels", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    cent.add_argument("--size-kb", type=int, default=8)
+    cent.add_argument("--repeat", type=int, default=20)
+    cent.set_defaults(func=bench_centroids)
+
+    vec = sub.add_parser("vector-ingest", help="Local vector index ingest cost vs index size")
+    vec.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 500000])
+    vec.add_argument("--doc-kb", type=int, default=8)
+    vec.add_argument("--repeat", type=int, default=10)
+    vec.set_defaults(func=bench_vector_ingest)
+
+    vtp = sub.add_parser("vector-throughput", help="Parallel ingest throughput, per-document vs group commit")
+    vtp.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    vtp.add_argument("--docs", type=int, default=50, help="Documents per worker")
+    vtp.add_argument("--doc-kb", type=int, default=4)
+    vtp.add_argument("--dir", default=None, help="Directory for the scratch index (use the real index disk)")
+    vtp.set_defaults(func=bench_vector_throughput)
+
+    emb = sub.add_parser("embedding", help="Per-chunk vs batched pseudo embedding throughput")
+    emb.add_argument("--chunks", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    emb.add_argument("--repeat", type=int, default=5)
+    emb.set_defaults(func=bench_embedding)
+
+    qd = sub.add_parser("qdrant", help="Bulk Qdrant re-index points/sec against a local HTTP stand-in")
+    qd.add_argument("--docs", type=int, default=200)
+    qd.add_argument("--doc-kb", type=int, default=4)
+    qd.add_argument("--batch-points", type=int, default=256)
+    qd.add_argument("--latency-ms", type=float, default=1.0, help="Simulated per-request network latency")
+    qd.add_argument("--apply-ms", type=float, default=5.0, help="Simulated apply time of a wait=true upsert")
+    qd.set_defaults(func=bench_qdrant)
+
+    ecache = sub.add_parser("embedding-cache", help="Ingest/re-ingest with the chunk embedding cache")
+    ecache.add_argument("--docs", type=int, default=300)
+    ecache.add_argument("--chunks-per-doc", type=int, default=8)
+    ecache.add_argument("--templates", type=int, default=20, help="Distinct boilerplate chunks")
+    ecache.add_argument("--boilerplate", type=float, default=0.4, help="Share of chunks that are boilerplate")
+    ecache.add_argument("--model-ms", type=float, default=0.0, help="Simulated per-chunk model cost")
+    ecache.set_defaults(func=bench_embedding_cache)
+
+    srch = sub.add_parser("search", help="Hybrid search latency on a synthetic chunk corpus (needs Postgres + pgvector)")
+    srch.add_argument("--chunks", type=int, default=100_000)
+    srch.add_argument("--chunks-per-doc", type=int, default=10)
+    srch.add_argument("--chunk-words", type=int, default=150)
+    srch.add_argument("--vocabulary", type=int, default=20_000)
+    srch.add_argument("--queries", type=int, default=200)
+    srch.add_argument("--legacy-queries", type=int, default=20, help="The legacy scan is slow; time fewer queries")
+    srch.add_argument("--query-words", type=int, default=3)
+    srch.add_argument("--top-k", type=int, default=5)
+    srch.add_argument("--schema", default="idms_search_bench")
+    srch.add_argument("--reuse", action="store_true", help="Reuse an already seeded schema")
+    srch.add_argument("--drop", action="store_true", help="Drop the scratch schema afterwards")
+    srch.set_defaults(func=bench_search)
+
+    pgl = sub.add_parser("pg-latency", help="Per-document Postgres persistence latency, pooled vs connect-per-document")
+    pgl.add_argument("--docs", type=int, default=200)
+    pgl.add_argument("--doc-kb", type=int, default=4)
+    pgl.add_argument("--threads", type=int, default=8)
+    pgl.add_argument("--schema", default="idms_pg_bench")
+    pgl.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    pgl.set_defaults(func=bench_pg_latency)
+
+    pgb = sub.add_parser("pg-bulk", help="Archive import docs/min, per-document vs batched multi-row upserts")
+    pgb.add_argument("--docs", type=int, default=5000)
+    pgb.add_argument("--doc-kb", type=int, default=4)
+    pgb.add_argument("--batch-docs", type=int, nargs="+", default=[50, 200, 500, 1000])
+    pgb.add_argument("--schema", default="idms_pg_bulk_bench")
+    pgb.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    pgb.set_defaults(func=bench_pg_bulk)
+
+    rules = sub.add_parser("rules", help="Rule-pack compile and match time vs vendor count")
+    rules.add_argument("--vendors", type=int, nargs="+", default=[0, 100, 500, 2000])
+    rules.add_argument("--size-kb", type=int, default=64)
+    rules.add_argument("--repeat", type=int, default=5)
+    rules.set_defaults(func=bench_rules)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,129 @@
+import os
 import sys
 import json
 import re
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RULE_PACK_PATH = os.environ.get("IDMS_RULE_PACK", os.path.join(SCRIPT_DIR, "rules", "categorizer_rules.json"))
+RULE_PACK_KEYS = ("version", "entities", "signals", "invoice_signals", "category_map")
+
+REGEX_METACHARS = set(".^$*+?{}[]\\|()")
+
+
+class RuleMatcher:
+    """
+    Every rule pattern compiled once into a shared matcher.
+    Literal patterns (all of today's rules) are de-duplicated case-insensitively and located in a
+    single lower-cased copy of the text with C-level substring search, so each distinct phrase
+    costs one scan that stops at its first occurrence instead of one IGNORECASE regex pass per
+    rule use. Patterns with regex syntax fall back to a precompiled case-insensitive search.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.literals = {}
+        self.regexes = {}
+        for pattern in self.patterns:
+            if REGEX_METACHARS.isdisjoint(pattern):
+                self.literals.setdefault(pattern.lower(), []).append(pattern)
+            else:
+                self.regexes[pattern] = re.compile(pattern, re.IGNORECASE)
+
+    def find(self, text):
+        """Returns {pattern: (start, end)} for the first occurrence of every pattern in text."""
+        hits = {}
+        if self.literals:
+            lowered = text.lower()
+            for literal, patterns in self.literals.items():
+                pos = lowered.find(literal)
+                if pos != -1:
+                    for pattern in patterns:
+                        hits[pattern] = (pos, pos + len(literal))
+
+        for pattern, regex in self.regexes.items():
+            match = regex.search(text)
+            if match:
+                hits[pattern] = (match.start(), match.end())
+        return hits
+
+    def header_hits(self, text, header_limit, hits):
+        """
+        The patterns of `hits` that also occur within text[:header_limit]. Literal offsets come from
+        the lower-cased text, which is longer than the original once a character lower-cases to
+        several (e.g. 'İ'), so literals are re-checked on the lower-cased header itself.
+        """
+        header = set()
+        header_text = text[:header_limit]
+        lowered = None
+        for pattern, (_, end) in hits.items():
+            regex = self.regexes.get(pattern)
+            if regex is not None:
+                if end <= header_limit or regex.search(header_text):
+                    header.add(pattern)
+                continue
+            if lowered is None:
+                lowered = header_text.lower()
+            if pattern.lower() in lowered:
+                header.add(pattern)
+        return header
+
+
+def compile_rules(rules):
+    patterns = [p for plist in rules["entities"].values() for p in plist]
+    patterns += [p for plist in rules["signals"].values() for p in plist]
+    patterns += rules["invoice_signals"]
+    return RuleMatcher(patterns)
+
+
+_SNAPSHOT = None
+
+
+def read_rule_pack(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        rules = json.load(handle)
+    missing = [k for k in RULE_PACK_KEYS if k not in rules]
+    if missing:
+        raise ValueError(f"Rule pack {path} is missing keys: {missing}")
+    rules.setdefault("header_ratio", 0.2)
+    return rules
+
+
+def load_rules(path=None):
+    """
+    Returns the compiled rule snapshot {rules, matcher, version, rule_count, compile_ms}.
+    The pack is re-read and recompiled only when its mtime or size changes, so a long-running
+    worker picks up new vendors without a restart. If an edited pack fails to load, the last
+    good snapshot keeps serving.
+    """
+    global _SNAPSHOT
+    path = path or RULE_PACK_PATH
+    try:
+        # The pack can be briefly missing while an editor replaces it.
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if _SNAPSHOT is not None and _SNAPSHOT["key"] == key:
+            return _SNAPSHOT
+
+        start = time.perf_counter()
+        rules = read_rule_pack(path)
+        matcher = compile_rules(rules)
+        compile_ms = round((time.perf_counter() - start) * 1000.0, 3)
+    except (OSError, ValueError):
+        if _SNAPSHOT is not None and _SNAPSHOT["key"][0] == path:
+            return _SNAPSHOT
+        raise
+
+    _SNAPSHOT = {
+        "key": key,
+        "rules": rules,
+        "matcher": matcher,
+        "version": str(rules["version"]),
+        "rule_count": len(matcher.patterns),
+        "compile_ms": compile_ms,
+    }
+    return _SNAPSHOT
+
 
 def categorize_document(content):
     """
@@ -11,83 +134,48 @@ def categorize_document(content):
         if not content:
             return {"status": "error", "message": "No content provided."}
 
+        snapshot = load_rules()
+        rules = snapshot["rules"]
+
+        # One matcher call finds every entity and signal hit with its offsets.
+        match_start = time.perf_counter()
+        hits = snapshot["matcher"].find(content)
+        match_ms = round((time.perf_counter() - match_start) * 1000.0, 3)
+
         # 1. Header Weighting (First 20% of text)
-        header_limit = int(len(content) * 0.2)
-        header_text = content[:header_limit]
-        
-        # 2. Entity Detection (Common Entities)
-        entities = {
-            "Toyota Financial Services": [r"Toyota Financial Services", r"Toyota Finance", r"Toyota Financial"],
-            "Amex": [r"American Express", r"Amex", r"Onboarding Docs"],
-            "Nandos": [r"Nandos", r"Nando's"],
-            "National Parking Enforcement Providers": [r"National Parking Enforcement", r"NPE"],
-            "HireRight": [r"HireRight", r"Background check"],
-            "Queens Road Opticians": [r"Queens Road Opticians", r"optician"],
-            "Metropolitan University": [r"Metropolitan University", r"Degree", r"Computing and Statistics"]
-        }
-        
+        header_limit = int(len(content) * rules["header_ratio"])
+        header_hits = snapshot["matcher"].header_hits(content, header_limit, hits)
+
+        def in_header(pattern):
+            return pattern in header_hits
+
+        # 2. Entity Detection
         detected_entity = "Unknown"
         entity_conf = 0.0
-        
+
         # Check header first (higher weight)
-        for entity_name, patterns in entities.items():
-            for pattern in patterns:
-                if re.search(pattern, header_text, re.IGNORECASE):
-                    detected_entity = entity_name
-                    entity_conf = 0.98
-                    break
-            if detected_entity != "Unknown": break
+        for entity_name, patterns in rules["entities"].items():
+            if any(in_header(p) for p in patterns):
+                detected_entity = entity_name
+                entity_conf = 0.98
+                break
 
         # Check full body if not in header
         if detected_entity == "Unknown":
-            for entity_name, patterns in entities.items():
-                for pattern in patterns:
-                    if re.search(pattern, content, re.IGNORECASE):
-                        detected_entity = entity_name
-                        entity_conf = 0.70
-                        break
-                if detected_entity != "Unknown": break
+            for entity_name, patterns in rules["entities"].items():
+                if any(p in hits for p in patterns):
+                    detected_entity = entity_name
+                    entity_conf = 0.70
+                    break
 
         # 3. Signal Detection for Doc Types
-        # High value signals: any single match is a strong indicator
-        high_value_signals = {
-            "FinanceAgreementCompletion": [
-                r"Agreement number", 
-                r"Registration number", 
-                r"Your agreement is complete",
-                r"settlement",
-                r"finance completion",
-                r"completion letter"
-            ],
-            "Invoice": [
-                r"VAT total",
-                r"Invoice number",
-                r"Tax Invoice"
-            ],
-            "Certificate": [
-                r"Degree",
-                r"Certificate",
-                r"Honours",
-                r"Computing and Statistics",
-                r"conferred"
-            ],
-            "MedicalLetter": [
-                r"Optician",
-                r"Eye examination",
-                r"Queens Road"
-            ]
-        }
-        
         detected_type = "Document"
         type_conf = 0.1 # Base confidence for generic document
-        
+
         # Scoring high value signals
-        for doc_type, patterns in high_value_signals.items():
-            matches = 0
-            for pattern in patterns:
-                if re.search(pattern, content, re.IGNORECASE):
-                    matches += 1
-            
+        for doc_type, patterns in rules["signals"].items():
+            matches = sum(1 for p in patterns if p in hits)
+
             if matches > 0:
                 # Even one match is a strong signal
                 # 0.5 for 1 match, up to 0.9 for many
@@ -98,22 +186,16 @@ def categorize_document(content):
 
         # 4. Confidence Penalization & Refinement
         final_confidence = (entity_conf + type_conf) / 2
-        
+
         # Penalize if invoice signals are missing but it's called an Invoice
         if detected_type == "Invoice":
-            invoice_signals = [r"VAT", r"Invoice number", r"Line items"]
-            found = sum(1 for s in invoice_signals if re.search(s, content, re.IGNORECASE))
+            found = sum(1 for s in rules["invoice_signals"] if s in hits)
             if found == 0:
                 final_confidence *= 0.5
                 detected_type = "Unclassified"
 
         # 5. Taxonomy Mapping
-        category_map = {
-            "FinanceAgreementCompletion": "05-financial",
-            "Invoice": "05-financial",
-            "Document": "00-uncategorized"
-        }
-        category = category_map.get(detected_type, "00-uncategorized")
+        category = rules["category_map"].get(detected_type, "00-uncategorized")
 
         return {
             "status": "success",
@@ -123,16 +205,207 @@ def categorize_document(content):
             "confidence": round(final_confidence, 2),
             "entity_confidence": entity_conf,
             "type_confidence": type_conf,
-            "signals_detected": [s for s in sum(high_value_signals.values(), []) if re.search(s, content, re.IGNORECASE)]
+            "signals_detected": [s for s in sum(rules["signals"].values(), []) if s in hits],
+            "rule_pack": {
+                "version": snapshot["version"],
+                "rule_count": snapshot["rule_count"],
+                "compile_ms": snapshot["compile_ms"],
+            },
+            "match_ms": match_ms,
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def scoring_matrices(snapshot):
+    """
+    Pattern-membership matrices for the snapshot, built once per compiled pack.
+    Columns of a document's hit row are matcher patterns; the entity and signal matrices map those
+    columns onto entities and doc types so scoring a batch is a pair of matrix products.
+    """
+    if "scoring" in snapshot:
+        return snapshot["scoring"]
+
+    import numpy as np
+
+    rules = snapshot["rules"]
+    column = {p: i for i, p in enumerate(snapshot["matcher"].patterns)}
+    entity_names = list(rules["entities"])
+    doc_types = list(rules["signals"])
+
+    entities = np.zeros((len(column), len(entity_names)))
+    for j, name in enumerate(entity_names):
+        for p in rules["entities"][name]:
+            entities[column[p], j] = 1.0
+
+    signals = np.zeros((len(column), len(doc_types)))
+    for j, doc_type in enumerate(doc_types):
+        for p in rules["signals"][doc_type]:
+            signals[column[p], j] += 1.0
+
+    invoice = np.zeros(len(column))
+    for p in rules["invoice_signals"]:
+        invoice[column[p]] += 1.0
+
+    signal_list = sum(rules["signals"].values(), [])
+    snapshot["scoring"] = {
+        "column": column,
+        "entity_names": entity_names,
+        "doc_types": doc_types,
+        "entities": entities,
+        "signals": signals,
+        "invoice": invoice,
+        "signal_list": signal_list,
+        "signal_columns": np.array([column[p] for p in signal_list], dtype=np.intp),
+    }
+    return snapshot["scoring"]
+
+
+def categorize_many(texts):
+    """
+    Categorizes a batch of documents against one rule snapshot.
+    Each text is scanned once by the shared matcher; the hits form document x pattern matrices
+    (anywhere and header-only) that are scored for every document at once with NumPy. Results
+    match categorize_document for the same text and come back in input order.
+    """
+    import numpy as np
+
+    texts = list(texts)
+    try:
+        snapshot = load_rules()
+    except Exception as e:
+        return [{"status": "error", "message": str(e)} for _ in texts]
+
+    rules = snapshot["rules"]
+    scoring = scoring_matrices(snapshot)
+    column = scoring["column"]
+    rule_pack = {
+        "version": snapshot["version"],
+        "rule_count": snapshot["rule_count"],
+        "compile_ms": snapshot["compile_ms"],
+    }
+
+    # 1. Hit matrices: one matcher pass per document, scattered into the matrices in one go.
+    rows, cols, header_flags = [], [], []
+    match_ms = [0.0] * len(texts)
+    valid = np.zeros(len(texts), dtype=bool)
+    for i, content in enumerate(texts):
+        if not content:
+            continue
+        valid[i] = True
+        match_start = time.perf_counter()
+        hits = snapshot["matcher"].find(content)
+        match_ms[i] = round((time.perf_counter() - match_start) * 1000.0, 3)
+        header_limit = int(len(content) * rules["header_ratio"])
+        header_hits = snapshot["matcher"].header_hits(content, header_limit, hits)
+        for pattern in hits:
+            rows.append(i)
+            cols.append(column[pattern])
+            header_flags.append(pattern in header_hits)
+
+    rows = np.array(rows, dtype=np.intp)
+    cols = np.array(cols, dtype=np.intp)
+    header_flags = np.array(header_flags, dtype=bool)
+    hit_matrix = np.zeros((len(texts), len(column)))
+    header_matrix = np.zeros((len(texts), len(column)))
+    hit_matrix[rows, cols] = 1.0
+    header_matrix[rows[header_flags], cols[header_flags]] = 1.0
+
+    # 2. Entity Detection: first entity with a header hit, else first with a body hit.
+    header_entities = (header_matrix @ scoring["entities"]) > 0
+    body_entities = (hit_matrix @ scoring["entities"]) > 0
+    in_header = header_entities.any(axis=1)
+    in_body = body_entities.any(axis=1)
+    entity_index = np.where(in_header, header_entities.argmax(axis=1), body_entities.argmax(axis=1))
+    entity_conf = np.where(in_header, 0.98, np.where(in_body, 0.70, 0.0))
+
+    # 3. Signal scoring: 0.4 + 0.15 per matched signal (capped at 3), best doc type wins.
+    signal_counts = hit_matrix @ scoring["signals"]
+    type_scores = np.where(signal_counts > 0, 0.4 + (np.minimum(signal_counts, 3) * 0.15), 0.1)
+    has_type = (signal_counts > 0).any(axis=1)
+    type_index = type_scores.argmax(axis=1)
+    type_conf = np.where(has_type, type_scores.max(axis=1), 0.1)
+
+    # 4. Confidence Penalization & Refinement
+    final_confidence = (entity_conf + type_conf) / 2
+    invoice_found = (hit_matrix @ scoring["invoice"]) > 0
+    signal_hits = hit_matrix[:, scoring["signal_columns"]] > 0
+
+    results = []
+    for i in range(len(texts)):
+        if not valid[i]:
+            results.append({"status": "error", "message": "No content provided."})
+            continue
+
+        detected_entity = scoring["entity_names"][entity_index[i]] if entity_conf[i] else "Unknown"
+        detected_type = scoring["doc_types"][type_index[i]] if has_type[i] else "Document"
+        confidence = float(final_confidence[i])
+        if detected_type == "Invoice" and not invoice_found[i]:
+            confidence *= 0.5
+            detected_type = "Unclassified"
+
+        results.append({
+            "status": "success",
+            "entity": detected_entity,
+            "doc_type": detected_type,
+            "category": rules["category_map"].get(detected_type, "00-uncategorized"),
+            "confidence": round(confidence, 2),
+            "entity_confidence": float(entity_conf[i]),
+            "type_confidence": float(type_conf[i]),
+            "signals_detected": [
+                s for s, hit in zip(scoring["signal_list"], signal_hits[i]) if hit
+            ],
+            "rule_pack": rule_pack,
+            "match_ms": match_ms[i],
+        })
+    return results
+
+
+def read_jsonl_batches(stream, batch_size):
+    """Yields lists of (id, content) from JSON-lines input; bare strings are accepted as content."""
+    batch = []
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = {"id": line_no, "error": f"Invalid JSON: {e}"}
+        if not isinstance(record, dict):
+            record = {"id": line_no, "content": record}
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def categorize_stream(stream, out, batch_size=256):
+    """Categorizes JSON-lines records {id, content} from stream, writing one result line each."""
+    count = 0
+    for batch in read_jsonl_batches(stream, batch_size):
+        texts = [r.get("content") if isinstance(r.get("content"), str) else "" for r in batch]
+        results = categorize_many(texts)
+        for record, result in zip(batch, results):
+            if "error" in record:
+                result = {"status": "error", "message": record["error"]}
+            out.write(json.dumps({"id": record.get("id"), **result}) + "\n")
+        out.flush()
+        count += len(batch)
+    return count
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print(json.dumps({"status": "error", "message": "No content provided."}))
         sys.exit(1)
 
+    if sys.argv[1] == "--jsonl":
+        batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+        categorize_stream(sys.stdin, sys.stdout, batch_size=batch_size)
+        sys.exit(0)
+
     content = sys.argv[1]
     result = categorize_document(content)
     print(json.dumps(result))
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import statistics
+
+import numpy as np
+
+import file_lock
+from qdrant_vectorizer import embed_batch
+
+# Second-stage classifier for documents the rule categorizer is unsure about. Every filed
+# document adds its embedding to a running sum per (category, entity, doc_type) label; a new
+# document is assigned the label whose centroid it is closest to, if it is close enough.
+CENTROID_MODEL = "pseudo_embedding-384"
+CENTROID_DIMS = 384
+DEFAULT_CENTROID_PATH = os.path.join(".antigravity", "memory", "idms_centroids.npz")
+CENTROID_PATH = os.environ.get("IDMS_CENTROID_PATH", DEFAULT_CENTROID_PATH)
+MIN_SIMILARITY = float(os.environ.get("IDMS_CENTROID_MIN_SIMILARITY", "0.75"))
+MIN_MARGIN = float(os.environ.get("IDMS_CENTROID_MIN_MARGIN", "0.05"))
+MIN_SUPPORT = int(os.environ.get("IDMS_CENTROID_MIN_SUPPORT", "2"))
+# Only the head of very long documents is embedded so lookups stay in the millisecond range.
+EMBED_CHARS = int(os.environ.get("IDMS_CENTROID_EMBED_CHARS", "20000"))
+LOCK_TIMEOUT = 30  # seconds
+
+_SNAPSHOT = None
+
+
+def embed_many(contents):
+    return embed_batch([(content or "")[:EMBED_CHARS] for content in contents], dims=CENTROID_DIMS, dtype=np.float64)
+
+
+def embed(content):
+    return embed_many([content])[0]
+
+
+def label_key(category, entity, doc_type):
+    return json.dumps([category, entity, doc_type])
+
+
+def empty_store():
+    return {"labels": [], "counts": np.zeros(0), "sums": np.zeros((0, CENTROID_DIMS))}
+
+
+def read_store(path):
+    if not os.path.exists(path):
+        return empty_store()
+    with np.load(path, allow_pickle=False) as data:
+        if str(data["model"]) != CENTROID_MODEL:
+            raise ValueError(f"Centroid store {path} was built with {data['model']}, expected {CENTROID_MODEL}")
+        return {
+            "labels": [str(label) for label in data["labels"]],
+            "counts": data["counts"].astype(np.float64),
+            "sums": data["sums"].astype(np.float64),
+        }
+
+
+def write_store(store, path):
+    """Atomic write: temp file in the same directory, then rename over the store."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            np.savez(
+                handle,
+                model=np.array(CENTROID_MODEL),
+                labels=np.array(store["labels"], dtype=str),
+                counts=store["counts"],
+                sums=store["sums"],
+            )
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_centroids(path=None):
+    """
+    Returns the in-memory centroid snapshot {labels, counts, matrix}, re-reading the store only
+    when its mtime or size changes. `matrix` holds unit-length centroids, one row per label, so a
+    lookup is a single matrix-vector product.
+    """
+    global _SNAPSHOT
+    path = path or CENTROID_PATH
+    try:
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = (path, None, None)
+    if _SNAPSHOT is not None and _SNAPSHOT["key"] == key:
+        return _SNAPSHOT
+
+    store = read_store(path)
+    norms = np.linalg.norm(store["sums"], axis=1, keepdims=True)
+    matrix = np.divide(store["sums"], norms, out=np.zeros_like(store["sums"]), where=norms > 0)
+    _SNAPSHOT = {"key": key, "labels": store["labels"], "counts": store["counts"], "matrix": matrix}
+    return _SNAPSHOT
+
+
+def nearest(snapshot, vector):
+    """Returns (label index, similarity, margin over the runner-up) or None for an empty store."""
+    if not snapshot["labels"]:
+        return None
+    sims = snapshot["matrix"] @ vector
+    best = int(np.argmax(sims))
+    runner_up = np.partition(sims, -2)[-2] if len(sims) > 1 else 0.0
+    return best, float(sims[best]), float(sims[best] - runner_up)
+
+
+def classify(content, path=None):
+    """
+    Looks the document up against the filed-document centroids.
+    `match` is true only when the nearest label is similar enough, clearly ahead of the next one,
+    and backed by enough filed documents.
+    """
+    try:
+        if not content:
+            return {"status": "error", "message": "No content provided."}
+
+        start = time.perf_counter()
+        snapshot = load_centroids(path)
+        found = nearest(snapshot, embed(content))
+        latency_ms = round((time.perf_counter() - start) * 1000.0, 3)
+
+        if found is None:
+            return {"status": "success", "match": False, "reason": "no centroids", "latency_ms": latency_ms}
+
+        best, similarity, margin = found
+        category, entity, doc_type = json.loads(snapshot["labels"][best])
+        support = int(snapshot["counts"][best])
+        match = similarity >= MIN_SIMILARITY and margin >= MIN_MARGIN and support >= MIN_SUPPORT
+        return {
+            "status": "success",
+            "match": match,
+            "category": category,
+            "entity": entity,
+            "doc_type": doc_type,
+            "similarity": round(similarity, 4),
+            "margin": round(margin, 4),
+            "support": support,
+            "labels": len(snapshot["labels"]),
+            "latency_ms": latency_ms,
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def add_to_store(store, vectors_by_label):
+    index = {label: i for i, label in enumerate(store["labels"])}
+    for label, vectors in vectors_by_label.items():
+        total = np.sum(vectors, axis=0)
+        if label in index:
+            store["sums"][index[label]] += total
+            store["counts"][index[label]] += len(vectors)
+        else:
+            index[label] = len(store["labels"])
+            store["labels"].append(label)
+            store["sums"] = np.vstack([store["sums"], total[None, :]])
+            store["counts"] = np.append(store["counts"], float(len(vectors)))
+    return store
+
+
+def learn_documents(documents, path=None):
+    """Folds labelled documents [{content, category, entity, doc_type}] into the store."""
+    path = path or CENTROID_PATH
+    documents = [doc for doc in documents if doc.get("content") and doc.get("category")]
+    vectors_by_label = {}
+    for doc, vector in zip(documents, embed_many([doc["content"] for doc in documents])):
+        label = label_key(doc.get("category"), doc.get("entity"), doc.get("doc_type"))
+        vectors_by_label.setdefault(label, []).append(vector)
+
+    with file_lock.locked(path + ".lock", timeout=LOCK_TIMEOUT, label="Centroid store lock"):
+        store = add_to_store(read_store(path), vectors_by_label)
+        write_store(store, path)
+    return {
+        "status": "success",
+        "learned": sum(len(v) for v in vectors_by_label.values()),
+        "labels": len(store["labels"]),
+        "centroid_path": path,
+    }
+
+
+def learn_document(content, metadata, path=None):
+    """Adds one filed document to its label's centroid."""
+    try:
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        return learn_documents([{
+            "content": content,
+            "category": metadata.get("category"),
+            "entity": metadata.get("entity"),
+            "doc_type": metadata.get("doc_type"),
+        }], path)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def filed_documents_from_postgres():
+    """Auto-filed documents with their labels, straight from the documents table."""
+    import postgres_logger
+
+    conn = postgres_logger.psycopg2.connect(postgres_logger.get_dsn())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT extracted_text, category, entity, metadata->>'doc_type'
+                FROM documents
+                WHERE status = 'processed' AND extracted_text IS NOT NULL
+                """
+            )
+            return [
+                {"content": text, "category": category, "entity": entity, "doc_type": doc_type}
+                for text, category, entity, doc_type in cur
+            ]
+    finally:
+        conn.close()
+
+
+def build(documents, path=None):
+    """Rebuilds the store from scratch out of labelled documents."""
+    path = path or CENTROID_PATH
+    if os.path.exists(path):
+        os.remove(path)
+    return learn_documents(documents, path)
+
+
+def evaluate(documents, holdout=0.2):
+    """
+    Replays labelled documents in order: the first part is treated as already filed, the rest as
+    new arrivals. Reports how many arrivals the rules alone send to review, how many the centroid
+    stage rescues (and how many of those rescues are correct), and lookup latency.
+    """
+    import categorizer
+
+    split = int(len(documents) * (1.0 - holdout))
+    filed, arrivals = documents[:split], documents[split:]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "centroids.npz")
+        learn_documents(filed, path)
+
+        rules_results = categorizer.categorize_many([d.get("content") or "" for d in arrivals])
+        review_rules = 0
+        review_final = 0
+        rescued = 0
+        rescued_correct = 0
+        latencies = []
+        for doc, rules_res in zip(arrivals, rules_results):
+            confident = (
+                rules_res.get("status") == "success"
+                and rules_res["confidence"] >= 0.85
+                and rules_res["entity_confidence"] >= 0.85
+            )
+            if confident:
+                continue
+            review_rules += 1
+            res = classify(doc.get("content"), path)
+            latencies.append(res.get("latency_ms", 0.0))
+            if res.get("match"):
+                rescued += 1
+                if [res["category"], res["entity"], res["doc_type"]] == [
+                    doc.get("category"), doc.get("entity"), doc.get("doc_type")
+                ]:
+                    rescued_correct += 1
+            else:
+                review_final += 1
+
+    total = len(arrivals) or 1
+    return {
+        "status": "success",
+        "filed": len(filed),
+        "arrivals": len(arrivals),
+        "review_share_rules": round(review_rules / total, 4),
+        "review_share_with_centroids": round(review_final / total, 4),
+        "rescued": rescued,
+        "rescue_precision": round(rescued_correct / rescued, 4) if rescued else None,
+        "latency_ms_median": round(statistics.median(latencies), 3) if latencies else None,
+        "latency_ms_max": round(max(latencies), 3) if latencies else None,
+    }
+
+
+def stats(path=None):
+    snapshot = load_centroids(path)
+    return {
+        "status": "success",
+        "centroid_path": path or CENTROID_PATH,
+        "model": CENTROID_MODEL,
+        "labels": len(snapshot["labels"]),
+        "documents": int(snapshot["counts"].sum()),
+    }
+
+
+def main():
+    # Stage interface: <content> classifies, <content> <metadata_json> learns a filed document.
+    if len(sys.argv) >= 2 and not sys.argv[1].startswith("--"):
+        if len(sys.argv) >= 3:
+            result = learn_document(sys.argv[1], sys.argv[2])
+        else:
+            result = classify(sys.argv[1])
+        print(json.dumps(result))
+        sys.exit(0 if result.get("status") == "success" else 1)
+
+    parser = argparse.ArgumentParser(description="IDMS centroid classifier")
+    parser.add_argument("--build", action="store_true", help="Rebuild the centroid store")
+    parser.add_argument("--evaluate", action="store_true", help="Replay labelled documents and report review share")
+    parser.add_argument("--stats", action="store_true", help="Show centroid store size")
+    parser.add_argument("--jsonl", help="Labelled documents {content, category, entity, doc_type} (default: Postgres)")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    try:
+        if args.build or args.evaluate:
+            documents = read_jsonl(args.jsonl) if args.jsonl else filed_documents_from_postgres()
+            result = build(documents) if args.build else evaluate(documents, args.holdout)
+        else:
+            result = stats()
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+    print(json.dumps(result))
+    if result.get("status") != "success":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Persistent chunk-embedding store shared by every indexing path. Entries are keyed by the
+# embedding model id plus the SHA-256 of the chunk text, so repeated boilerplate (T&Cs, NDA
+# templates, disclosures) is embedded once per model. Least-recently-used rows are evicted once
+# the store holds more than CACHE_MAX_BYTES of vectors.
+# Reads never take the write lock: hit/miss counts and last_used refreshes are buffered per process
+# and written with the next put_many, or once TOUCH_FLUSH refreshes are pending. LRU order is
+# therefore approximate by up to that many reads. Counters (and the entry/byte totals eviction
+# checks) persist in the store's `counters` table, so every process adds to the same totals.
+CACHE_PATH = os.environ.get("IDMS_EMBED_CACHE_PATH", os.path.join(".antigravity", "cache", "embeddings.sqlite3"))
+CACHE_MAX_BYTES = int(float(os.environ.get("IDMS_EMBED_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_ENABLED = os.environ.get("IDMS_EMBED_CACHE", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+TOUCH_FLUSH = 512
+COUNTER_KEYS = ("hits", "misses", "writes", "evictions")
+
+# This process's counters; stats() reports the persisted totals across processes.
+STATS = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+_LOCAL = threading.local()
+# (path, pid) -> {"touched": {(model_id, chunk_hash): last_used}, "hits": n, "misses": n}
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def connect(cache_path=None):
+    """One connection per store per thread (sqlite connections must not cross threads or a fork)."""
+    path = cache_path or CACHE_PATH
+    key = (path, os.getpid())
+    connections = getattr(_LOCAL, "connections", None)
+    if connections is None:
+        connections = _LOCAL.connections = {}
+    if key not in connections:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_id, chunk_hash)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        if conn.execute("SELECT 1 FROM counters WHERE name = 'entries'").fetchone() is None:
+            # New store, or one written before the totals were tracked: measure once.
+            with transaction(conn):
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO counters (name, value)
+                    SELECT 'entries', COUNT(*) FROM embeddings
+                    UNION ALL SELECT 'bytes', COALESCE(SUM(dims), 0) * 4 FROM embeddings
+                    """
+                )
+        connections[key] = conn
+    return connections[key]
+
+
+@contextmanager
+def transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def chunk_hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def bump(conn, **deltas):
+    conn.executemany(
+        "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+        [(name, value) for name, value in deltas.items() if value],
+    )
+
+
+def counters(conn):
+    return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+
+
+def note_reads(cache_path=None, model_id=None, found=(), hits=0, misses=0):
+    """Buffers last_used refreshes and hit/miss counts; flushes once TOUCH_FLUSH refreshes are pending."""
+    key = (cache_path or CACHE_PATH, os.getpid())
+    now = time.time()
+    with _PENDING_LOCK:
+        pending = _PENDING.setdefault(key, {"touched": {}, "hits": 0, "misses": 0})
+        for h in found:
+            pending["touched"][(model_id, h)] = now
+        pending["hits"] += hits
+        pending["misses"] += misses
+        due = len(pending["touched"]) >= TOUCH_FLUSH
+    if due:
+        flush(cache_path)
+
+
+def take_pending(cache_path=None):
+    with _PENDING_LOCK:
+        return _PENDING.pop((cache_path or CACHE_PATH, os.getpid()), None)
+
+
+def apply_pending(conn, pending):
+    """Writes buffered reads. Caller holds a write transaction."""
+    if not pending:
+        return
+    conn.executemany(
+        "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND chunk_hash = ?",
+        [(used, model_id, h) for (model_id, h), used in pending["touched"].items()],
+    )
+    bump(conn, hits=pending["hits"], misses=pending["misses"])
+
+
+def flush(cache_path=None):
+    pending = take_pending(cache_path)
+    if pending:
+        conn = connect(cache_path)
+        with transaction(conn):
+            apply_pending(conn, pending)
+
+
+def flush_all():
+    """Flushes what this process buffered for every store (registered atexit; failures are dropped)."""
+    for path, pid in list(_PENDING):
+        if pid == os.getpid():
+            try:
+                flush(path)
+            except sqlite3.Error:
+                pass
+
+
+atexit.register(flush_all)
+
+
+def get_many(model_id, hashes, cache_path=None):
+    """
+    Returns {chunk_hash: float32 vector} for the cached subset of hashes. Their LRU refresh is
+    buffered (note_reads), so a read takes no write lock.
+    """
+    if not hashes:
+        return {}
+    conn = connect(cache_path)
+    found = {}
+    unique = list(dict.fromkeys(hashes))
+    for start in range(0, len(unique), 500):
+        batch = unique[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT chunk_hash, dims, vector FROM embeddings WHERE model_id = ? AND chunk_hash IN ({placeholders})",
+            [model_id, *batch],
+        )
+        for h, dims, blob in rows:
+            found[h] = np.frombuffer(blob, dtype=np.float32, count=dims)
+    note_reads(cache_path, model_id, found)
+    return found
+
+
+def put_many(model_id, entries, cache_path=None, max_bytes=None):
+    """
+    Stores {chunk_hash: vector} and this process's buffered reads in one transaction, then evicts
+    least-recently-used rows if the tracked size crosses the bound.
+    """
+    if not entries:
+        return 0
+    conn = connect(cache_path)
+    max_bytes = max_bytes if max_bytes is not None else CACHE_MAX_BYTES
+    now = time.time()
+    rows = [
+        (model_id, h, int(v.shape[0]), np.asarray(v, dtype=np.float32).tobytes(), now)
+        for h, v in entries.items()
+    ]
+    with transaction(conn):
+        apply_pending(conn, take_pending(cache_path))
+        # A concurrent writer may have stored the same chunk; its vector is identical, keep it.
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (model_id, chunk_hash, dims, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        inserted = conn.total_changes - before
+        # One model per call, so every row has the same dims.
+        bump(conn, writes=inserted, entries=inserted, bytes=inserted * rows[0][2] * 4)
+        if counters(conn).get("bytes", 0) > max_bytes:
+            evict(max_bytes, cache_path)
+    STATS["writes"] += inserted
+    return inserted
+
+
+def evict(max_bytes, cache_path=None):
+    """Deletes least-recently-used rows down to 90% of max_bytes. Caller holds a write transaction."""
+    conn = connect(cache_path)
+    totals = counters(conn)
+    count, size = totals.get("entries", 0), totals.get("bytes", 0)
+    if not count or size <= max_bytes:
+        return 0
+    # Drop down to 90% of the bound so eviction does not run on every write.
+    to_remove = count - int(max_bytes * 0.9 / (size / count))
+    victims = conn.execute("SELECT rowid, dims FROM embeddings ORDER BY last_used LIMIT ?", (to_remove,)).fetchall()
+    conn.executemany("DELETE FROM embeddings WHERE rowid = ?", [(rowid,) for rowid, _ in victims])
+    bump(conn, evictions=len(victims), entries=-len(victims), bytes=-sum(dims * 4 for _, dims in victims))
+    STATS["evictions"] += len(victims)
+    return len(victims)
+
+
+def embed(texts, model_id, embed_fn, cache_path=None):
+    """
+    Returns the (n_texts, dims) float32 embedding matrix for texts, calling embed_fn(list_of_texts)
+    only for chunks not already cached under model_id.
+    """
+    texts = list(texts)
+    if not CACHE_ENABLED or not texts:
+        return np.asarray(embed_fn(texts), dtype=np.float32)
+
+    hashes = [chunk_hash(t) for t in texts]
+    cached = get_many(model_id, hashes, cache_path)
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in cached and h not in missing:
+            missing[h] = text
+    misses = sum(1 for h in hashes if h in missing)
+    STATS["hits"] += len(texts) - misses
+    STATS["misses"] += misses
+    note_reads(cache_path, hits=len(texts) - misses, misses=misses)
+
+    if missing:
+        vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+        fresh = dict(zip(missing.keys(), vectors))
+        put_many(model_id, fresh, cache_path)
+        cached.update(fresh)
+
+    return np.vstack([cached[h] for h in hashes])
+
+
+def stats(cache_path=None):
+    flush(cache_path)
+    conn = connect(cache_path)
+    used, count = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0), COUNT(*) FROM embeddings").fetchone()
+    models = dict(conn.execute("SELECT model_id, COUNT(*) FROM embeddings GROUP BY model_id").fetchall())
+    totals = counters(conn)
+    return {
+        **{key: totals.get(key, 0) for key in COUNTER_KEYS},
+        "entries": count,
+        "bytes": used,
+        "max_bytes": CACHE_MAX_BYTES,
+        "models": models,
+        "cache_path": cache_path or CACHE_PATH,
+    }
+
+
+def clear(cache_path=None):
+    conn = connect(cache_path)
+    with transaction(conn):
+        removed = conn.execute("DELETE FROM embeddings").rowcount
+        conn.execute("UPDATE counters SET value = 0 WHERE name IN ('entries', 'bytes')")
+    conn.execute("VACUUM")
+    return removed
+
+
+if __name__ == "__main__":
+    action = sys.argv[1] if len(sys.argv) > 1 else "stats"
+
+    if action == "stats":
+        print(json.dumps(stats()))
+    elif action == "clear":
+        print(json.dumps({"status": "success", "removed": clear()}))
+    else:
+        print(json.dumps({"status": "error", "message": "Usage: embedding_cache.py [stats|clear]"}))
+        sys.exit(1)
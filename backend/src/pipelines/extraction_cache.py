@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import atexit
+import hashlib
+import tempfile
+import threading
+
+import file_lock
+
+# Content-addressed store for extractor results. Entries are keyed by the file's SHA-256
+# plus every setting that can change the output, so a re-run on known bytes skips OCR.
+CACHE_DIR = os.environ.get("IDMS_EXTRACT_CACHE_DIR", os.path.join(".antigravity", "cache", "extraction"))
+CACHE_MAX_BYTES = int(float(os.environ.get("IDMS_EXTRACT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_ENABLED = os.environ.get("IDMS_EXTRACT_CACHE", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+# Counters and the running size estimate live in a sidecar file next to the shards, updated under
+# a lock, so every worker process adds to the same totals and `stats` can report them.
+# Lookups never take that lock: hit/miss counts are buffered per process and written with the next
+# put, or once COUNTER_FLUSH lookups are pending. The cache is an optimisation, so a lock or disk
+# failure is reported on stderr and the lookup or write is skipped, never raised to the extractor.
+COUNTERS_NAME = "stats.json"
+COUNTER_KEYS = ("hits", "misses", "writes", "evictions")
+COUNTER_FLUSH = 64
+
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def warn(message):
+    sys.stderr.write(json.dumps({"event": "warning", "message": message}) + "\n")
+
+
+def read_counters(root):
+    try:
+        with open(os.path.join(root, COUNTERS_NAME), "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_counters(cache_dir=None, reset_bytes=None, **deltas):
+    """Adds deltas to the persistent counters (optionally re-basing the size estimate) and returns the totals."""
+    root = cache_dir or CACHE_DIR
+    os.makedirs(root, exist_ok=True)
+    with file_lock.locked(os.path.join(root, "stats.lock"), label="Extraction cache stats lock"):
+        counters = read_counters(root)
+        if reset_bytes is not None:
+            counters["bytes"] = reset_bytes
+        elif "bytes" not in counters:
+            # First use (or a cache written before the estimate existed): measure once.
+            counters["bytes"] = sum(size for _, size, _ in list_entries(root))
+        for key, value in deltas.items():
+            counters[key] = counters.get(key, 0) + value
+        fd, tmp_path = tempfile.mkstemp(dir=root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(counters, handle)
+        os.replace(tmp_path, os.path.join(root, COUNTERS_NAME))
+    return counters
+
+
+def note_lookup(cache_dir=None, **deltas):
+    """Buffers hit/miss counts; flushes once COUNTER_FLUSH lookups are pending."""
+    key = (cache_dir or CACHE_DIR, os.getpid())
+    with _PENDING_LOCK:
+        pending = _PENDING.setdefault(key, {})
+        for name, value in deltas.items():
+            pending[name] = pending.get(name, 0) + value
+        due = sum(pending.values()) >= COUNTER_FLUSH
+    if due:
+        flush(cache_dir)
+
+
+def take_pending(cache_dir=None):
+    with _PENDING_LOCK:
+        return _PENDING.pop((cache_dir or CACHE_DIR, os.getpid()), {})
+
+
+def flush(cache_dir=None):
+    pending = take_pending(cache_dir)
+    if pending:
+        try:
+            update_counters(cache_dir, **pending)
+        except (OSError, TimeoutError) as exc:
+            warn(f"Extraction cache counters not updated: {exc}")
+
+
+def flush_all():
+    """Flushes what this process buffered for every cache directory (registered atexit)."""
+    for root, pid in list(_PENDING):
+        if pid == os.getpid():
+            flush(root)
+
+
+atexit.register(flush_all)
+
+
+def cache_key(file_hash, settings):
+    payload = json.dumps({"hash": file_hash, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def entry_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, key[:2], f"{key}.json")
+
+
+def get(key, cache_dir=None):
+    """Returns the cached result for key (refreshing its LRU position) or None."""
+    path = entry_path(key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            result = json.load(handle)
+    except (OSError, ValueError):
+        note_lookup(cache_dir, misses=1)
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass  # read-only cache: the entry is still valid, only its LRU position is stale
+    note_lookup(cache_dir, hits=1)
+    return result
+
+
+def put(key, result, cache_dir=None, max_bytes=None):
+    """
+    Atomically writes an entry. Least-recently-used entries are evicted only once the running
+    size estimate crosses the bound; the directory is walked then, not on every write.
+    """
+    path = entry_path(key, cache_dir)
+    try:
+        replaced = os.path.getsize(path)
+    except OSError:
+        replaced = 0
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(result, handle)
+        os.replace(tmp_path, path)
+        written = os.path.getsize(path)
+    except OSError as exc:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        warn(f"Extraction cache entry not written: {exc}")
+        return False
+
+    max_bytes = max_bytes if max_bytes is not None else CACHE_MAX_BYTES
+    deltas = take_pending(cache_dir)
+    deltas["writes"] = deltas.get("writes", 0) + 1
+    try:
+        counters = update_counters(cache_dir, bytes=written - replaced, **deltas)
+        if counters["bytes"] > max_bytes:
+            evict(max_bytes, cache_dir)
+    except (OSError, TimeoutError) as exc:
+        # The entry is written; only the totals lag until the next eviction re-measures them.
+        warn(f"Extraction cache counters not updated: {exc}")
+    return True
+
+
+def list_entries(cache_dir=None):
+    """Yields (mtime, size, path) for every cache entry."""
+    root = cache_dir or CACHE_DIR
+    if not os.path.isdir(root):
+        return
+    for shard in os.listdir(root):
+        shard_dir = os.path.join(root, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(shard_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, path
+
+
+def evict(max_bytes, cache_dir=None):
+    """Removes least-recently-used entries down to 90% of max_bytes and resets the size estimate."""
+    entries = sorted(list_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        # Stop at 90% of the bound so the next few writes do not trigger another walk.
+        for _, size, path in entries:
+            if total <= max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+    update_counters(cache_dir, reset_bytes=total, evictions=removed)
+    return removed
+
+
+def stats(cache_dir=None):
+    flush(cache_dir)
+    entries = list(list_entries(cache_dir))
+    counters = read_counters(cache_dir or CACHE_DIR)
+    return {
+        **{key: counters.get(key, 0) for key in COUNTER_KEYS},
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": CACHE_MAX_BYTES,
+        "cache_dir": cache_dir or CACHE_DIR,
+    }
+
+
+def clear(cache_dir=None):
+    removed = 0
+    for _, _, path in list(list_entries(cache_dir)):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    if os.path.isdir(cache_dir or CACHE_DIR):
+        update_counters(cache_dir, reset_bytes=0)
+    return removed
+
+
+if __name__ == "__main__":
+    action = sys.argv[1] if len(sys.argv) > 1 else "stats"
+
+    if action == "stats":
+        print(json.dumps(stats()))
+    elif action == "clear":
+        print(json.dumps({"status": "success", "removed": clear()}))
+    else:
+        print(json.dumps({"status": "error", "message": "Usage: extraction_cache.py [stats|clear]"}))
+        sys.exit(1)
@@ -1,13 +1,54 @@
 import os
 import json
 import argparse
+import time
 import hashlib
 import shutil
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 import pdfplumber
 import pytesseract
 from pdf2image import convert_from_path
 
+import extraction_cache
+
+# Bump when a change to this module alters extracted text, so cached results are not reused.
+EXTRACTOR_VERSION = "7"
+
+# Text-layer backend: pdfplumber (high fidelity, slowest), pdfminer or pypdf (reading-order fast paths).
+TEXT_BACKEND = os.environ.get("IDMS_TEXT_BACKEND", "pdfplumber").strip().lower()
+
+# Pages whose text layer has fewer characters than this are rasterised and OCR'd.
+OCR_MIN_CHARS = int(os.environ.get("IDMS_OCR_MIN_CHARS", "25"))
+
+# Page-level OCR fan-out; 0 means this process's share of the CPU cores (see default_ocr_workers).
+OCR_WORKERS = int(os.environ.get("IDMS_OCR_WORKERS", "0"))
+
+# OCR engine: tesserocr (in-memory C API), pytesseract (forks the tesseract CLI per page) or auto.
+OCR_ENGINE = os.environ.get("IDMS_OCR_ENGINE", "auto").strip().lower()
+
+
+def default_ocr_workers():
+    """
+    OCR_WORKERS if set, else the CPU cores divided among the batch workers running extractions
+    side by side (IDMS_BATCH_WORKERS, exported by pipeline_runner's batch pool), so N batch
+    workers never start N x cores OCR processes between them.
+    """
+    if OCR_WORKERS > 0:
+        return OCR_WORKERS
+    cores = os.cpu_count() or 1
+    batch_workers = int(os.environ.get("IDMS_BATCH_WORKERS", "1") or 1)
+    if batch_workers <= 0:
+        batch_workers = cores
+    return max(1, cores // batch_workers)
+
 
 def configure_tesseract():
     """Configure tesseract path for Windows if needed; Linux uses PATH."""
@@ -35,6 +76,85 @@ def detect_poppler_path():
     return None
 
 
+def tesserocr_available():
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_ocr_engine(name=None):
+    name = name or OCR_ENGINE
+    if name == "auto":
+        return "tesserocr" if tesserocr_available() else "pytesseract"
+    return name
+
+
+def tesseract_version(engine=None):
+    """OCR engine version, probed once per process (and engine)."""
+    return probe_engine_version(resolve_ocr_engine(engine))
+
+
+@lru_cache(maxsize=None)
+def probe_engine_version(engine):
+    try:
+        if engine == "tesserocr":
+            import tesserocr
+
+            # "tesseract 5.3.0\n leptonica-1.82.0 ..."
+            return tesserocr.tesseract_version().split()[1]
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "Tesseract (Unknown Version)"
+
+
+def engine_fingerprint(engine=None):
+    """
+    Identifies the installed OCR engine for cache keys without running it: the tesseract binary's
+    resolved path, mtime and size (an upgrade replaces the file), or the in-process tesserocr
+    version. Probing the CLI version would fork tesseract for every document, OCR'd or not.
+    """
+    engine = resolve_ocr_engine(engine)
+    if engine == "tesserocr":
+        return f"tesserocr {probe_engine_version(engine)}"
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    path = shutil.which(cmd) or cmd
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{cmd} (not found)"
+    return f"{os.path.realpath(path)} {st.st_mtime_ns} {st.st_size}"
+
+
+def ocr_settings():
+    """
+    OCR rendering policy. "fixed" renders every page at IDMS_OCR_DPI; "adaptive" starts at
+    IDMS_OCR_DPI_LOW and re-renders at IDMS_OCR_DPI only pages with low confidence or yield.
+    """
+    return {
+        "mode": os.environ.get("IDMS_OCR_DPI_MODE", "fixed").strip().lower(),
+        "dpi": int(os.environ.get("IDMS_OCR_DPI", "300")),
+        "low_dpi": int(os.environ.get("IDMS_OCR_DPI_LOW", "150")),
+        "min_confidence": float(os.environ.get("IDMS_OCR_MIN_CONFIDENCE", "70")),
+        "min_yield_chars": int(os.environ.get("IDMS_OCR_MIN_YIELD_CHARS", "40")),
+        "engine": resolve_ocr_engine(),
+        "skip_blank": os.environ.get("IDMS_OCR_SKIP_BLANK", "1").strip().lower() in {"1", "true", "yes", "on"},
+        "blank_ink_ratio": float(os.environ.get("IDMS_OCR_BLANK_INK_RATIO", "0.001")),
+    }
+
+
+def extraction_settings():
+    """Everything besides the file bytes that determines the extraction output."""
+    return {
+        "extractor_version": EXTRACTOR_VERSION,
+        "ocr": ocr_settings(),
+        "ocr_min_chars": OCR_MIN_CHARS,
+        "text_backend": TEXT_BACKEND,
+        "ocr_engine": engine_fingerprint(),
+    }
+
+
 def sha256_file(file_path):
     digest = hashlib.sha256()
     with open(file_path, "rb") as handle:
@@ -43,7 +163,276 @@ def sha256_file(file_path):
     return digest.hexdigest()
 
 
-def extract_content(file_path):
+def text_layer_pdfplumber(file_path):
+    with pdfplumber.open(file_path) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def text_layer_pdfminer(file_path):
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LAParams, LTTextContainer
+
+    pages = []
+    for layout in extract_pages(file_path, laparams=LAParams()):
+        pages.append("".join(element.get_text() for element in layout if isinstance(element, LTTextContainer)))
+    return pages
+
+
+def text_layer_pypdf(file_path):
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+TEXT_BACKENDS = {
+    "pdfplumber": text_layer_pdfplumber,
+    "pdfminer": text_layer_pdfminer,
+    "pypdf": text_layer_pypdf,
+}
+
+
+def text_layer_pages(file_path, backend=None):
+    """Returns one text-layer string per page using the configured backend."""
+    backend = backend or TEXT_BACKEND
+    if backend not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown text backend: {backend} (expected one of {sorted(TEXT_BACKENDS)})")
+    return TEXT_BACKENDS[backend](file_path)
+
+
+def current_rss_mb():
+    """
+    Current resident set size of this process, or None where unsupported. Not the lifetime peak
+    (ru_maxrss): OCR workers are long-lived, so that would carry over from earlier documents.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024.0 * 1024.0)
+    return None
+
+
+def rss_growth_mb(baseline):
+    """RSS added since baseline (sampled while a page image is still held), or None where unsupported."""
+    current = current_rss_mb()
+    if baseline is None or current is None:
+        return None
+    return round(max(current - baseline, 0.0), 1)
+
+
+def render_page(file_path, page_number, dpi, poppler_path=None):
+    """Rasterises a single page so only one page image is alive per worker."""
+    kwargs = {"dpi": dpi, "first_page": page_number, "last_page": page_number}
+    if poppler_path:
+        kwargs["poppler_path"] = poppler_path
+    images = convert_from_path(file_path, **kwargs)
+    return images[0] if images else None
+
+
+def text_from_ocr_data(data):
+    """Rebuilds page text from image_to_data output, keeping line and paragraph breaks."""
+    lines = []
+    current_key = None
+    words = []
+    previous_par = None
+    for i, word in enumerate(data["text"]):
+        if not str(word).strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != current_key:
+            if words:
+                lines.append(" ".join(words))
+            if previous_par is not None and key[:2] != previous_par:
+                lines.append("")
+            current_key, previous_par, words = key, key[:2], []
+        words.append(str(word))
+    if words:
+        lines.append(" ".join(words))
+    return "\n".join(lines)
+
+
+class OcrEngine:
+    """
+    Per-process OCR engine that takes PIL images in memory.
+    tesserocr keeps one initialised Tesseract API for the life of the worker, so there is no
+    process spawn or temp-file round trip per page; pytesseract is the portable fallback.
+    """
+
+    def __init__(self, name=None):
+        self.name = resolve_ocr_engine(name)
+        self.version = tesseract_version(self.name)
+        self._api = None
+        if self.name == "tesserocr":
+            import tesserocr
+
+            self._api = tesserocr.PyTessBaseAPI()
+
+    def image_to_string(self, image):
+        if self._api is not None:
+            self._api.SetImage(image)
+            return self._api.GetUTF8Text()
+        return pytesseract.image_to_string(image)
+
+    def image_to_text_and_confidence(self, image):
+        """OCRs an image in one recognition pass, returning (text, mean word confidence)."""
+        if self._api is not None:
+            self._api.SetImage(image)
+            text = self._api.GetUTF8Text()
+            return text, round(float(self._api.MeanTextConf()), 1)
+
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+        confidences = [
+            float(conf)
+            for conf, word in zip(data["conf"], data["text"])
+            if str(word).strip() and float(conf) >= 0
+        ]
+        confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return text_from_ocr_data(data), round(confidence, 1)
+
+
+_ENGINES = {}
+
+
+def get_ocr_engine(name=None):
+    """Returns this process's engine instance, creating (and version-probing) it once."""
+    name = resolve_ocr_engine(name)
+    if name not in _ENGINES:
+        _ENGINES[name] = OcrEngine(name)
+    return _ENGINES[name]
+
+
+def init_ocr_worker(engine_name):
+    configure_tesseract()
+    get_ocr_engine(engine_name)
+
+
+def is_blank_page(image, max_ink_ratio, ink_threshold=200, min_row_ink=0.003, text_rows=3):
+    """
+    Cheap pixel-statistics check: a page is blank when almost no pixels are darker than
+    ink_threshold and no text_rows consecutive rows each carry min_row_ink of ink. One short
+    line of text can stay under max_ink_ratio of the page, but it darkens a run of rows, which
+    specks and scanner streaks do not. Margins are ignored so scanner edge shadows do not count.
+    """
+    gray = image.convert("L")
+    width, height = gray.size
+    margin_x, margin_y = width // 20, height // 20
+    gray = gray.crop((margin_x, margin_y, width - margin_x, height - margin_y))
+    factor = max(1, gray.size[0] // 600)
+    if factor > 1:
+        gray = gray.reduce(factor)
+
+    histogram = gray.histogram()
+    total = sum(histogram)
+    if total == 0:
+        return True
+    if sum(histogram[:ink_threshold]) / total > max_ink_ratio:
+        return False
+
+    # Box-average each row of the ink mask down to one pixel: its share of ink, scaled to 0-255.
+    ink = gray.point(lambda value: 255 if value < ink_threshold else 0)
+    run = 0
+    for row_ink in ink.reduce((ink.size[0], 1)).getdata():
+        run = run + 1 if row_ink >= 255 * min_row_ink else 0
+        if run >= text_rows:
+            return False
+    return True
+
+
+def ocr_page(job):
+    """Renders and OCRs one page; runs inside an OCR worker process."""
+    file_path, page_number, settings, poppler_path = job
+    start = time.perf_counter()
+    baseline_rss = current_rss_mb()
+    page_rss = None
+    engine = get_ocr_engine(settings["engine"])
+    text = ""
+    dpi = settings["dpi"]
+    confidence = None
+
+    blank = False
+
+    if settings["mode"] == "adaptive" and settings["low_dpi"] < settings["dpi"]:
+        image = render_page(file_path, page_number, settings["low_dpi"], poppler_path)
+        if image is not None:
+            blank = settings["skip_blank"] and is_blank_page(image, settings["blank_ink_ratio"])
+            if not blank:
+                text, confidence = engine.image_to_text_and_confidence(image)
+            page_rss = rss_growth_mb(baseline_rss)
+            image.close()
+        good_enough = (
+            confidence is not None
+            and confidence >= settings["min_confidence"]
+            and len(text.strip()) >= settings["min_yield_chars"]
+        )
+        if blank or good_enough:
+            dpi = settings["low_dpi"]
+        else:
+            text, confidence = "", None
+
+    if dpi == settings["dpi"]:
+        image = render_page(file_path, page_number, dpi, poppler_path)
+        if image is not None:
+            blank = settings["skip_blank"] and is_blank_page(image, settings["blank_ink_ratio"])
+            if not blank:
+                text = engine.image_to_string(image)
+            growth = rss_growth_mb(baseline_rss)
+            if growth is not None:
+                page_rss = max(page_rss or 0.0, growth)
+            image.close()
+
+    return {
+        "page": page_number,
+        "text": text,
+        "dpi": dpi,
+        "confidence": confidence,
+        "blank": blank,
+        "ms": round((time.perf_counter() - start) * 1000.0, 2),
+        "rss_mb": page_rss,
+    }
+
+
+_OCR_POOL = None
+
+
+def get_ocr_pool(workers, engine_name):
+    """Long-lived OCR worker pool, reused across documents for the life of the process."""
+    global _OCR_POOL
+    key = (workers, engine_name)
+    if _OCR_POOL is not None and _OCR_POOL[0] != key:
+        _OCR_POOL[1].shutdown(wait=True)
+        _OCR_POOL = None
+    if _OCR_POOL is None:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker, initargs=(engine_name,))
+        _OCR_POOL = (key, pool)
+    return _OCR_POOL[1]
+
+
+def ocr_pages(file_path, page_numbers, settings, poppler_path=None, workers=None):
+    """
+    Streams pages through render + OCR across the OCR worker pool, in page order.
+    At most `workers` pages are rasterised at any moment, so memory does not grow with page count.
+    """
+    global _OCR_POOL
+    workers = workers or default_ocr_workers()
+    jobs = [(file_path, page_number, settings, poppler_path) for page_number in page_numbers]
+    if workers <= 1 or len(jobs) <= 1:
+        return [ocr_page(job) for job in jobs]
+
+    try:
+        return list(get_ocr_pool(workers, settings["engine"]).map(ocr_page, jobs))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge page); start a fresh pool and retry once.
+        _OCR_POOL[1].shutdown(wait=False)
+        _OCR_POOL = None
+        return list(get_ocr_pool(workers, settings["engine"]).map(ocr_page, jobs))
+
+
+def extract_content(file_path, use_cache=None, ocr_workers=None):
+    if use_cache is None:
+        use_cache = extraction_cache.CACHE_ENABLED
     try:
         if not os.path.exists(file_path):
             return {"status": "error", "message": f"File not found: {file_path}"}
@@ -54,39 +443,79 @@ def extract_content(file_path):
         file_hash = sha256_file(file_path)
         file_size = os.path.getsize(file_path)
 
+        cache_key = None
+        if use_cache:
+            cache_key = extraction_cache.cache_key(file_hash, extraction_settings())
+            cached = extraction_cache.get(cache_key)
+            if cached is not None:
+                cached["cache"] = "hit"
+                return cached
+
         content = ""
-        extraction_method = "pdf_text"
         pages_processed = 0
         ocr_dpi = 0
         ocr_engine_version = "None"
+        ocr_page_timings_ms = []
+        ocr_page_dpi = []
+        pages_ocr_skipped = 0
+        ocr_page_rss_mb = None  # most RSS one page added in its OCR worker
+        ocr_failed_pages = []
+        warnings = []
 
-        with pdfplumber.open(file_path) as pdf:
-            pages_processed = len(pdf.pages)
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    content += text + "\n"
+        page_texts = text_layer_pages(file_path)
+        pages_processed = len(page_texts)
 
-        content = content.strip()
+        # Per-page routing: keep the text layer where it exists, OCR only the pages without one.
+        page_methods = ["pdf_text"] * pages_processed
+        ocr_targets = [n for n, text in enumerate(page_texts, start=1) if len(text.strip()) < OCR_MIN_CHARS]
+
+        if ocr_targets:
+            ocr_engine_version = tesseract_version()
 
-        if not content:
-            extraction_method = "ocr"
-            ocr_dpi = int(os.environ.get("IDMS_OCR_DPI", "300"))
             try:
-                ocr_engine_version = str(pytesseract.get_tesseract_version())
-            except Exception:
-                ocr_engine_version = "Tesseract (Unknown Version)"
+                ocr_results = ocr_pages(file_path, ocr_targets, ocr_settings(), poppler_path, workers=ocr_workers)
+            except Exception as exc:
+                # OCR is a fallback: keep whatever the text layer gave and report the pages it could not cover.
+                ocr_results = []
+                ocr_failed_pages = ocr_targets
+                for page_number in ocr_targets:
+                    page_methods[page_number - 1] = "ocr_failed"
+                warnings.append(f"OCR failed on {len(ocr_targets)} page(s): {exc}")
 
-            kwargs = {"dpi": ocr_dpi}
-            if poppler_path:
-                kwargs["poppler_path"] = poppler_path
+            for page in ocr_results:
+                ocr_page_timings_ms.append(page["ms"])
+                ocr_page_dpi.append(
+                    {"page": page["page"], "dpi": page["dpi"], "confidence": page["confidence"], "rss_mb": page["rss_mb"]}
+                )
+                ocr_dpi = max(ocr_dpi, page["dpi"])
+                if page["rss_mb"] is not None:
+                    ocr_page_rss_mb = max(ocr_page_rss_mb or 0, page["rss_mb"])
 
-            images = convert_from_path(file_path, **kwargs)
-            pages_processed = len(images)
-            for img in images:
-                content += pytesseract.image_to_string(img) + "\n"
+                index = page["page"] - 1
+                if page["blank"]:
+                    page_methods[index] = "blank_skipped"
+                    pages_ocr_skipped += 1
+                    continue
+                page_methods[index] = "ocr"
+                if len(page["text"].strip()) > len(page_texts[index].strip()):
+                    page_texts[index] = page["text"]
 
-            content = content.strip()
+        for text in page_texts:
+            if text:
+                content += text + "\n"
+        content = content.strip()
+
+        text_layer_count = page_methods.count("pdf_text")
+        if text_layer_count == pages_processed:
+            extraction_method = "pdf_text"
+        elif text_layer_count == 0:
+            extraction_method = "ocr"
+        else:
+            extraction_method = "hybrid"
+        page_extraction = [
+            {"page": n, "method": method, "chars": len(text.strip())}
+            for n, (method, text) in enumerate(zip(page_methods, page_texts), start=1)
+        ]
 
         if not content:
             return {
@@ -95,25 +524,47 @@ def extract_content(file_path):
                 "hash": file_hash,
                 "file_size_bytes": file_size,
                 "pages_processed": pages_processed,
+                "pages_ocr_skipped": pages_ocr_skipped,
                 "extraction_method": extraction_method,
-                "ocr_used": extraction_method == "ocr",
+                "text_backend": TEXT_BACKEND,
+                "page_extraction": page_extraction,
+                "ocr_used": "ocr" in page_methods,
+                "ocr_failed_pages": ocr_failed_pages,
                 "ocr_dpi": ocr_dpi,
+                "ocr_page_dpi": ocr_page_dpi,
                 "ocr_engine_version": ocr_engine_version,
+                "ocr_page_timings_ms": ocr_page_timings_ms,
+                "ocr_page_rss_mb": ocr_page_rss_mb,
                 "extracted_text_length": 0,
+                "warnings": warnings,
             }
 
-        return {
+        result = {
             "status": "success",
             "hash": file_hash,
             "file_size_bytes": file_size,
             "pages_processed": pages_processed,
+            "pages_ocr_skipped": pages_ocr_skipped,
             "content": content,
             "extraction_method": extraction_method,
-            "ocr_used": extraction_method == "ocr",
+            "text_backend": TEXT_BACKEND,
+            "page_extraction": page_extraction,
+            "ocr_used": "ocr" in page_methods,
+            "ocr_failed_pages": ocr_failed_pages,
             "ocr_dpi": ocr_dpi,
+            "ocr_page_dpi": ocr_page_dpi,
             "ocr_engine_version": ocr_engine_version,
+            "ocr_page_timings_ms": ocr_page_timings_ms,
+            "ocr_page_rss_mb": ocr_page_rss_mb,
             "extracted_text_length": len(content),
         }
+        if warnings:
+            result["warnings"] = warnings
+        if cache_key and not ocr_failed_pages:
+            # A partial extraction is not cached, so the next run retries OCR on the failed pages.
+            extraction_cache.put(cache_key, result)
+            result["cache"] = "miss"
+        return result
 
     except Exception as exc:
         return {"status": "error", "message": str(exc)}
@@ -122,7 +573,8 @@ def extract_content(file_path):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="IDMS Extractor")
     parser.add_argument("file_path", help="Path to the PDF file")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the extraction cache")
     args = parser.parse_args()
 
-    result = extract_content(args.file_path)
+    result = extract_content(args.file_path, use_cache=False if args.no_cache else None)
     print(json.dumps(result))
@@ -2,85 +2,510 @@ import os
 import sys
 import json
 import time
-import shutil
+import uuid
+import argparse
+import subprocess
 
-# FAISS and SentenceTransformers would be imported here in a real environment
-# import faiss
-# from sentence_transformers import SentenceTransformer
+import numpy as np
+
+import file_lock
+from qdrant_vectorizer import chunk_text, embed_batch, embed_texts
 
 # Model Pinned as per Directive
 MODEL_NAME = "sentence_transformers/all-MiniLM-L6-v2"
 MODEL_VERSION = "1.0.0"
+VECTOR_DIMS = 384
+
+# Paths configured in OS environment or default
+DEFAULT_INDEX_PATH = os.path.join(".antigravity", "memory", "idms_vector_index")
+DEFAULT_LOCK_PATH = os.path.join(".antigravity", "memory", "idms_vector_index.lock")
+
+# Index layout (all under the index directory):
+#   MANIFEST.json            {"version", "model", "dims", "main", "segments": [...], "committed": [...]},
+#                            swapped atomically
+#   <name>.vectors.npy       float32 (rows x dims), unit-length, memory-mapped on read
+#   <name>.ids.npz           doc_ids (str) + chunk_index (int32), one per vector row
+#   spool/                   group commit: per-writer entries waiting to be committed
+# Ingest writes a new immutable segment and appends it to the manifest, so its cost depends only
+# on the document. Compaction merges segments (and, once they are big enough, the main index)
+# into new files in the background and swaps them in with one manifest replace.
+MANIFEST_NAME = "MANIFEST.json"
+SPOOL_DIR = "spool"
+# Group commit: writers drop their vectors in the spool and whoever gets the writer lock commits
+# every waiting entry with one manifest swap. The swap is the only commit point: writers queued
+# behind it return once the manifest's "committed" list names their entry.
+GROUP_COMMIT = os.environ.get("IDMS_FAISS_GROUP_COMMIT", "1").strip().lower() in {"1", "true", "yes", "on"}
+COMPACT_SEGMENTS = int(os.environ.get("IDMS_FAISS_COMPACT_SEGMENTS", "32"))
+# Segments are folded into the main index once they hold this fraction of its rows; until then
+# they are only merged with each other, so the main index is rewritten geometrically rarely.
+COMPACT_MAIN_RATIO = float(os.environ.get("IDMS_FAISS_COMPACT_MAIN_RATIO", "0.1"))
+AUTO_COMPACT = os.environ.get("IDMS_FAISS_AUTO_COMPACT", "1").strip().lower() in {"1", "true", "yes", "on"}
+LOCK_TIMEOUT = 30  # seconds
+# Group-committed entry names are kept in the manifest, so a queued writer can confirm its entry
+# was published even after compaction has merged it away. A writer waits for at most two lock
+# timeouts after naming its entry (the name carries its creation time), so names older than
+# COMMITTED_TTL_S are dropped at the next commit; the margin covers clock skew between hosts.
+COMMITTED_TTL_S = 300
+
+_SNAPSHOT = None
+
+
+def model_id():
+    return f"{MODEL_NAME} (v{MODEL_VERSION})"
+
+
+def writer_lock(lock_path, timeout=LOCK_TIMEOUT):
+    return file_lock.locked(lock_path, timeout=timeout, label="FAISS lock")
+
+
+def read_manifest(index_path):
+    path = os.path.join(index_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"version": 0, "model": model_id(), "dims": VECTOR_DIMS, "main": None, "segments": []}
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_json_atomic(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_manifest(index_path, manifest):
+    manifest["version"] = manifest.get("version", 0) + 1
+    write_json_atomic(os.path.join(index_path, MANIFEST_NAME), manifest)
+
+
+def write_part(index_path, name, vectors, doc_ids, chunk_index):
+    """Writes an immutable part (vectors + ids); files only appear under their final names when complete."""
+    vectors_path = os.path.join(index_path, f"{name}.vectors.npy")
+    ids_path = os.path.join(index_path, f"{name}.ids.npz")
+    with open(vectors_path + ".tmp", "wb") as handle:
+        np.save(handle, np.asarray(vectors, dtype=np.float32))
+    with open(ids_path + ".tmp", "wb") as handle:
+        np.savez(handle, doc_ids=np.asarray(doc_ids, dtype=str), chunk_index=np.asarray(chunk_index, dtype=np.int32))
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(ids_path + ".tmp", ids_path)
+
+
+def read_part(index_path, name, mmap=True):
+    """Returns (vectors, doc_ids, chunk_index); vectors are memory-mapped unless mmap=False."""
+    vectors = np.load(os.path.join(index_path, f"{name}.vectors.npy"), mmap_mode="r" if mmap else None)
+    with np.load(os.path.join(index_path, f"{name}.ids.npz"), allow_pickle=False) as ids:
+        return vectors, ids["doc_ids"], ids["chunk_index"]
+
+
+def remove_part(index_path, name):
+    for suffix in (".vectors.npy", ".ids.npz"):
+        try:
+            os.remove(os.path.join(index_path, name + suffix))
+        except OSError:
+            pass
+
+
+def part_complete(directory, name):
+    """A part is complete once its ids file exists; write_part renames that one last."""
+    return os.path.exists(os.path.join(directory, f"{name}.ids.npz"))
+
+
+def merge_parts(source_dir, sources, index_path, name, keep=None):
+    """
+    Concatenates parts from source_dir into a new part in index_path, streaming through a memmap.
+    keep optionally maps a source to a boolean row mask; only the rows it selects are copied.
+    """
+    keep = keep or {}
+    total = sum(int(keep[s].sum()) if s in keep else part_rows(source_dir, s) for s in sources)
+    vectors_path = os.path.join(index_path, f"{name}.vectors.npy")
+    ids_path = os.path.join(index_path, f"{name}.ids.npz")
+    merged = np.lib.format.open_memmap(vectors_path + ".tmp", mode="w+", dtype=np.float32, shape=(total, VECTOR_DIMS))
+    doc_ids = []
+    chunk_index = []
+    offset = 0
+    for source in sources:
+        vectors, ids, chunks = read_part(source_dir, source)
+        if source in keep:
+            vectors, ids, chunks = vectors[keep[source]], ids[keep[source]], chunks[keep[source]]
+        merged[offset:offset + len(vectors)] = vectors
+        offset += len(vectors)
+        doc_ids.append(ids)
+        chunk_index.append(chunks)
+    merged.flush()
+    del merged
+    with open(ids_path + ".tmp", "wb") as handle:
+        np.savez(handle, doc_ids=np.concatenate(doc_ids), chunk_index=np.concatenate(chunk_index))
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(ids_path + ".tmp", ids_path)
+    return total
+
+
+def part_rows(index_path, name):
+    if not name:
+        return 0
+    return int(np.load(os.path.join(index_path, f"{name}.vectors.npy"), mmap_mode="r").shape[0])
+
+
+def embed_chunks(content):
+    chunks = chunk_text(content)
+    return chunks, embed_texts(chunks, dims=VECTOR_DIMS)
+
+
+def start_background_compaction(index_path, lock_path):
+    """Launches a detached compaction process; the ingest path never waits for it."""
+    script = os.path.abspath(__file__)
+    subprocess.Popen(
+        [sys.executable, script, "--compact", "--index-path", index_path, "--lock-path", lock_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def publish_segment(index_path, segment):
+    """Appends one segment to the manifest. Caller holds the writer lock."""
+    manifest = read_manifest(index_path)
+    if manifest.get("model") != model_id():
+        return {"status": "error", "message": f"Index was built with {manifest.get('model')}, expected {model_id()}."}
+    manifest["segments"].append(segment)
+    write_manifest(index_path, manifest)
+    return {"status": "success", "commit": "self", "group_size": 1, "segments": len(manifest["segments"])}
+
+
+def claim_spool_entry(spool, index_path, name):
+    """
+    Moves a complete spool entry into the index, ids file (the completion marker) first. False if a
+    writer that timed out withdrew it meanwhile; any half-moved file is removed.
+    """
+    try:
+        os.replace(os.path.join(spool, f"{name}.ids.npz"), os.path.join(index_path, f"{name}.ids.npz"))
+    except FileNotFoundError:
+        return False
+    try:
+        os.replace(os.path.join(spool, f"{name}.vectors.npy"), os.path.join(index_path, f"{name}.vectors.npy"))
+    except FileNotFoundError:
+        remove_part(index_path, name)
+        return False
+    return True
+
+
+def entry_time_ns(name):
+    try:
+        return int(name.split("-")[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def recent_committed(names):
+    cutoff = time.time_ns() - COMMITTED_TTL_S * 1_000_000_000
+    return [name for name in names if entry_time_ns(name) >= cutoff]
+
+
+def withdraw_spool_entry(spool, name):
+    """
+    Removes a writer's own spool entry, ids file (the claim marker) first. False once a lock holder
+    has claimed it: the entry is then committed by that holder, or by whoever holds the lock next.
+    """
+    try:
+        os.remove(os.path.join(spool, f"{name}.ids.npz"))
+    except FileNotFoundError:
+        return False
+    remove_part(spool, name)
+    return True
+
+
+def commit_spool(index_path, entry):
+    """
+    Group commit. Caller holds the writer lock. Every complete spool entry is moved into the index
+    (a rename, no copy) and the whole group is published by a single manifest swap, which is the
+    only commit point. `entry` counts as committed only once the manifest lists it: a writer whose
+    entry was moved out of the spool by a holder that died before the swap publishes it itself.
+    """
+    manifest = read_manifest(index_path)
+    if manifest.get("model") != model_id():
+        return {"status": "error", "message": f"Index was built with {manifest.get('model')}, expected {model_id()}."}
+    if entry in manifest.get("committed", []):
+        return {"status": "success", "commit": "group"}
+
+    spool = os.path.join(index_path, SPOOL_DIR)
+    batch = []
+    if not part_complete(spool, entry):
+        if not part_complete(index_path, entry):
+            return {"status": "error", "message": f"Spool entry {entry} disappeared before it was committed."}
+        batch.append(entry)
+
+    waiting = sorted(
+        name[:-len(".ids.npz")] for name in os.listdir(spool)
+        if name.endswith(".ids.npz")
+    )
+    batch.extend(name for name in waiting if claim_spool_entry(spool, index_path, name))
+    if entry not in batch:
+        return {"status": "error", "message": f"Spool entry {entry} disappeared before it was committed."}
+
+    manifest["segments"].extend(batch)
+    manifest["committed"] = recent_committed(manifest.get("committed", [])) + batch
+    write_manifest(index_path, manifest)
+    return {"status": "success", "commit": "self", "group_size": len(batch), "segments": len(manifest["segments"])}
+
+
+def finish_claimed_entry(index_path, lock_path, entry):
+    """
+    Waits out a claimed entry: the claiming holder publishes it, or, if it died before its swap, the
+    next commit_spool does. Without the lock, the manifest's committed list is the answer.
+    """
+    try:
+        with writer_lock(lock_path):
+            return commit_spool(index_path, entry)
+    except TimeoutError as exc:
+        if entry in read_manifest(index_path).get("committed", []):
+            return {"status": "success", "commit": "group"}
+        return {"status": "error", "message": f"{exc} Entry {entry} was claimed by the lock holder and is not committed yet."}
+
 
-def update_vector_index(doc_id, content, index_path, lock_path):
+def update_vector_index(doc_id, content, index_path=DEFAULT_INDEX_PATH, lock_path=DEFAULT_LOCK_PATH, group_commit=None):
     """
-    Updates the local FAISS index with a new vector.
-    Enforces atomic shadow-file writing and a single-writer lock.
+    Appends a document's chunk vectors to the local index as a new segment.
+    Enforces atomic manifest swaps and a single-writer lock.
     """
     try:
-        # 1. Enforce Single-Writer Lock
-        lock_timeout = 30 # seconds
-        start_time = time.time()
-        while os.path.exists(lock_path):
-            if time.time() - start_time > lock_timeout:
-                return {"status": "error", "message": "FAISS lock timeout."}
-            time.sleep(0.5)
-        
-        # Create lock
-        with open(lock_path, "w") as f:
-            f.write(str(os.getpid()))
+        chunks, vectors = embed_chunks(content)
+        if not chunks:
+            return {"status": "success", "doc_id": doc_id, "chunks_indexed": 0, "index_path": index_path,
+                    "model": model_id(), "message": "No content to index."}
+
+        os.makedirs(index_path, exist_ok=True)
+        group_commit = GROUP_COMMIT if group_commit is None else group_commit
+        # Vectors are written outside the lock: they are invisible until the manifest names them.
+        entry = f"seg-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        target_dir = os.path.join(index_path, SPOOL_DIR) if group_commit else index_path
+        os.makedirs(target_dir, exist_ok=True)
+        write_part(target_dir, entry, vectors, [doc_id] * len(chunks), range(len(chunks)))
 
         try:
-            # 2. Chunking Strategy (Placeholder)
-            # Window size 512, 10% overlap
-            # chunks = chunk_text(content, window=512, overlap=51)
-
-            # 3. Embedding Generation (Placeholder)
-            # model = SentenceTransformer(MODEL_NAME)
-            # vector = model.encode(content)
-
-            # 4. Atomic Shadow-File Write
-            shadow_index_path = index_path + ".tmp"
-            
-            # Mock loading existing index and adding vector
-            # if os.path.exists(index_path):
-            #     index = faiss.read_index(index_path)
-            # else:
-            #     index = faiss.IndexIDMap(faiss.IndexFlatL2(d))
-            
-            # index.add_with_ids(vector, doc_id_as_int)
-            # faiss.write_index(index, shadow_index_path)
-
-            # Perform atomic swap
-            # shutil.move(shadow_index_path, index_path)
-
-            return {
-                "status": "success",
-                "doc_id": doc_id,
-                "index_path": index_path,
-                "model": f"{MODEL_NAME} (v{MODEL_VERSION})",
-                "message": "Vector indexed successfully (Shadow-file swap complete)."
-            }
-
-        finally:
-            # Always release lock
-            if os.path.exists(lock_path):
-                os.remove(lock_path)
+            with writer_lock(lock_path):
+                if group_commit:
+                    commit = commit_spool(index_path, entry)
+                else:
+                    commit = publish_segment(index_path, entry)
+        except TimeoutError as exc:
+            if not group_commit or withdraw_spool_entry(target_dir, entry):
+                remove_part(target_dir, entry)
+                return {"status": "error", "message": str(exc)}
+            # The lock holder already claimed the entry, so reporting an error would make the caller
+            # index the document twice: see the commit through instead.
+            commit = finish_claimed_entry(index_path, lock_path, entry)
+
+        if commit.get("status") == "error":
+            remove_part(target_dir, entry)
+            return commit
+
+        segments = commit.get("segments")
+        compaction = segments is not None and segments >= COMPACT_SEGMENTS
+        if compaction and AUTO_COMPACT:
+            start_background_compaction(index_path, lock_path)
+
+        return {
+            "status": "success",
+            "doc_id": doc_id,
+            "index_path": index_path,
+            "chunks_indexed": len(chunks),
+            "commit": commit["commit"],
+            "group_size": commit.get("group_size", 0),
+            "segments": segments,
+            "compaction_scheduled": compaction and AUTO_COMPACT,
+            "model": model_id(),
+            "message": "Vector indexed successfully (segment appended, manifest swap complete).",
+        }
 
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+
+def compact(index_path=DEFAULT_INDEX_PATH, lock_path=DEFAULT_LOCK_PATH):
+    """
+    Merges the current segments into one new part, folding in the main index once the segments
+    are large enough relative to it. Readers keep serving from the old files until the manifest
+    swap; parts that are no longer referenced are deleted afterwards.
+    """
+    try:
+        with file_lock.locked(os.path.join(index_path, "compact.lock"), timeout=0, label="Compaction lock"):
+            return compact_locked(index_path, lock_path)
+    except TimeoutError:
+        return {"status": "success", "message": "Compaction already running."}
+
+
+def compact_locked(index_path, lock_path):
+    try:
+        manifest = read_manifest(index_path)
+        segments = list(manifest["segments"])
+        if len(segments) < 2 and not (segments and manifest["main"] is None):
+            return {"status": "success", "message": "Nothing to compact.", "segments": len(segments)}
+
+        main = manifest["main"]
+        main_rows = part_rows(index_path, main)
+        segment_rows = sum(part_rows(index_path, s) for s in segments)
+        fold_main = main is None or segment_rows >= main_rows * COMPACT_MAIN_RATIO
+        sources = ([main] if fold_main and main else []) + segments
+
+        name = f"{'main' if fold_main else 'seg'}-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        total = merge_parts(index_path, sources, index_path, name)
+
+        with writer_lock(lock_path):
+            current = read_manifest(index_path)
+            # Segments appended while we were merging stay in the manifest, after the merged part.
+            remaining = [s for s in current["segments"] if s not in segments]
+            if fold_main:
+                current["main"] = name
+                current["segments"] = remaining
+            else:
+                current["segments"] = [name] + remaining
+            write_manifest(index_path, current)
+
+        for source in sources:
+            remove_part(index_path, source)
+        swept = sweep_orphans(index_path, current)
+
+        return {
+            "status": "success",
+            "merged_parts": len(sources),
+            "rows": total,
+            "into_main": fold_main,
+            "part": name,
+            "orphans_removed": swept,
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def sweep_orphans(index_path, manifest, min_age_s=3600):
+    """Removes parts left behind by writers that died before publishing them in the manifest."""
+    live = set(manifest["segments"]) | {manifest["main"]}
+    removed = 0
+    cutoff = time.time() - min_age_s
+    for filename in os.listdir(index_path):
+        path = os.path.join(index_path, filename)
+        if filename.endswith(".tmp") and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+        if not filename.endswith(".vectors.npy"):
+            continue
+        name = filename[:-len(".vectors.npy")]
+        if name not in live and os.path.getmtime(path) < cutoff:
+            remove_part(index_path, name)
+            removed += 1
+
+    # Spool entries whose writer died mid-write never became complete and are never committed.
+    spool = os.path.join(index_path, SPOOL_DIR)
+    if os.path.isdir(spool):
+        for filename in os.listdir(spool):
+            path = os.path.join(spool, filename)
+            name = filename.split(".", 1)[0]
+            if os.path.getmtime(path) < cutoff and (filename.endswith(".tmp") or not part_complete(spool, name)):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def load_index(index_path=DEFAULT_INDEX_PATH):
+    """
+    Returns the searchable snapshot {version, parts: [(vectors, doc_ids, chunk_index)]}, re-read only
+    when the manifest changes. The main index is memory-mapped, so loading it is O(1).
+    """
+    global _SNAPSHOT
+    manifest_path = os.path.join(index_path, MANIFEST_NAME)
+    try:
+        st = os.stat(manifest_path)
+        key = (index_path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return {"key": None, "version": 0, "parts": []}
+    if _SNAPSHOT is not None and _SNAPSHOT["key"] == key:
+        return _SNAPSHOT
+
+    # A compaction can delete parts between reading the manifest and opening them; re-read once.
+    for attempt in range(2):
+        manifest = read_manifest(index_path)
+        names = ([manifest["main"]] if manifest["main"] else []) + manifest["segments"]
+        try:
+            parts = [read_part(index_path, name) for name in names]
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+    _SNAPSHOT = {"key": key, "version": manifest["version"], "parts": parts}
+    return _SNAPSHOT
+
+
+def search(query, top_k=5, index_path=DEFAULT_INDEX_PATH):
+    """Exact inner-product (cosine) search across the main index and all live segments."""
+    try:
+        start = time.perf_counter()
+        snapshot = load_index(index_path)
+        q = embed_batch([query], dims=VECTOR_DIMS)[0]
+
+        candidates = []
+        for vectors, doc_ids, chunk_index in snapshot["parts"]:
+            if not len(vectors):
+                continue
+            scores = np.asarray(vectors @ q)
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend((float(scores[i]), str(doc_ids[i]), int(chunk_index[i])) for i in top)
+
+        candidates.sort(key=lambda c: -c[0])
+        return {
+            "status": "success",
+            "query": query,
+            "index_version": snapshot["version"],
+            "parts": len(snapshot["parts"]),
+            "results": [
+                {"doc_id": doc_id, "chunk_index": chunk, "score": round(score, 4)}
+                for score, doc_id, chunk in candidates[:top_k]
+            ],
+            "latency_ms": round((time.perf_counter() - start) * 1000.0, 3),
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def stats(index_path=DEFAULT_INDEX_PATH):
+    manifest = read_manifest(index_path)
+    return {
+        "status": "success",
+        "index_path": index_path,
+        "model": manifest.get("model"),
+        "version": manifest.get("version"),
+        "main_rows": part_rows(index_path, manifest["main"]),
+        "segments": len(manifest["segments"]),
+        "segment_rows": sum(part_rows(index_path, s) for s in manifest["segments"]),
+    }
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print(json.dumps({"status": "error", "message": "Usage: faiss_vectorizer.py <doc_id> <content>"}))
-        sys.exit(1)
+    if len(sys.argv) >= 2 and not sys.argv[1].startswith("--"):
+        if len(sys.argv) < 3:
+            print(json.dumps({"status": "error", "message": "Usage: faiss_vectorizer.py <doc_id> <content>"}))
+            sys.exit(1)
+        result = update_vector_index(sys.argv[1], sys.argv[2])
+        print(json.dumps(result))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="IDMS local vector index")
+    parser.add_argument("--compact", action="store_true", help="Merge segments into the main index")
+    parser.add_argument("--search", help="Query text")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--index-path", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--lock-path", default=DEFAULT_LOCK_PATH)
+    args = parser.parse_args()
 
-    doc_id = sys.argv[1]
-    content = sys.argv[2]
-    
-    # Paths configured in OS environment or default
-    index_path = os.path.join(".antigravity", "memory", "idms_vector_index.faiss")
-    lock_path = os.path.join(".antigravity", "memory", "idms_vector_index.lock")
-    
-    result = update_vector_index(doc_id, content, index_path, lock_path)
+    if args.compact:
+        result = compact(args.index_path, args.lock_path)
+    elif args.search:
+        result = search(args.search, args.top_k, args.index_path)
+    else:
+        result = stats(args.index_path)
     print(json.dumps(result))
+    if result.get("status") != "success":
+        sys.exit(1)
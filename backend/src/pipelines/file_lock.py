@@ -0,0 +1,149 @@
+import os
+import time
+import socket
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Single-writer locks for on-disk stores shared by pipeline workers.
+# With fcntl the lock is a kernel advisory flock on a lock file that is never deleted: the kernel
+# drops it the moment the owner exits, however it dies. Without fcntl the lock is the file's
+# existence (exclusive create), and a lock whose recorded owner is no longer running on this host
+# is treated as stale and broken. Liveness is only ever queried, never signalled: on Windows
+# os.kill(pid, 0) terminates the process.
+POLL_MIN_S = 0.001
+POLL_MAX_S = 0.005
+
+
+def owner_tag():
+    return f"{os.getpid()}@{socket.gethostname()}"
+
+
+def read_owner(lock_path):
+    try:
+        with open(lock_path, "r", encoding="utf-8") as handle:
+            return handle.read().strip() or None
+    except OSError:
+        return None
+
+
+def owner_alive(owner):
+    """False only when the owner is known to be gone (same host, pid no longer running)."""
+    try:
+        pid_text, host = owner.split("@", 1)
+        pid = int(pid_text)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return True
+    return pid_running(pid)
+
+
+def pid_running(pid):
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name == "nt":
+        return windows_pid_running(pid)
+    try:
+        os.kill(pid, 0)  # POSIX signal 0: existence check only, nothing is delivered
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def windows_pid_running(pid):
+    import ctypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    ERROR_ACCESS_DENIED = 5
+    STILL_ACTIVE = 259
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # Access denied means the process exists but belongs to someone else.
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def try_flock(fd):
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def try_create(lock_path):
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        owner = read_owner(lock_path)
+        if owner is not None and not owner_alive(owner):
+            # Stale: the recorded owner died without releasing. Break it and retry next poll.
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+        return None
+    os.write(fd, owner_tag().encode("utf-8"))
+    return fd
+
+
+@contextmanager
+def locked(lock_path, timeout=30, label="Lock"):
+    """
+    Holds lock_path exclusively for the duration of the block.
+    Waits up to `timeout` seconds (0 = single attempt) with short exponential back-off, then
+    raises TimeoutError naming the current owner.
+    """
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    deadline = time.monotonic() + timeout
+    delay = POLL_MIN_S
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+    try:
+        while True:
+            if fcntl:
+                if try_flock(fd):
+                    break
+            else:
+                fd = try_create(lock_path)
+                if fd is not None:
+                    break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{label} timeout (held by {read_owner(lock_path) or 'unknown'}).")
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_S)
+
+        if fcntl:
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, owner_tag().encode("utf-8"), 0)
+        try:
+            yield
+        finally:
+            if fcntl:
+                os.ftruncate(fd, 0)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.close(fd)
+                fd = None
+                os.remove(lock_path)
+    finally:
+        if fd is not None:
+            os.close(fd)
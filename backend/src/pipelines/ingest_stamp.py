@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+
+# Writers rewrite this stamp after committing new chunks; search_service drops its cached results
+# whenever the stamp's content changes. Standard library only, so every writer can afford it.
+INGEST_STAMP_PATH = os.environ.get("IDMS_INGEST_STAMP_PATH", os.path.join(".antigravity", "memory", "idms_ingest.stamp"))
+
+
+def mark_ingested(path=None):
+    """
+    Rewrites the stamp. Called after the write it announces has committed, so a failure here is
+    reported on stderr and returned, never raised: the data is persisted either way, and search
+    caches only serve stale results until the next successful stamp.
+    """
+    path = path or INGEST_STAMP_PATH
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(f"{time.time():.6f} {uuid.uuid4().hex}")
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        sys.stderr.write(json.dumps({"event": "warning", "message": f"Ingest stamp not updated: {exc}"}) + "\n")
+        return str(exc)
+    return None
+
+
+def read_ingest_stamp(path=None):
+    # The stamp's content, not its mtime, marks an ingest: synced drives keep coarse timestamps.
+    try:
+        with open(path or INGEST_STAMP_PATH, "r", encoding="utf-8") as handle:
+            return handle.read()
+    except OSError:
+        return None
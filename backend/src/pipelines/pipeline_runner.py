@@ -1,10 +1,17 @@
 import os
 import sys
 import json
+import time
 import uuid
+import shutil
+import tempfile
+import traceback
 import argparse
+import importlib
 import subprocess
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,6 +24,29 @@ EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2 (v1.0.0)"
 
 WRITE_POSTGRES = os.environ.get("IDMS_WRITE_POSTGRES", "0").strip().lower() in {"1", "true", "yes", "on"}
 WRITE_QDRANT = os.environ.get("IDMS_WRITE_QDRANT", "0").strip().lower() in {"1", "true", "yes", "on"}
+# Second-stage centroid lookup for documents the rules would send to review, and learning
+# from auto-filed / reviewer-approved documents to grow the centroids.
+CENTROID_FALLBACK = os.environ.get("IDMS_CENTROID_FALLBACK", "1").strip().lower() in {"1", "true", "yes", "on"}
+CENTROID_LEARN = os.environ.get("IDMS_CENTROID_LEARN", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+# "inprocess" imports the stage functions once and passes Python objects between them;
+# "subprocess" runs every stage in its own interpreter for isolation.
+STAGE_MODES = ("inprocess", "subprocess")
+STAGE_MODE = os.environ.get("IDMS_STAGE_MODE", "inprocess").strip().lower()
+
+# Stage name -> (script, module, entry point)
+STAGES = {
+    "extractor": ("extractor.py", "extractor", "extract_content"),
+    "categorizer": ("categorizer.py", "categorizer", "categorize_document"),
+    "renamer": ("renamer.py", "renamer", "generate_filename"),
+    "sheets_logger": ("sheets_logger.py", "sheets_logger", "log_to_sheets"),
+    "faiss_vectorizer": ("faiss_vectorizer.py", "faiss_vectorizer", "update_vector_index"),
+    "postgres_logger": ("postgres_logger.py", "postgres_logger", "log_to_postgres"),
+    "qdrant_vectorizer": ("qdrant_vectorizer.py", "qdrant_vectorizer", "index_document"),
+    "archiver": ("archiver.py", "archiver", "archive_file"),
+    "centroid_classifier": ("centroid_classifier.py", "centroid_classifier", "classify"),
+    "centroid_learner": ("centroid_classifier.py", "centroid_classifier", "learn_document"),
+}
 
 
 def run_step(script_name, *args):
@@ -47,28 +77,59 @@ def run_step(script_name, *args):
         return {"status": "error", "message": str(exc)}
 
 
-def process_file(file_path, dry_run=False, verbose=False, overrides=None):
+def load_stage(name):
+    """Imports a pipeline step module once and returns its entry point."""
+    _, module_name, func_name = STAGES[name]
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def run_stage(name, *args, mode=None):
+    """Runs a pipeline step in-process or as a subprocess, returning its result dict."""
+    mode = mode or STAGE_MODE
+    if mode == "subprocess":
+        script_name = STAGES[name][0]
+        argv = [arg if isinstance(arg, str) else json.dumps(arg) for arg in args]
+        return run_step(script_name, *argv)
+
+    try:
+        return load_stage(name)(*args)
+    except Exception as exc:
+        return {"status": "error", "message": str(exc)}
+
+
+def aborted_result(message, extraction=None):
+    """Builds the per-file result used when a document cannot be processed."""
+    extraction = extraction or {}
+    return {
+        "status": "aborted",
+        "message": message,
+        "hash": extraction.get("hash", "None"),
+        "confidence": 0,
+        "routing": "review",
+        "telemetry": {
+            "file_size_bytes": extraction.get("file_size_bytes", 0),
+            "pages_processed": extraction.get("pages_processed", 0),
+            "pages_ocr_skipped": extraction.get("pages_ocr_skipped", 0),
+            "extraction_method": extraction.get("extraction_method", "failed"),
+            "ocr_used": extraction.get("ocr_used", False),
+            "ocr_dpi": extraction.get("ocr_dpi", 0),
+            "ocr_page_rss_mb": extraction.get("ocr_page_rss_mb"),
+            "extracted_text_length": 0,
+            "confidence": 0,
+            "embedding_model": EMBEDDING_MODEL,
+        },
+    }
+
+
+def process_file(file_path, dry_run=False, verbose=False, overrides=None, stage_mode=None):
     filename = os.path.basename(file_path)
 
-    extraction = run_step("extractor.py", file_path)
+    extraction = run_stage("extractor", file_path, mode=stage_mode)
     if extraction.get("status") == "error":
-        return {
-            "status": "aborted",
-            "message": extraction.get("message", "Extraction failed"),
-            "hash": extraction.get("hash", "None"),
-            "confidence": 0,
-            "routing": "review",
-            "telemetry": {
-                "file_size_bytes": extraction.get("file_size_bytes", 0),
-                "pages_processed": extraction.get("pages_processed", 0),
-                "extraction_method": extraction.get("extraction_method", "failed"),
-                "ocr_used": extraction.get("ocr_used", False),
-                "ocr_dpi": extraction.get("ocr_dpi", 0),
-                "extracted_text_length": 0,
-                "confidence": 0,
-                "embedding_model": EMBEDDING_MODEL,
-            },
-        }
+        return aborted_result(extraction.get("message", "Extraction failed"), extraction)
 
     content = extraction["content"]
     file_hash = extraction["hash"]
@@ -80,7 +141,7 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
     ocr_engine_version = extraction["ocr_engine_version"]
     extracted_text_length = extraction["extracted_text_length"]
 
-    cat_res = run_step("categorizer.py", content)
+    cat_res = run_stage("categorizer", content, mode=stage_mode)
     if cat_res.get("status") == "error":
         return cat_res
 
@@ -100,12 +161,26 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
     if entity_confidence < 0.85 or confidence < 0.85:
         routing = "review"
 
+    # Second stage: a near-duplicate of already-filed documents inherits their label.
+    classifier = "rules"
+    centroid_similarity = None
+    if routing == "review" and not overrides and CENTROID_FALLBACK:
+        centroid_res = run_stage("centroid_classifier", content, mode=stage_mode)
+        centroid_similarity = centroid_res.get("similarity")
+        if centroid_res.get("status") == "success" and centroid_res.get("match"):
+            category = centroid_res["category"]
+            doc_type = centroid_res["doc_type"]
+            entity = centroid_res["entity"]
+            confidence = entity_confidence = centroid_res["similarity"]
+            classifier = "centroid"
+            routing = "auto"
+
     date_val = overrides.get("date") if overrides else None
     rename_args = [doc_type, entity, "Import", "pdf"]
     if date_val:
         rename_args.append(date_val)
 
-    rename_res = run_step("renamer.py", *rename_args)
+    rename_res = run_stage("renamer", *rename_args, mode=stage_mode)
     if rename_res.get("status") == "error":
         return rename_res
 
@@ -128,20 +203,27 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
         "status": "preview" if dry_run else ("processed" if routing == "auto" else "review"),
         "hash": file_hash,
         "pages_processed": pages_processed,
+        "pages_ocr_skipped": extraction.get("pages_ocr_skipped", 0),
         "extraction_method": extraction_method,
+        "page_extraction": extraction.get("page_extraction", []),
         "ocr_used": ocr_used,
         "ocr_dpi": ocr_dpi,
+        "ocr_page_dpi": extraction.get("ocr_page_dpi", []),
         "ocr_engine_version": ocr_engine_version,
+        "ocr_page_timings_ms": extraction.get("ocr_page_timings_ms", []),
+        "ocr_page_rss_mb": extraction.get("ocr_page_rss_mb"),
         "extracted_text_length": extracted_text_length,
         "embedding_model": EMBEDDING_MODEL,
         "signals_detected": cat_res.get("signals_detected", []),
+        "classifier": classifier,
+        "centroid_similarity": centroid_similarity,
         "hash_valid": is_hash_valid,
     }
 
     if dry_run:
         side_effects = [
             {"step": "Sheets Logger", "action": f"Append Row (Simulated - {routing})"},
-            {"step": "FAISS Vectorizer", "action": "Atomic Index Update (Simulated)"},
+            {"step": "FAISS Vectorizer", "action": "Append Index Segment (Simulated)"},
             {"step": "Archiver", "action": "Move File (Simulated)", "destination": metadata["path"]},
         ]
         if WRITE_POSTGRES:
@@ -154,12 +236,14 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
             "routing_decision": routing,
             "file_size_bytes": file_size,
             "pages_processed": pages_processed,
+            "pages_ocr_skipped": extraction.get("pages_ocr_skipped", 0),
             "extraction_method": extraction_method,
             "ocr_used": ocr_used,
             "ocr_dpi": ocr_dpi,
             "extracted_text_length": extracted_text_length,
             "confidence": confidence,
             "entity_confidence": entity_confidence,
+            "classifier": classifier,
             "embedding_model": EMBEDDING_MODEL,
             "proposed_metadata": metadata,
             "proposed_side_effects": side_effects,
@@ -168,7 +252,7 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
     is_in_review = os.path.abspath(file_path).startswith(os.path.abspath(REVIEW_DIR))
     if routing == "review" and not is_in_review:
         dest_dir = REVIEW_DIR
-        run_step("archiver.py", file_path, dest_dir, file_hash)
+        run_stage("archiver", file_path, dest_dir, file_hash, mode=stage_mode)
         return {
             "status": "review",
             "message": "Low confidence or entity mismatch, routed to review.",
@@ -177,17 +261,17 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
         }
 
     # Existing integrations retained
-    log_res = run_step("sheets_logger.py", json.dumps(metadata))
+    log_res = run_stage("sheets_logger", metadata, mode=stage_mode)
     if log_res.get("status") == "error":
         return log_res
 
-    vector_res = run_step("faiss_vectorizer.py", doc_id, content)
+    vector_res = run_stage("faiss_vectorizer", doc_id, content, mode=stage_mode)
     if vector_res.get("status") == "error":
         return vector_res
 
     # New durable persistence path
     if WRITE_POSTGRES:
-        pg_res = run_step("postgres_logger.py", json.dumps(metadata), content)
+        pg_res = run_stage("postgres_logger", metadata, content, mode=stage_mode)
         if pg_res.get("status") == "error":
             return {
                 "status": "error",
@@ -197,26 +281,220 @@ def process_file(file_path, dry_run=False, verbose=False, overrides=None):
 
     qdrant_warning = None
     if WRITE_QDRANT:
-        qdrant_res = run_step("qdrant_vectorizer.py", doc_id, content, json.dumps(metadata))
+        qdrant_res = run_stage("qdrant_vectorizer", doc_id, content, metadata, mode=stage_mode)
         if qdrant_res.get("status") == "error":
             qdrant_warning = qdrant_res.get("message")
 
     dest_dir = f"06-long-term-memory/{category}"
-    archive_res = run_step("archiver.py", file_path, dest_dir, file_hash, new_filename)
+    archive_res = run_stage("archiver", file_path, dest_dir, file_hash, new_filename, mode=stage_mode)
     archive_res["metadata"] = metadata
+    warnings = list(extraction.get("warnings", []))
     if qdrant_warning:
-        archive_res["warnings"] = [f"Qdrant indexing warning: {qdrant_warning}"]
+        warnings.append(f"Qdrant indexing warning: {qdrant_warning}")
+
+    # Only confidently ruled or reviewer-approved labels feed the centroids, never the
+    # centroid stage's own guesses. Overrides force confidence to 1.0, so with overrides only a
+    # reviewer-set (or confirmed) category/doc_type counts; a date or doc_id fix leaves the rules' guess.
+    if overrides:
+        learn = any(overrides.get(key) for key in ("category", "doc_type"))
+    else:
+        learn = classifier == "rules" and routing == "auto"
+    if CENTROID_LEARN and learn and archive_res.get("status") != "error":
+        label = {"category": category, "entity": entity, "doc_type": doc_type}
+        learn_res = run_stage("centroid_learner", content, label, mode=stage_mode)
+        if learn_res.get("status") == "error":
+            warnings.append(f"Centroid update warning: {learn_res.get('message')}")
+
+    if warnings:
+        archive_res["warnings"] = warnings
     return archive_res
 
 
+def process_file_isolated(file_path, dry_run=False, verbose=False, stage_mode=None):
+    """process_file wrapper that turns unexpected exceptions into an aborted result."""
+    try:
+        return process_file(file_path, dry_run=dry_run, verbose=verbose, stage_mode=stage_mode)
+    except Exception as exc:
+        return aborted_result(f"Unhandled error processing {os.path.basename(file_path)}: {exc}")
+
+
+def process_file_claimed(file_path, marker_path, dry_run=False, verbose=False, stage_mode=None):
+    """Batch worker entry point: records that the file was picked up before any stage runs."""
+    with open(marker_path, "w", encoding="utf-8") as handle:
+        handle.write(str(os.getpid()))
+    return process_file_isolated(file_path, dry_run, verbose, stage_mode)
+
+
+def init_batch_worker(workers):
+    # The extractor sizes its OCR pool by the batch workers sharing the machine; subprocess
+    # stages inherit the variable.
+    os.environ["IDMS_BATCH_WORKERS"] = str(workers)
+
+
+def run_pool(files, markers, workers, dry_run, verbose, stage_mode):
+    """
+    Runs files on one process pool. Returns (results, unfinished): files whose future never
+    resolved because a worker died hard (segfault, OOM kill) and broke the pool.
+    """
+    results = {}
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(files)), initializer=init_batch_worker, initargs=(workers,)) as pool:
+        futures = {
+            pool.submit(process_file_claimed, f, markers[f], dry_run, verbose, stage_mode): f
+            for f in files
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                results[file_path] = future.result()
+            except BrokenProcessPool:
+                unfinished.append(file_path)
+            except Exception as exc:
+                results[file_path] = aborted_result(f"Worker failed: {exc}")
+    return results, unfinished
+
+
+def process_batch(files, workers=1, dry_run=False, verbose=False, stage_mode=None):
+    """
+    Processes files across a bounded process pool.
+    Results are returned in sorted file order regardless of completion order.
+    """
+    files = sorted(files)
+    if workers <= 1 or len(files) <= 1:
+        return [process_file_isolated(f, dry_run, verbose, stage_mode) for f in files]
+
+    marker_dir = tempfile.mkdtemp(prefix="idms-batch-")
+    markers = {f: os.path.join(marker_dir, f"{i}.started") for i, f in enumerate(files)}
+    results = {}
+    pending = files
+    try:
+        while pending:
+            done, unfinished = run_pool(pending, markers, workers, dry_run, verbose, stage_mode)
+            results.update(done)
+            # A file that was in flight when the pool broke may already have written Sheets,
+            # vector or Postgres rows, or been archived: report it, never re-run it. Files no
+            # worker picked up yet go to a fresh pool.
+            started = [f for f in unfinished if os.path.exists(markers[f])]
+            for file_path in started:
+                results[file_path] = aborted_result(
+                    "Worker crashed while processing this file (not retried; earlier steps may have completed)."
+                )
+            pending = [f for f in unfinished if f not in started]
+            if pending and not done and not started:
+                for file_path in pending:
+                    results[file_path] = aborted_result("Worker pool failed before starting this file.")
+                pending = []
+    finally:
+        shutil.rmtree(marker_dir, ignore_errors=True)
+
+    return [results[f] for f in files]
+
+
+def warm_up(stage_mode=None):
+    """Imports every in-process stage and primes shared state before the first job."""
+    warnings = []
+    if (stage_mode or STAGE_MODE) != "inprocess":
+        return warnings
+
+    for name in STAGES:
+        try:
+            load_stage(name)
+        except Exception as exc:
+            warnings.append(f"{name}: {exc}")
+
+    extractor = sys.modules.get("extractor")
+    if extractor is not None:
+        extractor.configure_tesseract()
+    return warnings
+
+
+def serve(stage_mode=None):
+    """
+    Long-lived worker: reads JSON-lines jobs from stdin and streams JSON-lines events to stdout.
+    Job: {"execution_id", "file", "dry_run"?, "overrides"?} or {"command": "shutdown"}.
+    Events: ready, started, result (with exit_code/stdout/stderr mirroring a one-shot run).
+    """
+    protocol = sys.stdout
+    # Anything a stage prints must not corrupt the protocol stream.
+    sys.stdout = sys.stderr
+
+    def emit(event):
+        protocol.write(json.dumps(event) + "\n")
+        protocol.flush()
+
+    warnings = warm_up(stage_mode)
+    emit({"event": "ready", "pid": os.getpid(), "stage_mode": stage_mode or STAGE_MODE, "warnings": warnings})
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError:
+            emit({"event": "error", "message": "Invalid job JSON."})
+            continue
+
+        if job.get("command") == "shutdown":
+            break
+
+        execution_id = job.get("execution_id")
+        if not job.get("file"):
+            emit({"event": "result", "execution_id": execution_id, "exit_code": 1, "stdout": "", "stderr": "Job has no file."})
+            continue
+
+        emit({"event": "started", "execution_id": execution_id})
+        start = time.perf_counter()
+        try:
+            result = process_file(
+                job["file"],
+                dry_run=bool(job.get("dry_run")),
+                overrides=job.get("overrides"),
+                stage_mode=stage_mode,
+            )
+            exit_code, stdout, stderr = 0, json.dumps(result), ""
+        except Exception:
+            exit_code, stdout, stderr = 1, "", traceback.format_exc()
+
+        emit({
+            "event": "result",
+            "execution_id": execution_id,
+            "exit_code": exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+            "runtime_ms": round((time.perf_counter() - start) * 1000.0, 2),
+        })
+
+
 def main():
     parser = argparse.ArgumentParser(description="IDMS Pipeline Runner (Execution Layer)")
     parser.add_argument("--file", help="Process a single file")
     parser.add_argument("--dry-run", action="store_true", help="Simulate execution without side effects")
     parser.add_argument("--verbose", action="store_true", help="Enable detailed logging")
     parser.add_argument("--overrides", help="JSON string of metadata overrides for review")
+    parser.add_argument(
+        "--stage-mode",
+        choices=STAGE_MODES,
+        default=None,
+        help="Run steps in-process (default) or as isolated subprocesses",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("IDMS_BATCH_WORKERS", "1")),
+        help="Inbox batch mode: number of parallel worker processes (0 = one per CPU core)",
+    )
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived JSON-lines worker on stdin/stdout")
     args = parser.parse_args()
 
+    if args.serve:
+        serve(stage_mode=args.stage_mode)
+        return
+
     overrides = None
     if args.overrides:
         try:
@@ -226,7 +504,13 @@ def main():
             sys.exit(1)
 
     if args.file:
-        result = process_file(args.file, dry_run=args.dry_run, verbose=args.verbose, overrides=overrides)
+        result = process_file(
+            args.file,
+            dry_run=args.dry_run,
+            verbose=args.verbose,
+            overrides=overrides,
+            stage_mode=args.stage_mode,
+        )
         print(json.dumps(result, indent=2 if args.verbose else None))
         return
 
@@ -239,7 +523,14 @@ def main():
         print(json.dumps({"status": "success", "message": "No files to process", "inbox": INBOX}))
         sys.exit(0)
 
-    results = [process_file(f, dry_run=args.dry_run, verbose=args.verbose) for f in files]
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    results = process_batch(
+        files,
+        workers=workers,
+        dry_run=args.dry_run,
+        verbose=args.verbose,
+        stage_mode=args.stage_mode,
+    )
     print(json.dumps(results, indent=2 if args.verbose else None))
 
 
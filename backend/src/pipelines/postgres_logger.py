@@ -2,10 +2,40 @@ import os
 import re
 import sys
 import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 import psycopg2
-from psycopg2.extras import Json
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import Json, execute_values
+
+from ingest_stamp import mark_ingested
+from qdrant_vectorizer import chunk_text, embed_texts
+
+# Chunks (text + pgvector embedding) are written with the document so /api/rag/search ranks
+# small chunk rows instead of whole-document text.
+WRITE_CHUNKS = os.environ.get("IDMS_PG_WRITE_CHUNKS", "1").strip().lower() in {"1", "true", "yes", "on"}
+CHUNK_DIMS = 384
+CHUNK_PAGE_SIZE = 500
+BACKFILL_BATCH_DOCS = int(os.environ.get("IDMS_PG_BACKFILL_BATCH", "200"))
+# Documents per transaction (and per multi-row INSERT) in log_many_to_postgres.
+BULK_BATCH_DOCS = int(os.environ.get("IDMS_PG_BULK_BATCH", "500"))
+BULK_PAGE_SIZE = 500
+
+# Connections are pooled per process so long-running modes (pipeline_runner --serve, batch
+# workers, backfills) reuse them instead of connecting once per document.
+POOL_ENABLED = os.environ.get("IDMS_PG_POOL", "1").strip().lower() in {"1", "true", "yes", "on"}
+POOL_MIN = int(os.environ.get("IDMS_PG_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("IDMS_PG_POOL_MAX", "8"))
+# Connections idle for longer than this are checked with SELECT 1 before being handed out.
+POOL_CHECK_IDLE_S = float(os.environ.get("IDMS_PG_POOL_CHECK_IDLE_S", "30"))
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
 
 
 def get_dsn():
@@ -20,6 +50,132 @@ def get_dsn():
     return f"postgresql://{user}:{password}@{host}:{port}/{db}"
 
 
+class ConnectionPool:
+    """
+    psycopg2 ThreadedConnectionPool that waits (instead of raising) when every connection is in
+    use, health-checks connections that have sat idle, and replaces broken ones on checkout.
+    """
+
+    def __init__(self, dsn, minconn=None, maxconn=None):
+        self.maxconn = max(1, maxconn or POOL_MAX)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min(minconn or POOL_MIN, self.maxconn), self.maxconn, dsn)
+        self.slots = threading.BoundedSemaphore(self.maxconn)
+        self.last_used = {}
+        self.stats = {"checkouts": 0, "health_checks": 0, "replaced": 0, "retries": 0}
+
+    def healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self.last_used.get(id(conn))
+        if last is None or time.monotonic() - last < POOL_CHECK_IDLE_S:
+            return True
+        self.stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def discard(self, conn):
+        self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+
+    def getconn(self):
+        self.slots.acquire()
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = self.pool.getconn()
+                if self.healthy(conn):
+                    self.stats["checkouts"] += 1
+                    return conn
+                self.discard(conn)
+                self.stats["replaced"] += 1
+            raise psycopg2.OperationalError("No healthy Postgres connection available.")
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            if conn.closed:
+                self.discard(conn)
+            else:
+                self.last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        self.pool.closeall()
+
+
+def get_pool(dsn=None):
+    """Process-wide pool per DSN; a forked worker gets its own instead of sharing sockets."""
+    key = (dsn or get_dsn(), os.getpid())
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(key[0])
+        return _POOLS[key]
+
+
+def close_pools():
+    with _POOLS_LOCK:
+        for (_, pid), pool in list(_POOLS.items()):
+            if pid == os.getpid():
+                pool.close()
+        _POOLS.clear()
+
+
+atexit.register(close_pools)
+
+
+@contextmanager
+def pooled_connection(dsn=None):
+    pool = get_pool(dsn)
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def run_transaction(work, dsn=None, pooled=None):
+    """
+    Runs work(cursor) in one transaction and returns its result. Pooled, a connection that
+    turns out to be dead before COMMIT (so nothing was applied) is replaced and the
+    transaction retried once; unpooled, a dedicated connection is opened and closed.
+    """
+    dsn = dsn or get_dsn()
+    if not (POOL_ENABLED if pooled is None else pooled):
+        conn = psycopg2.connect(dsn)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    return work(cur)
+        finally:
+            conn.close()
+
+    for attempt in range(2):
+        with pooled_connection(dsn) as conn:
+            try:
+                with conn.cursor() as cur:
+                    result = work(cur)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt == 0 and conn.closed:
+                    get_pool(dsn).stats["retries"] += 1
+                    continue
+                raise
+            conn.commit()
+            return result
+
+
 def parse_date(value):
     if not value:
         return None
@@ -53,7 +209,7 @@ def to_float(value):
         return None
     text = text.replace(",", "")
     text = text.replace("GBP", "").replace("USD", "").replace("EUR", "")
-    text = text.replace("$", "").replace("?", "").replace("?", "")
+    text = text.replace("$", "").replace("£", "").replace("€", "")
     try:
         return float(text)
     except ValueError:
@@ -73,18 +229,18 @@ def parse_money_from_text(text, keywords):
     for line in lines:
         lower = line.lower()
         if any(k in lower for k in keywords):
-            match = re.search(r"([?$?]?\s?[0-9][0-9,]*(?:\.[0-9]{2})?)", line)
+            match = re.search(r"([£$€]?\s?[0-9][0-9,]*(?:\.[0-9]{2})?)", line)
             if match:
                 return to_float(match.group(1))
     return None
 
 
 def detect_currency(text):
-    if re.search(r"\bGBP\b|?", text, re.IGNORECASE):
+    if re.search(r"\bGBP\b|£", text, re.IGNORECASE):
         return "GBP"
     if re.search(r"\bUSD\b|\$", text, re.IGNORECASE):
         return "USD"
-    if re.search(r"\bEUR\b|?", text, re.IGNORECASE):
+    if re.search(r"\bEUR\b|€", text, re.IGNORECASE):
         return "EUR"
     return None
 
@@ -151,194 +307,433 @@ def infer_invoice_fields(metadata, content):
     }
 
 
-def upsert_document(cur, metadata, content):
+DOCUMENT_UPSERT_SQL = """
+    INSERT INTO documents (
+        doc_id, source_file, new_name, category, entity, confidence,
+        storage_path, status, file_hash, hash_valid, extracted_text,
+        extracted_text_length, extraction_method, pages_processed,
+        ocr_used, ocr_dpi, ocr_engine_version, embedding_model,
+        signals_detected, metadata
+    )
+    VALUES {values}
+    ON CONFLICT (doc_id) DO UPDATE SET
+        source_file = EXCLUDED.source_file,
+        new_name = EXCLUDED.new_name,
+        category = EXCLUDED.category,
+        entity = EXCLUDED.entity,
+        confidence = EXCLUDED.confidence,
+        storage_path = EXCLUDED.storage_path,
+        status = EXCLUDED.status,
+        file_hash = EXCLUDED.file_hash,
+        hash_valid = EXCLUDED.hash_valid,
+        extracted_text = EXCLUDED.extracted_text,
+        extracted_text_length = EXCLUDED.extracted_text_length,
+        extraction_method = EXCLUDED.extraction_method,
+        pages_processed = EXCLUDED.pages_processed,
+        ocr_used = EXCLUDED.ocr_used,
+        ocr_dpi = EXCLUDED.ocr_dpi,
+        ocr_engine_version = EXCLUDED.ocr_engine_version,
+        embedding_model = EXCLUDED.embedding_model,
+        signals_detected = EXCLUDED.signals_detected,
+        metadata = EXCLUDED.metadata,
+        updated_at = NOW()
+"""
+DOCUMENT_VALUES = """(
+        %(doc_id)s, %(source_file)s, %(new_name)s, %(category)s, %(entity)s, %(confidence)s,
+        %(storage_path)s, %(status)s, %(file_hash)s, %(hash_valid)s, %(extracted_text)s,
+        %(extracted_text_length)s, %(extraction_method)s, %(pages_processed)s,
+        %(ocr_used)s, %(ocr_dpi)s, %(ocr_engine_version)s, %(embedding_model)s,
+        %(signals_detected)s, %(metadata)s
+    )"""
+
+INVOICE_UPSERT_SQL = """
+    INSERT INTO invoices (
+        doc_id, invoice_number, invoice_date, due_date, currency,
+        vendor, customer, net_amount, vat_amount, total_amount,
+        vat_reclaimable, is_ar, payment_status
+    )
+    VALUES {values}
+    ON CONFLICT (doc_id) DO UPDATE SET
+        invoice_number = EXCLUDED.invoice_number,
+        invoice_date = EXCLUDED.invoice_date,
+        due_date = EXCLUDED.due_date,
+        currency = EXCLUDED.currency,
+        vendor = EXCLUDED.vendor,
+        customer = EXCLUDED.customer,
+        net_amount = EXCLUDED.net_amount,
+        vat_amount = EXCLUDED.vat_amount,
+        total_amount = EXCLUDED.total_amount,
+        vat_reclaimable = EXCLUDED.vat_reclaimable,
+        is_ar = EXCLUDED.is_ar,
+        payment_status = EXCLUDED.payment_status,
+        updated_at = NOW()
+"""
+INVOICE_VALUES = """(
+        %(doc_id)s, %(invoice_number)s, %(invoice_date)s, %(due_date)s, %(currency)s,
+        %(vendor)s, %(customer)s, %(net_amount)s, %(vat_amount)s, %(total_amount)s,
+        %(vat_reclaimable)s, %(is_ar)s, %(payment_status)s
+    )"""
+
+AR_INSERT_SQL = """
+    INSERT INTO ar_items (
+        doc_id, counterparty, due_date, total_amount,
+        amount_paid, amount_outstanding, status, metadata
+    )
+    VALUES {values}
+"""
+AR_VALUES = """(
+        %(doc_id)s, %(counterparty)s, %(due_date)s, %(total_amount)s,
+        0, %(amount_outstanding)s, %(status)s, %(metadata)s
+    )"""
+
+AUDIT_INSERT_SQL = """
+    INSERT INTO audit_events (event_type, doc_id, severity, details)
+    VALUES {values}
+"""
+AUDIT_VALUES = "(%(event_type)s, %(doc_id)s, %(severity)s, %(details)s)"
+
+
+def document_params(metadata, content):
     doc_id = metadata.get("doc_id")
     if not doc_id:
         raise ValueError("metadata.doc_id is required")
+    return {
+        "doc_id": doc_id,
+        "source_file": metadata.get("orig_name"),
+        "new_name": metadata.get("new_name"),
+        "category": metadata.get("category"),
+        "entity": metadata.get("entity"),
+        "confidence": to_float(metadata.get("confidence")),
+        "storage_path": metadata.get("path"),
+        "status": metadata.get("status"),
+        "file_hash": metadata.get("hash"),
+        "hash_valid": bool(metadata.get("hash_valid")),
+        "extracted_text": content,
+        "extracted_text_length": int(metadata.get("extracted_text_length", len(content or ""))),
+        "extraction_method": metadata.get("extraction_method"),
+        "pages_processed": int(metadata.get("pages_processed", 0)),
+        "ocr_used": bool(metadata.get("ocr_used", False)),
+        "ocr_dpi": int(metadata.get("ocr_dpi", 0)),
+        "ocr_engine_version": metadata.get("ocr_engine_version"),
+        "embedding_model": metadata.get("embedding_model"),
+        "signals_detected": Json(metadata.get("signals_detected", [])),
+        "metadata": Json(metadata),
+    }
 
-    cur.execute(
-        """
-        INSERT INTO documents (
-            doc_id, source_file, new_name, category, entity, confidence,
-            storage_path, status, file_hash, hash_valid, extracted_text,
-            extracted_text_length, extraction_method, pages_processed,
-            ocr_used, ocr_dpi, ocr_engine_version, embedding_model,
-            signals_detected, metadata
-        )
-        VALUES (
-            %(doc_id)s, %(source_file)s, %(new_name)s, %(category)s, %(entity)s, %(confidence)s,
-            %(storage_path)s, %(status)s, %(file_hash)s, %(hash_valid)s, %(extracted_text)s,
-            %(extracted_text_length)s, %(extraction_method)s, %(pages_processed)s,
-            %(ocr_used)s, %(ocr_dpi)s, %(ocr_engine_version)s, %(embedding_model)s,
-            %(signals_detected)s, %(metadata)s
-        )
-        ON CONFLICT (doc_id) DO UPDATE SET
-            source_file = EXCLUDED.source_file,
-            new_name = EXCLUDED.new_name,
-            category = EXCLUDED.category,
-            entity = EXCLUDED.entity,
-            confidence = EXCLUDED.confidence,
-            storage_path = EXCLUDED.storage_path,
-            status = EXCLUDED.status,
-            file_hash = EXCLUDED.file_hash,
-            hash_valid = EXCLUDED.hash_valid,
-            extracted_text = EXCLUDED.extracted_text,
-            extracted_text_length = EXCLUDED.extracted_text_length,
-            extraction_method = EXCLUDED.extraction_method,
-            pages_processed = EXCLUDED.pages_processed,
-            ocr_used = EXCLUDED.ocr_used,
-            ocr_dpi = EXCLUDED.ocr_dpi,
-            ocr_engine_version = EXCLUDED.ocr_engine_version,
-            embedding_model = EXCLUDED.embedding_model,
-            signals_detected = EXCLUDED.signals_detected,
-            metadata = EXCLUDED.metadata,
-            updated_at = NOW()
-        """,
-        {
-            "doc_id": doc_id,
-            "source_file": metadata.get("orig_name"),
-            "new_name": metadata.get("new_name"),
-            "category": metadata.get("category"),
-            "entity": metadata.get("entity"),
-            "confidence": to_float(metadata.get("confidence")),
-            "storage_path": metadata.get("path"),
-            "status": metadata.get("status"),
-            "file_hash": metadata.get("hash"),
-            "hash_valid": bool(metadata.get("hash_valid")),
-            "extracted_text": content,
-            "extracted_text_length": int(metadata.get("extracted_text_length", len(content or ""))),
-            "extraction_method": metadata.get("extraction_method"),
-            "pages_processed": int(metadata.get("pages_processed", 0)),
-            "ocr_used": bool(metadata.get("ocr_used", False)),
-            "ocr_dpi": int(metadata.get("ocr_dpi", 0)),
-            "ocr_engine_version": metadata.get("ocr_engine_version"),
-            "embedding_model": metadata.get("embedding_model"),
-            "signals_detected": Json(metadata.get("signals_detected", [])),
-            "metadata": Json(metadata),
-        },
-    )
+
+def invoice_params(doc_id, fields):
+    return {
+        "doc_id": doc_id,
+        "invoice_number": fields.get("invoice_number"),
+        "invoice_date": fields.get("invoice_date"),
+        "due_date": fields.get("due_date"),
+        "currency": fields.get("currency"),
+        "vendor": fields.get("vendor"),
+        "customer": fields.get("customer"),
+        "net_amount": fields.get("net_amount"),
+        "vat_amount": fields.get("vat_amount"),
+        "total_amount": fields.get("total_amount"),
+        "vat_reclaimable": fields.get("vat_reclaimable"),
+        "is_ar": bool(fields.get("is_ar")),
+        "payment_status": "open" if fields.get("is_ar") else "unpaid",
+    }
+
+
+def ar_params(doc_id, fields):
+    """ar_items row for a receivable with a known total, otherwise None."""
+    if not (fields.get("is_ar") and fields.get("total_amount") is not None):
+        return None
+    amount_outstanding = max(float(fields.get("total_amount") or 0) - 0.0, 0.0)
+    return {
+        "doc_id": doc_id,
+        "counterparty": fields.get("customer") or fields.get("vendor"),
+        "due_date": fields.get("due_date"),
+        "total_amount": fields.get("total_amount"),
+        "amount_outstanding": amount_outstanding,
+        "status": "overdue" if fields.get("due_date") and fields.get("due_date") < datetime.utcnow().date() else "open",
+        "metadata": Json({"source": "postgres_logger"}),
+    }
+
+
+def audit_params(metadata, invoice_state, chunks_written, source="postgres_logger"):
+    return {
+        "event_type": "pipeline.persisted",
+        "doc_id": metadata.get("doc_id"),
+        "severity": "info",
+        "details": Json({
+            "source": source,
+            "invoice": invoice_state,
+            "chunks": chunks_written,
+            "doc_type": metadata.get("doc_type"),
+        }),
+    }
+
+
+def upsert_document(cur, metadata, content):
+    cur.execute(DOCUMENT_UPSERT_SQL.format(values=DOCUMENT_VALUES), document_params(metadata, content))
 
 
 def upsert_invoice_and_ar(cur, doc_id, fields):
     if not fields.get("is_invoice_like"):
         return {"invoice_upserted": False, "ar_upserted": False}
 
+    cur.execute(INVOICE_UPSERT_SQL.format(values=INVOICE_VALUES), invoice_params(doc_id, fields))
+
+    ar_row = ar_params(doc_id, fields)
+    if ar_row is not None:
+        cur.execute(AR_INSERT_SQL.format(values=AR_VALUES), ar_row)
+
+    return {"invoice_upserted": True, "ar_upserted": ar_row is not None}
+
+
+def vector_literal(vector):
+    """pgvector text form: [x1,x2,...]."""
+    return "[" + ",".join(map("{:.7g}".format, vector.tolist())) + "]"
+
+
+def chunk_rows(documents):
+    """
+    Chunks and embeds [(doc_id, content)] as document_chunks rows. Chunks of every document are
+    embedded in one batch through the embedding cache.
+    """
+    chunked = [(doc_id, chunk_text(content)) for doc_id, content in documents]
+    texts = [chunk for _, chunks in chunked for chunk in chunks]
+    vectors = embed_texts(texts, dims=CHUNK_DIMS) if texts else []
+    metadata = Json({"source": "postgres_logger", "embedding_model": f"pseudo_embedding-{CHUNK_DIMS}"})
+
+    rows = []
+    position = 0
+    for doc_id, chunks in chunked:
+        for chunk_index, chunk in enumerate(chunks):
+            rows.append((doc_id, chunk_index, chunk, vector_literal(vectors[position]), metadata))
+            position += 1
+    return rows
+
+
+def replace_chunks(cur, documents, rows=None):
+    """
+    Replaces the chunk rows of [(doc_id, content)] on the caller's cursor (and transaction):
+    one DELETE for stale chunks, then multi-row INSERTs of CHUNK_PAGE_SIZE rows each. Pass rows
+    when the caller has already built chunk_rows(documents).
+    """
+    rows = chunk_rows(documents) if rows is None else rows
     cur.execute(
+        "DELETE FROM document_chunks WHERE doc_id = ANY(%s)",
+        ([doc_id for doc_id, _ in documents],),
+    )
+    execute_values(
+        cur,
         """
-        INSERT INTO invoices (
-            doc_id, invoice_number, invoice_date, due_date, currency,
-            vendor, customer, net_amount, vat_amount, total_amount,
-            vat_reclaimable, is_ar, payment_status
-        )
-        VALUES (
-            %(doc_id)s, %(invoice_number)s, %(invoice_date)s, %(due_date)s, %(currency)s,
-            %(vendor)s, %(customer)s, %(net_amount)s, %(vat_amount)s, %(total_amount)s,
-            %(vat_reclaimable)s, %(is_ar)s, %(payment_status)s
-        )
-        ON CONFLICT (doc_id) DO UPDATE SET
-            invoice_number = EXCLUDED.invoice_number,
-            invoice_date = EXCLUDED.invoice_date,
-            due_date = EXCLUDED.due_date,
-            currency = EXCLUDED.currency,
-            vendor = EXCLUDED.vendor,
-            customer = EXCLUDED.customer,
-            net_amount = EXCLUDED.net_amount,
-            vat_amount = EXCLUDED.vat_amount,
-            total_amount = EXCLUDED.total_amount,
-            vat_reclaimable = EXCLUDED.vat_reclaimable,
-            is_ar = EXCLUDED.is_ar,
-            payment_status = EXCLUDED.payment_status,
-            updated_at = NOW()
+        INSERT INTO document_chunks (doc_id, chunk_index, chunk_text, embedding, metadata)
+        VALUES %s
         """,
-        {
-            "doc_id": doc_id,
-            "invoice_number": fields.get("invoice_number"),
-            "invoice_date": fields.get("invoice_date"),
-            "due_date": fields.get("due_date"),
-            "currency": fields.get("currency"),
-            "vendor": fields.get("vendor"),
-            "customer": fields.get("customer"),
-            "net_amount": fields.get("net_amount"),
-            "vat_amount": fields.get("vat_amount"),
-            "total_amount": fields.get("total_amount"),
-            "vat_reclaimable": fields.get("vat_reclaimable"),
-            "is_ar": bool(fields.get("is_ar")),
-            "payment_status": "open" if fields.get("is_ar") else "unpaid",
-        },
+        rows,
+        template="(%s, %s, %s, %s::vector, %s)",
+        page_size=CHUNK_PAGE_SIZE,
     )
+    return len(rows)
 
-    ar_upserted = False
-    if fields.get("is_ar") and fields.get("total_amount") is not None:
-        amount_outstanding = max(float(fields.get("total_amount") or 0) - 0.0, 0.0)
-        cur.execute(
-            """
-            INSERT INTO ar_items (
-                doc_id, counterparty, due_date, total_amount,
-                amount_paid, amount_outstanding, status, metadata
-            )
-            VALUES (
-                %(doc_id)s, %(counterparty)s, %(due_date)s, %(total_amount)s,
-                0, %(amount_outstanding)s, %(status)s, %(metadata)s
-            )
-            """,
-            {
-                "doc_id": doc_id,
-                "counterparty": fields.get("customer") or fields.get("vendor"),
-                "due_date": fields.get("due_date"),
-                "total_amount": fields.get("total_amount"),
-                "amount_outstanding": amount_outstanding,
-                "status": "overdue" if fields.get("due_date") and fields.get("due_date") < datetime.utcnow().date() else "open",
-                "metadata": Json({"source": "postgres_logger"}),
-            },
-        )
-        ar_upserted = True
-
-    return {"invoice_upserted": True, "ar_upserted": ar_upserted}
-
-
-def log_to_postgres(metadata, content):
+
+def persist_document(cur, metadata, content):
+    upsert_document(cur, metadata, content)
+    fields = infer_invoice_fields(metadata, content)
+    invoice_state = upsert_invoice_and_ar(cur, metadata.get("doc_id"), fields)
+    chunks_written = replace_chunks(cur, [(metadata.get("doc_id"), content)]) if WRITE_CHUNKS else 0
+    cur.execute(AUDIT_INSERT_SQL.format(values=AUDIT_VALUES), audit_params(metadata, invoice_state, chunks_written))
+    return invoice_state, chunks_written
+
+
+def log_to_postgres(metadata, content, dsn=None, pooled=None):
+    dsn = dsn or get_dsn()
+    invoice_state, chunks_written = run_transaction(
+        lambda cur: persist_document(cur, metadata, content), dsn, pooled
+    )
+    if chunks_written:
+        mark_ingested()
+    return {
+        "status": "success",
+        "doc_id": metadata.get("doc_id"),
+        "dsn_target": dsn.split("@")[-1],
+        "chunks_written": chunks_written,
+        **invoice_state,
+    }
+
+
+def persist_batch(cur, records):
+    """
+    Writes a batch of (metadata, content) records with one multi-row INSERT ... ON CONFLICT per
+    table. A doc_id repeated within the batch keeps its last record, as sequential upserts would.
+    """
+    latest = {}
+    for metadata, content in records:
+        latest[metadata.get("doc_id")] = (metadata, content)
+    records = list(latest.values())
+
+    documents = [document_params(metadata, content) for metadata, content in records]
+    invoices = []
+    ar_items = []
+    states = []
+    for metadata, content in records:
+        fields = infer_invoice_fields(metadata, content)
+        if fields.get("is_invoice_like"):
+            invoices.append(invoice_params(metadata.get("doc_id"), fields))
+            ar_row = ar_params(metadata.get("doc_id"), fields)
+            if ar_row is not None:
+                ar_items.append(ar_row)
+            states.append({"invoice_upserted": True, "ar_upserted": ar_row is not None})
+        else:
+            states.append({"invoice_upserted": False, "ar_upserted": False})
+
+    execute_values(cur, DOCUMENT_UPSERT_SQL.format(values="%s"), documents, template=DOCUMENT_VALUES, page_size=BULK_PAGE_SIZE)
+    if invoices:
+        execute_values(cur, INVOICE_UPSERT_SQL.format(values="%s"), invoices, template=INVOICE_VALUES, page_size=BULK_PAGE_SIZE)
+    if ar_items:
+        execute_values(cur, AR_INSERT_SQL.format(values="%s"), ar_items, template=AR_VALUES, page_size=BULK_PAGE_SIZE)
+
+    chunks_written = 0
+    chunk_counts = {}
+    if WRITE_CHUNKS:
+        chunk_documents = [(metadata.get("doc_id"), content) for metadata, content in records]
+        rows = chunk_rows(chunk_documents)
+        for doc_id, *_ in rows:
+            chunk_counts[doc_id] = chunk_counts.get(doc_id, 0) + 1
+        chunks_written = replace_chunks(cur, chunk_documents, rows)
+
+    audits = [
+        audit_params(metadata, state, chunk_counts.get(metadata.get("doc_id"), 0), source="postgres_logger.bulk")
+        for (metadata, _), state in zip(records, states)
+    ]
+    execute_values(cur, AUDIT_INSERT_SQL.format(values="%s"), audits, template=AUDIT_VALUES, page_size=BULK_PAGE_SIZE)
+    return {
+        "documents": len(records),
+        "invoices": len(invoices),
+        "ar_items": len(ar_items),
+        "chunks_written": chunks_written,
+    }
+
+
+def log_many_to_postgres(records, batch_docs=None, dsn=None, pooled=None):
+    """
+    Bulk path for archive imports: accumulates (metadata, content) records into batches of
+    batch_docs and writes each batch in one transaction. Batches before a failure stay committed;
+    the error reports how many documents that was.
+    """
+    batch_docs = batch_docs or BULK_BATCH_DOCS
+    dsn = dsn or get_dsn()
+    totals = {"documents": 0, "invoices": 0, "ar_items": 0, "chunks_written": 0}
+    batches = 0
+    start = time.perf_counter()
+
+    def flush(batch):
+        nonlocal batches
+        written = run_transaction(lambda cur: persist_batch(cur, batch), dsn, pooled)
+        batches += 1
+        for key in totals:
+            totals[key] += written[key]
+        if written["chunks_written"]:
+            mark_ingested()
+
+    batch = []
+    try:
+        for metadata, content in records:
+            batch.append((metadata, content))
+            if len(batch) >= batch_docs:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except Exception as exc:
+        return {"status": "error", "message": str(exc), "committed_documents": totals["documents"], "batches": batches}
+
+    elapsed = time.perf_counter() - start
+    return {
+        "status": "success",
+        **totals,
+        "batches": batches,
+        "elapsed_ms": round(elapsed * 1000.0, 2),
+        "docs_per_min": round(totals["documents"] / elapsed * 60.0, 1) if elapsed else None,
+        "dsn_target": dsn.split("@")[-1],
+    }
+
+
+def read_jsonl_records(path):
+    """Records for log_many_to_postgres from JSON lines {"metadata": {...}, "content": "..."}."""
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            metadata = dict(record.get("metadata") or {})
+            if record.get("doc_id") and not metadata.get("doc_id"):
+                metadata["doc_id"] = record["doc_id"]
+            yield metadata, record.get("content") or ""
+
+
+def backfill_chunks(batch_docs=None, rechunk_all=False):
+    """
+    Writes chunk rows for documents already in Postgres. Documents stream from a server-side
+    (named) cursor on a dedicated connection; each batch of chunks is written and committed on
+    a pooled one, so memory stays flat and an interrupted run resumes where it stopped.
+    """
+    batch_docs = batch_docs or BACKFILL_BATCH_DOCS
     dsn = get_dsn()
-    conn = psycopg2.connect(dsn)
+    read_conn = psycopg2.connect(dsn)
+    documents_done = 0
+    chunks_written = 0
     try:
-        with conn:
-            with conn.cursor() as cur:
-                upsert_document(cur, metadata, content)
-                fields = infer_invoice_fields(metadata, content)
-                invoice_state = upsert_invoice_and_ar(cur, metadata.get("doc_id"), fields)
-
-                cur.execute(
-                    """
-                    INSERT INTO audit_events (event_type, doc_id, severity, details)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (
-                        "pipeline.persisted",
-                        metadata.get("doc_id"),
-                        "info",
-                        Json({
-                            "source": "postgres_logger",
-                            "invoice": invoice_state,
-                            "doc_type": metadata.get("doc_type"),
-                        }),
-                    ),
-                )
+        with read_conn.cursor(name="idms_chunk_backfill") as reader:
+            reader.itersize = batch_docs
+            reader.execute(
+                """
+                SELECT d.doc_id, d.extracted_text
+                FROM documents d
+                WHERE d.extracted_text IS NOT NULL AND d.extracted_text <> ''
+                  AND (%s OR NOT EXISTS (SELECT 1 FROM document_chunks c WHERE c.doc_id = d.doc_id))
+                ORDER BY d.doc_id
+                """,
+                (rechunk_all,),
+            )
+            while True:
+                batch = reader.fetchmany(batch_docs)
+                if not batch:
+                    break
+                chunks_written += run_transaction(lambda cur: replace_chunks(cur, batch), dsn)
+                documents_done += len(batch)
+                mark_ingested()
 
         return {
             "status": "success",
-            "doc_id": metadata.get("doc_id"),
+            "documents": documents_done,
+            "chunks_written": chunks_written,
             "dsn_target": dsn.split("@")[-1],
-            **invoice_state,
         }
     finally:
-        conn.close()
+        read_conn.close()
 
 
 def main():
     if len(sys.argv) < 2:
-        print(json.dumps({"status": "error", "message": "Usage: postgres_logger.py <metadata_json> [content]"}))
+        print(json.dumps({"status": "error", "message": "Usage: postgres_logger.py <metadata_json> [content] | --bulk <records.jsonl> [batch_docs] | --backfill-chunks [--all] [batch_docs]"}))
         sys.exit(1)
 
     try:
+        if sys.argv[1] == "--backfill-chunks":
+            args = sys.argv[2:]
+            rechunk_all = "--all" in args
+            numbers = [int(arg) for arg in args if arg != "--all"]
+            print(json.dumps(backfill_chunks(numbers[0] if numbers else None, rechunk_all)))
+            return
+
+        if sys.argv[1] == "--bulk":
+            if len(sys.argv) < 3:
+                raise ValueError("--bulk needs a JSON-lines file of {metadata, content} records")
+            batch_docs = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+            result = log_many_to_postgres(read_jsonl_records(sys.argv[2]), batch_docs)
+            print(json.dumps(result))
+            if result.get("status") != "success":
+                sys.exit(1)
+            return
+
         metadata = json.loads(sys.argv[1])
         content = sys.argv[2] if len(sys.argv) >= 3 else ""
         result = log_to_postgres(metadata, content)
@@ -1,10 +1,19 @@
 import os
 import sys
 import json
+import time
 import hashlib
 
+import numpy as np
 import requests
 
+import embedding_cache
+from ingest_stamp import mark_ingested
+
+# token -> (first two digest bytes << 1) | negative-sign bit, shared across batches.
+TOKEN_CACHE_MAX = int(os.environ.get("IDMS_EMBED_TOKEN_CACHE", "500000"))
+_TOKEN_CACHE = {}
+
 
 def chunk_text(text, chunk_size=1000, overlap=100):
     text = (text or "").strip()
@@ -36,6 +45,59 @@ def pseudo_embedding(text, dims=384):
     return vector
 
 
+def token_code(token):
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    return (int.from_bytes(digest[:2], "big") << 1) | (digest[2] % 2)
+
+
+def embed_batch(texts, dims=384, dtype=np.float32):
+    """
+    Embeds a batch of texts into an (n_texts, dims) matrix of unit-length rows.
+    Same vectors as pseudo_embedding: each distinct token is hashed once (and cached across
+    batches), token counts are scattered into the matrix with one bincount, and normalisation
+    runs in float64 before the cast to `dtype`. A real model can replace this behind the same
+    signature.
+    """
+    token_lists = [(text or "").lower().split() for text in texts]
+    if len(_TOKEN_CACHE) > TOKEN_CACHE_MAX:
+        _TOKEN_CACHE.clear()
+    cache = _TOKEN_CACHE
+    for tokens in token_lists:
+        for token in tokens:
+            if token not in cache:
+                cache[token] = token_code(token)
+
+    lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+    codes = np.fromiter((cache[t] for tokens in token_lists for t in tokens), dtype=np.int64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(token_lists), dtype=np.int64), lengths)
+    cells = rows * dims + (codes >> 1) % dims
+    signs = 1.0 - 2.0 * (codes & 1)
+    matrix = np.bincount(cells, weights=signs, minlength=len(token_lists) * dims)
+    matrix = matrix.astype(np.float64, copy=False).reshape(len(token_lists), dims)
+
+    # Counts are small integers, so the sum of squares is exact. The square root is taken per row
+    # with Python's `** 0.5` (libm pow), which can differ from np.sqrt in the last bit.
+    sums = np.einsum("ij,ij->i", matrix, matrix).tolist()
+    norms = np.array([total ** 0.5 for total in sums], dtype=np.float64).reshape(-1, 1)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix.astype(dtype, copy=False)
+
+
+QDRANT_DIMS = 384
+# Points per upsert request when batching across documents.
+BATCH_POINTS = int(os.environ.get("IDMS_QDRANT_BATCH_POINTS", "256"))
+# wait=true blocks each upsert until Qdrant has applied it; wait=false only waits for the
+# acknowledgement, and confirm() later proves everything sent has been applied.
+UPSERT_WAIT = os.environ.get("IDMS_QDRANT_WAIT", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+_CLIENTS = {}
+
+
+def embed_texts(texts, dims=384):
+    """Chunk embeddings through the shared embedding cache; only unseen chunks are embedded."""
+    return embedding_cache.embed(texts, f"pseudo_embedding-{dims}", lambda batch: embed_batch(batch, dims=dims))
+
+
 def qdrant_headers():
     api_key = os.environ.get("IDMS_QDRANT_API_KEY", "").strip()
     headers = {"Content-Type": "application/json"}
@@ -44,40 +106,122 @@ def qdrant_headers():
     return headers
 
 
-def ensure_collection(base_url, collection):
-    url = f"{base_url}/collections/{collection}"
-    r = requests.get(url, timeout=10, headers=qdrant_headers())
-    if r.status_code == 200:
-        return
+class QdrantClient:
+    """
+    Qdrant REST client for one collection: a pooled keep-alive session, a cached collection
+    check, and point batching across documents into size-bounded upserts.
+    """
 
-    payload = {
-        "vectors": {
-            "size": 384,
-            "distance": "Cosine"
-        }
-    }
-    r = requests.put(url, json=payload, timeout=15, headers=qdrant_headers())
-    r.raise_for_status()
+    def __init__(self, base_url, collection, batch_points=None, wait=None, pool_size=4):
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip("/")
+        self.collection = collection
+        self.batch_points = max(1, batch_points or BATCH_POINTS)
+        self.wait = UPSERT_WAIT if wait is None else wait
+        self.session = requests.Session()
+        self.session.headers.update(qdrant_headers())
+        retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.collection_ready = False
+        self.pending = []
+        self.last_batch = None
+        self.unconfirmed = 0
+        self.stats = {"requests": 0, "upserts": 0, "points": 0}
+
+    def request(self, method, path, timeout, **kwargs):
+        self.stats["requests"] += 1
+        return self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+
+    def ensure_collection(self):
+        if self.collection_ready:
+            return
+        path = f"/collections/{self.collection}"
+        r = self.request("GET", path, timeout=10)
+        if r.status_code != 200:
+            payload = {"vectors": {"size": QDRANT_DIMS, "distance": "Cosine"}}
+            r = self.request("PUT", path, timeout=15, json=payload)
+            r.raise_for_status()
+        self.collection_ready = True
+
+    def upsert(self, points, wait=None):
+        """Sends one upsert request now."""
+        wait = self.wait if wait is None else wait
+        path = f"/collections/{self.collection}/points?wait={'true' if wait else 'false'}"
+        self.ensure_collection()
+        r = self.request("PUT", path, timeout=30, json={"points": points})
+        if r.status_code == 404:
+            # The cached collection check is stale (collection dropped or recreated): check again once.
+            self.collection_ready = False
+            self.ensure_collection()
+            r = self.request("PUT", path, timeout=30, json={"points": points})
+        r.raise_for_status()
+        self.stats["upserts"] += 1
+        self.stats["points"] += len(points)
+        self.last_batch = points
+        self.unconfirmed = 0 if wait else self.unconfirmed + 1
+        return r.json()
 
+    def add(self, points):
+        """Buffers points, sending full batches as they fill. Returns the API results of those sends."""
+        self.pending.extend(points)
+        results = []
+        while len(self.pending) >= self.batch_points:
+            batch, self.pending = self.pending[:self.batch_points], self.pending[self.batch_points:]
+            results.append(self.upsert(batch))
+        return results
 
-def upsert_points(base_url, collection, points):
-    url = f"{base_url}/collections/{collection}/points?wait=true"
-    payload = {"points": points}
-    r = requests.put(url, json=payload, timeout=30, headers=qdrant_headers())
-    r.raise_for_status()
-    return r.json()
+    def flush(self):
+        results = []
+        if self.pending:
+            batch, self.pending = self.pending, []
+            results.append(self.upsert(batch))
+        return results
 
+    def confirm(self):
+        """
+        Blocks until every upsert sent with wait=false has been applied. Qdrant applies a
+        collection's updates in order, so re-sending the last batch (an idempotent upsert) with
+        wait=true returns only after all earlier operations are done.
+        """
+        if not self.unconfirmed or not self.last_batch:
+            return {"confirmed": 0}
+        count = self.unconfirmed
+        self.upsert(self.last_batch, wait=True)
+        return {"confirmed": count}
 
-def index_document(doc_id, content, metadata):
-    base_url = os.environ.get("IDMS_QDRANT_URL", "http://127.0.0.1:6333").rstrip("/")
-    collection = os.environ.get("IDMS_QDRANT_COLLECTION", "idms_docs")
+    def search(self, vector, limit, filters=None):
+        """Nearest points to vector as [{id, score, payload}], optionally matching payload fields exactly."""
+        body = {"vector": [float(v) for v in vector], "limit": limit, "with_payload": True}
+        conditions = [{"key": key, "match": {"value": value}} for key, value in (filters or {}).items() if value is not None]
+        if conditions:
+            body["filter"] = {"must": conditions}
+        r = self.request("POST", f"/collections/{self.collection}/points/search", timeout=10, json=body)
+        r.raise_for_status()
+        return r.json().get("result", [])
 
+
+def get_client(base_url=None, collection=None):
+    """Process-wide client per (url, collection), so the session and collection check are reused."""
+    base_url = (base_url or os.environ.get("IDMS_QDRANT_URL", "http://127.0.0.1:6333")).rstrip("/")
+    collection = collection or os.environ.get("IDMS_QDRANT_COLLECTION", "idms_docs")
+    key = (base_url, collection)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = QdrantClient(base_url, collection)
+    return _CLIENTS[key]
+
+
+def document_points(doc_id, content, metadata):
     chunks = chunk_text(content)
     if not chunks:
-        return {"status": "success", "doc_id": doc_id, "chunks_indexed": 0}
+        return []
+    return chunk_points(doc_id, chunks, embed_texts(chunks, dims=QDRANT_DIMS), metadata)
 
-    ensure_collection(base_url, collection)
 
+def chunk_points(doc_id, chunks, vectors, metadata):
     points = []
     for idx, chunk in enumerate(chunks):
         point_id_seed = f"{doc_id}:{idx}"
@@ -85,7 +229,7 @@ def index_document(doc_id, content, metadata):
         points.append(
             {
                 "id": point_id,
-                "vector": pseudo_embedding(chunk),
+                "vector": vectors[idx].tolist(),
                 "payload": {
                     "doc_id": doc_id,
                     "chunk_index": idx,
@@ -96,20 +240,83 @@ def index_document(doc_id, content, metadata):
                 },
             }
         )
+    return points
 
-    api_result = upsert_points(base_url, collection, points)
+
+def index_document(doc_id, content, metadata, client=None):
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    points = document_points(doc_id, content, metadata)
+    if not points:
+        return {"status": "success", "doc_id": doc_id, "chunks_indexed": 0}
+
+    client = client or get_client()
+    api_result = None
+    for start in range(0, len(points), client.batch_points):
+        api_result = client.upsert(points[start:start + client.batch_points])
+    # With wait=false the points are only acknowledged; stamp once Qdrant has applied them.
+    client.confirm()
+    mark_ingested()
     return {
         "status": "success",
         "doc_id": doc_id,
-        "collection": collection,
+        "collection": client.collection,
         "chunks_indexed": len(points),
         "api": api_result,
     }
 
 
+def index_documents(documents, client=None, confirm=True):
+    """
+    Bulk path: points from many documents [{doc_id, content, metadata}] share size-bounded
+    upserts. With wait=false the upserts are confirmed once at the end.
+    """
+    client = client or get_client()
+    start = time.perf_counter()
+    docs = 0
+    points = 0
+    for doc in documents:
+        doc_points = document_points(doc["doc_id"], doc.get("content"), doc.get("metadata") or {})
+        client.add(doc_points)
+        docs += 1
+        points += len(doc_points)
+    client.flush()
+    confirmation = client.confirm() if confirm else {"confirmed": 0}
+    if points:
+        mark_ingested()
+    elapsed = time.perf_counter() - start
+    return {
+        "status": "success",
+        "collection": client.collection,
+        "documents": docs,
+        "points": points,
+        "upserts": client.stats["upserts"],
+        "requests": client.stats["requests"],
+        "wait": client.wait,
+        "confirmed": confirmation["confirmed"],
+        "elapsed_ms": round(elapsed * 1000.0, 2),
+        "points_per_sec": round(points / elapsed, 2) if elapsed else None,
+    }
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
 def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "--bulk":
+        try:
+            print(json.dumps(index_documents(read_jsonl(sys.argv[2]))))
+        except Exception as exc:
+            print(json.dumps({"status": "error", "message": str(exc)}))
+            sys.exit(1)
+        return
+
     if len(sys.argv) < 3:
-        print(json.dumps({"status": "error", "message": "Usage: qdrant_vectorizer.py <doc_id> <content> [metadata_json]"}))
+        print(json.dumps({"status": "error", "message": "Usage: qdrant_vectorizer.py <doc_id> <content> [metadata_json] | --bulk <docs.jsonl>"}))
         sys.exit(1)
 
     doc_id = sys.argv[1]
@@ -1,35 +1,551 @@
+import os
 import sys
 import json
-import os
-import subprocess
+import time
+import uuid
+import shutil
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import requests
+
+import file_lock
+import faiss_vectorizer
+import ingest_stamp
+import qdrant_vectorizer
+from qdrant_vectorizer import chunk_text, embed_texts
+
+# REBUILD: re-indexes from the text already stored in Postgres (documents.extracted_text). Only
+# rows whose hash is missing or invalid, or whose text is empty, are re-extracted from the
+# archived PDF. Vectors go to a fresh target that replaces the live one in a single swap:
+#   faiss   batch parts are staged in REBUILD_DIR, merged into a new main part in the index
+#           directory, and published by one manifest swap under the writer lock
+#   qdrant  points go to a new collection; the collection alias is switched in one request
+# REBUILD_DIR also holds CHECKPOINT.json (last committed doc_id and finished swaps), so an
+# interrupted run resumes. The doc_id stream only sees rows in its snapshot, so before the swaps a
+# catch-up pass re-indexes every row updated since the run started (rows ingested meanwhile, and
+# rows a resumed stream sorts behind last_doc_id); a document re-indexed this way replaces its
+# earlier rows. A second pass after the alias switch picks up ingests that still went to the old
+# collection. Turning a plain live collection into an alias deletes it before the
+# alias exists, so that is only done with --migrate-collection, during a maintenance window.
+REBUILD_DIR = os.environ.get("IDMS_REBUILD_DIR", os.path.join(".antigravity", "memory", "idms_rebuild"))
+BATCH_DOCS = int(os.environ.get("IDMS_REBUILD_BATCH_DOCS", "100"))
+CHECKPOINT_NAME = "CHECKPOINT.json"
+WRITE_QDRANT = os.environ.get("IDMS_WRITE_QDRANT", "0").strip().lower() in {"1", "true", "yes", "on"}
+DRIVE_ROOT = os.environ.get("BASE_IDMS", ".")
+# Compaction must not merge the live segments while a rebuild is replacing them.
+COMPACT_LOCK_TIMEOUT = 600  # seconds
+ALIAS_ATTEMPTS = 3
+
+COLUMNS = ["doc_id", "extracted_text", "file_hash", "hash_valid", "storage_path", "category", "entity", "status"]
+
+
+def needs_reextraction(row):
+    return not row["file_hash"] or not row["hash_valid"] or not (row["extracted_text"] or "").strip()
+
+
+def reextract(row, drive_root):
+    """Text for a row whose stored text cannot be trusted, straight from the archived file."""
+    import extractor
+
+    path = row["storage_path"] or ""
+    if not os.path.isabs(path):
+        path = os.path.join(drive_root, path)
+    # Rebuild workers already use every core; an OCR pool per worker would square that.
+    return extractor.extract_content(path, ocr_workers=1)
+
+
+def prepare_batch(rows, drive_root):
+    """
+    Worker: chunks and embeds one batch of documents. Returns per-document chunk counts with
+    the batch's chunk texts and (n_chunks, dims) float32 vectors in document order.
+    """
+    documents = []
+    reextracted = 0
+    failures = []
+    for row in rows:
+        content = row["extracted_text"]
+        if needs_reextraction(row):
+            result = reextract(row, drive_root)
+            if result.get("status") == "success":
+                content = result.get("content")
+                reextracted += 1
+            elif (content or "").strip():
+                failures.append({"doc_id": row["doc_id"], "message": f"Re-extraction failed, stored text used: {result.get('message')}"})
+            else:
+                failures.append({"doc_id": row["doc_id"], "message": f"Re-extraction failed: {result.get('message')}"})
+                continue
+        documents.append((row, chunk_text(content)))
+
+    texts = [chunk for _, chunks in documents for chunk in chunks]
+    if texts:
+        vectors = embed_texts(texts, dims=faiss_vectorizer.VECTOR_DIMS)
+    else:
+        vectors = np.zeros((0, faiss_vectorizer.VECTOR_DIMS), dtype=np.float32)
+    return {
+        "documents": [
+            {"doc_id": row["doc_id"], "chunks": len(chunks),
+             "metadata": {"category": row["category"], "entity": row["entity"], "status": row["status"]}}
+            for row, chunks in documents
+        ],
+        "texts": texts,
+        "vectors": vectors,
+        "last_doc_id": rows[-1]["doc_id"],
+        "reextracted": reextracted,
+        "failures": failures,
+    }
+
+
+def read_checkpoint(rebuild_dir):
+    path = os.path.join(rebuild_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_checkpoint(rebuild_dir, checkpoint):
+    faiss_vectorizer.write_json_atomic(os.path.join(rebuild_dir, CHECKPOINT_NAME), checkpoint)
+
 
-# REBUILD INTEGRITY: Component re-reads original PDFs to ensure semantic parity.
-SCRIPTS_DIR = "00-daily-ops/scripts/idms"
+def db_mark():
+    """
+    A point in Postgres time from which every later-committed documents row has updated_at >= it:
+    updated_at is the writing transaction's start time, so open transactions move the mark back.
+    """
+    import postgres_logger
+
+    conn = postgres_logger.psycopg2.connect(postgres_logger.get_dsn())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT LEAST(NOW(), MIN(xact_start))
+                FROM pg_stat_activity
+                WHERE backend_type = 'client backend' AND xact_start IS NOT NULL
+                """
+            )
+            return cur.fetchone()[0].isoformat()
+    finally:
+        conn.close()
+
+
+def new_checkpoint(targets, index_path):
+    run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    checkpoint = {
+        "run_id": run_id,
+        "model": faiss_vectorizer.model_id(),
+        "targets": targets,
+        "last_doc_id": None,
+        "caught_up_to": db_mark(),
+        "documents": 0,
+        "caught_up": 0,
+        "chunks": 0,
+        "reextracted": 0,
+        "failures": [],
+        "parts": [],
+        "elapsed_s": 0.0,
+    }
+    if "faiss" in targets:
+        # Segments published after this point are kept by the swap; these are replaced.
+        checkpoint["base_segments"] = faiss_vectorizer.read_manifest(index_path)["segments"]
+    if "qdrant" in targets:
+        checkpoint["qdrant_collection"] = f"{qdrant_vectorizer.get_client().collection}_{run_id}".replace("-", "_")
+    return checkpoint
 
-def rebuild_index(sheets_metadata_csv, drive_root):
+
+def stream_documents(after_doc_id, batch_docs, status, updated_since=None):
     """
-    V5 Rebuild: Iterates through Sheets metadata and RE-EXTRACTS text from G-Drive PDFs.
+    Yields batches of document rows in doc_id order from a server-side cursor, resuming after
+    after_doc_id and, for a catch-up, limited to rows updated since updated_since.
     """
+    import postgres_logger
+
+    conn = postgres_logger.psycopg2.connect(postgres_logger.get_dsn())
     try:
-        # In actual implementation:
-        # 1. Load Google Sheet rows where status='processed'
-        # 2. For each row:
-        #    a. Locate file at G-Drive 'path'
-        #    b. Run extractor.py on the file
-        #    c. Run faiss_vectorizer.py on extracted content
-        
+        with conn.cursor(name="idms_rebuild") as cur:
+            cur.itersize = batch_docs
+            cur.execute(
+                f"""
+                SELECT {", ".join(COLUMNS)}
+                FROM documents
+                WHERE status = %s AND (%s::text IS NULL OR doc_id > %s)
+                  AND (%s::timestamptz IS NULL OR updated_at >= %s::timestamptz)
+                ORDER BY doc_id
+                """,
+                (status, after_doc_id, after_doc_id, updated_since, updated_since),
+            )
+            while True:
+                rows = cur.fetchmany(batch_docs)
+                if not rows:
+                    break
+                yield [dict(zip(COLUMNS, row)) for row in rows]
+    finally:
+        conn.close()
+
+
+def count_documents(after_doc_id, status):
+    import postgres_logger
+
+    conn = postgres_logger.psycopg2.connect(postgres_logger.get_dsn())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT COUNT(*) FROM documents WHERE status = %s AND (%s::text IS NULL OR doc_id > %s)",
+                (status, after_doc_id, after_doc_id),
+            )
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def store_batch(batch, checkpoint, rebuild_dir, client, write_faiss=True, catch_up=False):
+    """
+    Writes one prepared batch to every target, then advances the checkpoint past it. Catch-up
+    batches are counted separately and leave last_doc_id alone.
+    """
+    if write_faiss and "faiss" in checkpoint["targets"] and batch["texts"]:
+        part = f"batch-{len(checkpoint['parts']):06d}"
+        doc_ids = []
+        chunk_index = []
+        for doc in batch["documents"]:
+            doc_ids.extend([doc["doc_id"]] * doc["chunks"])
+            chunk_index.extend(range(doc["chunks"]))
+        faiss_vectorizer.write_part(rebuild_dir, part, batch["vectors"], doc_ids, chunk_index)
+        checkpoint["parts"].append(part)
+
+    if client is not None:
+        offset = 0
+        for doc in batch["documents"]:
+            end = offset + doc["chunks"]
+            # Point ids are derived from (doc_id, chunk_index), so re-sending after a resume is harmless.
+            client.add(qdrant_vectorizer.chunk_points(
+                doc["doc_id"], batch["texts"][offset:end], batch["vectors"][offset:end], doc["metadata"]
+            ))
+            offset = end
+        client.flush()
+
+    if catch_up:
+        checkpoint["caught_up"] += len(batch["documents"])
+    else:
+        checkpoint["last_doc_id"] = batch["last_doc_id"]
+        checkpoint["documents"] += len(batch["documents"])
+    checkpoint["chunks"] += len(batch["texts"])
+    checkpoint["reextracted"] += batch["reextracted"]
+    checkpoint["failures"].extend(batch["failures"])
+    write_checkpoint(rebuild_dir, checkpoint)
+
+
+def catch_up(checkpoint, rebuild_dir, client, status, batch_docs, drive_root, index_path, write_faiss):
+    """
+    Re-indexes every document updated since the checkpoint's mark, then moves the mark. Returns the
+    number of documents re-indexed.
+    """
+    # Read before the mark: a live segment listed here belongs to a row the pass below can see.
+    segments = faiss_vectorizer.read_manifest(index_path)["segments"] if write_faiss else None
+    mark = db_mark()
+    documents = 0
+    for rows in stream_documents(None, batch_docs, status, updated_since=checkpoint["caught_up_to"]):
+        batch = prepare_batch(rows, drive_root)
+        store_batch(batch, checkpoint, rebuild_dir, client, write_faiss=write_faiss, catch_up=True)
+        documents += len(batch["documents"])
+    checkpoint["caught_up_to"] = mark
+    if segments is not None:
+        checkpoint["caught_up_segments"] = segments
+    write_checkpoint(rebuild_dir, checkpoint)
+    return documents
+
+
+def part_doc_ids(directory, name):
+    return faiss_vectorizer.read_part(directory, name)[1].tolist()
+
+
+def latest_rows(rebuild_dir, parts):
+    """Row masks keeping only a document's rows from the last part that holds it, or None if nothing repeats."""
+    later = set()
+    keep = {}
+    for part in reversed(parts):
+        _, doc_ids, _ = faiss_vectorizer.read_part(rebuild_dir, part)
+        mask = np.fromiter((doc_id not in later for doc_id in doc_ids), dtype=bool, count=len(doc_ids))
+        if not mask.all():
+            keep[part] = mask
+        later.update(doc_ids.tolist())
+    return keep or None
+
+
+def swap_faiss(checkpoint, rebuild_dir, index_path, lock_path):
+    """
+    Merges the staged parts into a new main part and makes it live with one manifest swap. Live
+    segments written during the run are kept unless they only hold documents the rebuild covers.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    name = None
+    rows = 0
+    rebuilt = set()
+    if checkpoint["parts"]:
+        name = f"main-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        keep = latest_rows(rebuild_dir, checkpoint["parts"])
+        rows = faiss_vectorizer.merge_parts(rebuild_dir, checkpoint["parts"], index_path, name, keep)
+        rebuilt = set(part_doc_ids(index_path, name))
+
+    with faiss_vectorizer.writer_lock(lock_path):
+        current = faiss_vectorizer.read_manifest(index_path)
+        base = set(checkpoint.get("base_segments", []))
+        caught_up = set(checkpoint.get("caught_up_segments", []))
+        retired = [current["main"]] if current["main"] else []
+        kept = []
+        for segment in current["segments"]:
+            duplicate = segment in caught_up and set(part_doc_ids(index_path, segment)) <= rebuilt
+            (retired if segment in base or duplicate else kept).append(segment)
+        manifest = {
+            "version": current.get("version", 0),
+            "model": checkpoint["model"],
+            "dims": faiss_vectorizer.VECTOR_DIMS,
+            "main": name,
+            "segments": kept,
+            "committed": current.get("committed", []),
+        }
+        faiss_vectorizer.write_manifest(index_path, manifest)
+
+    # Readers holding the old snapshot keep their open files; anything not removable here is
+    # left to compaction's orphan sweep.
+    for part in retired:
+        faiss_vectorizer.remove_part(index_path, part)
+    return {"main": name, "rows": rows, "retired_parts": len(retired), "kept_segments": len(manifest["segments"])}
+
+
+def update_aliases(client, actions):
+    """Sends one atomic alias update, retrying transient failures. Returns None or the last error."""
+    error = None
+    for attempt in range(ALIAS_ATTEMPTS):
+        try:
+            client.request("POST", "/collections/aliases", timeout=30, json={"actions": actions}).raise_for_status()
+            return None
+        except requests.RequestException as exc:
+            error = str(exc)
+            if attempt + 1 < ALIAS_ATTEMPTS:
+                time.sleep(0.5 * 2 ** attempt)
+    return error
+
+
+def swap_qdrant(client, keep_old=False, migrate=False):
+    """
+    Points the collection alias at the rebuilt collection in one atomic request. A live
+    collection registered under the alias name itself is only replaced with migrate=True: it is
+    deleted before the alias can be created, so search has no Qdrant collection until then.
+    """
+    confirmation = client.confirm()
+    alias = qdrant_vectorizer.get_client().collection
+    aliases = client.request("GET", "/collections/aliases", timeout=10)
+    aliases.raise_for_status()
+    previous = next(
+        (a["collection_name"] for a in aliases.json()["result"]["aliases"] if a["alias_name"] == alias),
+        None,
+    )
+    actions = []
+    migrated = False
+    if previous:
+        actions.append({"delete_alias": {"alias_name": alias}})
+    else:
+        listing = client.request("GET", "/collections", timeout=10)
+        listing.raise_for_status()
+        if any(c["name"] == alias for c in listing.json()["result"]["collections"]):
+            if not migrate:
+                return {
+                    "status": "error",
+                    "message": f"'{alias}' is a collection, not an alias. The rebuild is in {client.collection}; "
+                               "rerun with --migrate-collection during a maintenance window to replace it.",
+                    "alias": alias,
+                    "collection": client.collection,
+                }
+            client.request("DELETE", f"/collections/{alias}", timeout=60).raise_for_status()
+            migrated = True
+    actions.append({"create_alias": {"collection_name": client.collection, "alias_name": alias}})
+    error = update_aliases(client, actions)
+    if error:
+        state = f"'{alias}' still points at {previous}" if previous else f"'{alias}' does not exist (unaliased)"
+        return {
+            "status": "error",
+            "message": f"Alias update failed after {ALIAS_ATTEMPTS} attempts: {error}. {state}; "
+                       f"the rebuild is in {client.collection}, rerun to retry the swap.",
+            "alias": alias,
+            "alias_target": previous,
+            "collection": client.collection,
+            "replaced_collection": migrated,
+        }
+
+    if previous and previous != client.collection and not keep_old:
+        client.request("DELETE", f"/collections/{previous}", timeout=60).raise_for_status()
+    ingest_stamp.mark_ingested()
+    return {
+        "status": "success",
+        "alias": alias,
+        "collection": client.collection,
+        "previous": previous,
+        "replaced_collection": migrated,
+        "confirmed": confirmation["confirmed"],
+    }
+
+
+def report_progress(checkpoint, total, started, resumed_docs):
+    elapsed = time.perf_counter() - started
+    done = checkpoint["documents"] - resumed_docs
+    event = {
+        "event": "progress",
+        "documents": checkpoint["documents"],
+        "remaining": max(total - done, 0),
+        "chunks": checkpoint["chunks"],
+        "last_doc_id": checkpoint["last_doc_id"],
+        "docs_per_sec": round(done / elapsed, 2) if elapsed else None,
+    }
+    sys.stderr.write(json.dumps(event) + "\n")
+    sys.stderr.flush()
+
+
+def rebuild_index(targets=None, workers=None, batch_docs=None, drive_root=None, restart=False,
+                  index_path=faiss_vectorizer.DEFAULT_INDEX_PATH, lock_path=faiss_vectorizer.DEFAULT_LOCK_PATH,
+                  rebuild_dir=None, status="processed", keep_old=False, migrate_collection=False):
+    """
+    Rebuilds the vector targets from Postgres. Batches are chunked and embedded in a process
+    pool and stored in doc_id order, so the checkpoint always marks a prefix of the documents.
+    """
+    rebuild_dir = rebuild_dir or REBUILD_DIR
+    batch_docs = batch_docs or BATCH_DOCS
+    drive_root = drive_root or DRIVE_ROOT
+    workers = workers or os.cpu_count() or 1
+    try:
+        if restart and os.path.isdir(rebuild_dir):
+            shutil.rmtree(rebuild_dir)
+        os.makedirs(rebuild_dir, exist_ok=True)
+
+        checkpoint = read_checkpoint(rebuild_dir)
+        resumed = checkpoint is not None
+        if resumed:
+            if checkpoint["model"] != faiss_vectorizer.model_id():
+                return {"status": "error", "message": f"Checkpoint was written for {checkpoint['model']}; rerun with --restart."}
+            if "caught_up_to" not in checkpoint:
+                return {"status": "error", "message": "Checkpoint has no catch-up mark; rerun with --restart."}
+            targets = checkpoint["targets"]
+        else:
+            targets = targets or (["faiss", "qdrant"] if WRITE_QDRANT else ["faiss"])
+            checkpoint = new_checkpoint(targets, index_path)
+            write_checkpoint(rebuild_dir, checkpoint)
+
+        client = None
+        if "qdrant" in targets:
+            base = qdrant_vectorizer.get_client()
+            client = qdrant_vectorizer.QdrantClient(base.base_url, checkpoint["qdrant_collection"], wait=False)
+
+        compact_lock = os.path.join(index_path, "compact.lock")
+        with file_lock.locked(compact_lock, timeout=COMPACT_LOCK_TIMEOUT, label="Compaction lock"):
+            resumed_docs = checkpoint["documents"]
+            elapsed = 0.0
+            # Finished swaps are checkpointed, so a rerun after a failed swap only retries the rest.
+            swaps = checkpoint.setdefault("swaps", {})
+            if not swaps:
+                total = count_documents(checkpoint["last_doc_id"], status)
+                started = time.perf_counter()
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    in_flight = deque()
+                    for rows in stream_documents(checkpoint["last_doc_id"], batch_docs, status):
+                        in_flight.append(pool.submit(prepare_batch, rows, drive_root))
+                        # Bounded read-ahead; batches are stored strictly in submission order.
+                        while len(in_flight) >= workers * 2:
+                            store_batch(in_flight.popleft().result(), checkpoint, rebuild_dir, client)
+                            report_progress(checkpoint, total, started, resumed_docs)
+                    while in_flight:
+                        store_batch(in_flight.popleft().result(), checkpoint, rebuild_dir, client)
+                        report_progress(checkpoint, total, started, resumed_docs)
+
+                elapsed = time.perf_counter() - started
+                checkpoint["elapsed_s"] = round(checkpoint["elapsed_s"] + elapsed, 3)
+                write_checkpoint(rebuild_dir, checkpoint)
+
+            write_faiss = "faiss" in targets and "faiss" not in swaps
+            qdrant_pending = client is not None and "qdrant" not in swaps
+            if write_faiss or qdrant_pending:
+                catch_up(checkpoint, rebuild_dir, client if qdrant_pending else None, status,
+                         batch_docs, drive_root, index_path, write_faiss)
+            if write_faiss:
+                swaps["faiss"] = swap_faiss(checkpoint, rebuild_dir, index_path, lock_path)
+                write_checkpoint(rebuild_dir, checkpoint)
+            if qdrant_pending:
+                result = swap_qdrant(client, keep_old, migrate_collection)
+                if result["status"] == "error":
+                    return {**result, "swaps": swaps, "checkpoint": os.path.join(rebuild_dir, CHECKPOINT_NAME)}
+                swaps["qdrant"] = result
+                write_checkpoint(rebuild_dir, checkpoint)
+            if client is not None and not swaps["qdrant"].get("caught_up"):
+                # Ingests between the catch-up and the alias switch went to the old collection.
+                if catch_up(checkpoint, rebuild_dir, client, status, batch_docs, drive_root, index_path, False):
+                    client.confirm()
+                    ingest_stamp.mark_ingested()
+                swaps["qdrant"]["caught_up"] = True
+                write_checkpoint(rebuild_dir, checkpoint)
+
+        shutil.rmtree(rebuild_dir, ignore_errors=True)
+        processed = checkpoint["documents"] - resumed_docs
         return {
             "status": "success",
-            "message": "Rebuild policy: Re-reading G-Drive PDFs for semantic parity.",
-            "components_used": ["extractor.py", "faiss_vectorizer.py"]
+            "run_id": checkpoint["run_id"],
+            "resumed": resumed,
+            "targets": targets,
+            "documents": checkpoint["documents"],
+            "caught_up": checkpoint["caught_up"],
+            "chunks": checkpoint["chunks"],
+            "reextracted": checkpoint["reextracted"],
+            "failures": checkpoint["failures"],
+            "workers": workers,
+            "elapsed_s": checkpoint["elapsed_s"],
+            "docs_per_sec": round(processed / elapsed, 2) if elapsed else None,
+            "chunks_per_sec": round(checkpoint["chunks"] / checkpoint["elapsed_s"], 2) if checkpoint["elapsed_s"] else None,
+            "swaps": swaps,
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return {"status": "error", "message": str(e), "checkpoint": os.path.join(rebuild_dir, CHECKPOINT_NAME)}
 
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print(json.dumps({"status": "error", "message": "Usage: rebuild_index.py <sheets_csv_path> <drive_root>"}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the IDMS vector indexes from stored document text")
+    parser.add_argument("--targets", help="Comma-separated: faiss,qdrant (default: faiss, plus qdrant when IDMS_WRITE_QDRANT=1)")
+    parser.add_argument("--workers", type=int, default=0, help="Chunk/embed processes (default: CPU count)")
+    parser.add_argument("--batch-docs", type=int, default=0)
+    parser.add_argument("--drive-root", help="Root that documents.storage_path is relative to (default: BASE_IDMS)")
+    parser.add_argument("--status", default="processed", help="Index documents with this status")
+    parser.add_argument("--restart", action="store_true", help="Discard an interrupted run's checkpoint")
+    parser.add_argument("--keep-old", action="store_true", help="Keep the previous Qdrant collection after the alias swap")
+    parser.add_argument(
+        "--migrate-collection",
+        action="store_true",
+        help="Maintenance: replace a plain collection named like the alias (search has no Qdrant collection until the alias exists)",
+    )
+    parser.add_argument("--index-path", default=faiss_vectorizer.DEFAULT_INDEX_PATH)
+    parser.add_argument("--lock-path", default=faiss_vectorizer.DEFAULT_LOCK_PATH)
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()] if args.targets else None
+    if targets and not set(targets) <= {"faiss", "qdrant"}:
+        print(json.dumps({"status": "error", "message": "Targets must be faiss and/or qdrant."}))
         sys.exit(1)
 
-    result = rebuild_index(sys.argv[1], sys.argv[2])
+    result = rebuild_index(
+        targets=targets,
+        workers=args.workers or None,
+        batch_docs=args.batch_docs or None,
+        drive_root=args.drive_root,
+        restart=args.restart,
+        index_path=args.index_path,
+        lock_path=args.lock_path,
+        status=args.status,
+        keep_old=args.keep_old,
+        migrate_collection=args.migrate_collection,
+    )
     print(json.dumps(result))
+    if result.get("status") != "success":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from ingest_stamp import read_ingest_stamp
+from qdrant_vectorizer import embed_batch, get_client
+from postgres_logger import get_dsn, vector_literal
+
+# Hybrid chunk search: an ANN vector query and a trigram query run concurrently and their
+# rankings are merged with reciprocal-rank fusion. Results are cached per query until the next
+# ingest rewrites the ingest stamp.
+VECTOR_BACKEND = os.environ.get("IDMS_SEARCH_VECTOR_BACKEND", "pgvector").strip().lower()
+SEARCH_DIMS = 384
+# Candidates fetched from each ranking per requested result.
+CANDIDATE_FACTOR = int(os.environ.get("IDMS_SEARCH_CANDIDATE_FACTOR", "4"))
+MIN_CANDIDATES = 20
+RRF_K = int(os.environ.get("IDMS_SEARCH_RRF_K", "60"))
+# pgvector HNSW candidate list and pg_trgm word-similarity cut-off, set per connection.
+EF_SEARCH = int(os.environ.get("IDMS_SEARCH_EF_SEARCH", "100"))
+TRGM_THRESHOLD = float(os.environ.get("IDMS_SEARCH_TRGM_THRESHOLD", "0.5"))
+CACHE_SIZE = int(os.environ.get("IDMS_SEARCH_CACHE_SIZE", "1024"))
+
+_LOCAL = threading.local()
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="idms-search")
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_STAMP = None
+CACHE_STATS = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def connection(dsn=None):
+    """One autocommit connection per thread per DSN, reopened if the server dropped it."""
+    dsn = dsn or get_dsn()
+    conns = getattr(_LOCAL, "conns", None)
+    if conns is None:
+        conns = _LOCAL.conns = {}
+    conn = conns.get(dsn)
+    if conn is None or conn.closed:
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SET hnsw.ef_search = %s", (EF_SEARCH,))
+            cur.execute("SET pg_trgm.word_similarity_threshold = %s", (TRGM_THRESHOLD,))
+        conns[dsn] = conn
+    return conn
+
+
+def fetch_rows(sql, params, dsn=None):
+    conn = connection(dsn)
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        columns = [col[0] for col in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+FILTER_SQL = """
+    AND (%(category)s::text IS NULL OR d.category = %(category)s)
+    AND (%(entity)s::text IS NULL OR d.entity = %(entity)s)
+"""
+
+
+def pgvector_candidates(query, vector, limit, filters, dsn=None):
+    """Nearest chunks by cosine distance through the HNSW index on document_chunks.embedding."""
+    return fetch_rows(
+        f"""
+        SELECT c.doc_id, c.chunk_index, c.chunk_text,
+               1 - (c.embedding <=> %(vector)s::vector) AS score,
+               d.category, d.entity, d.storage_path
+        FROM document_chunks c
+        JOIN documents d ON d.doc_id = c.doc_id
+        WHERE c.embedding IS NOT NULL
+        {FILTER_SQL}
+        ORDER BY c.embedding <=> %(vector)s::vector
+        LIMIT %(limit)s
+        """,
+        {"vector": vector_literal(vector), "limit": limit, **filters},
+        dsn,
+    )
+
+
+def qdrant_candidates(query, vector, limit, filters, dsn=None):
+    """Nearest chunks from the Qdrant collection, filtered on the payload's category/entity."""
+    hits = get_client().search(vector, limit, filters)
+    return [
+        {
+            "doc_id": hit["payload"].get("doc_id"),
+            "chunk_index": hit["payload"].get("chunk_index"),
+            "chunk_text": hit["payload"].get("chunk_text"),
+            "score": hit.get("score"),
+            "category": hit["payload"].get("category"),
+            "entity": hit["payload"].get("entity"),
+            "storage_path": None,
+        }
+        for hit in hits
+    ]
+
+
+def trigram_candidates(query, vector, limit, filters, dsn=None):
+    """
+    Chunks containing a close match for the query's words. `<%` (word similarity) is answered
+    from the GIN trigram index, unlike ordering the whole table by similarity().
+    """
+    return fetch_rows(
+        f"""
+        SELECT c.doc_id, c.chunk_index, c.chunk_text,
+               word_similarity(%(query)s, c.chunk_text) AS score,
+               d.category, d.entity, d.storage_path
+        FROM document_chunks c
+        JOIN documents d ON d.doc_id = c.doc_id
+        WHERE %(query)s <%% c.chunk_text
+        {FILTER_SQL}
+        ORDER BY score DESC
+        LIMIT %(limit)s
+        """,
+        {"query": query, "limit": limit, **filters},
+        dsn,
+    )
+
+
+VECTOR_BACKENDS = {"pgvector": pgvector_candidates, "qdrant": qdrant_candidates}
+
+
+def fuse(rankings, top_k, k=None):
+    """
+    Reciprocal-rank fusion: each chunk scores sum(1 / (k + rank)) over the rankings it appears
+    in, so agreement between the two queries outranks a high position in just one.
+    """
+    k = RRF_K if k is None else k
+    merged = {}
+    for source, rows in rankings.items():
+        for rank, row in enumerate(rows, start=1):
+            key = (row["doc_id"], row["chunk_index"])
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {**row, "score": 0.0, "ranks": {}}
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][source] = rank
+            entry[f"{source}_score"] = None if row.get("score") is None else float(row["score"])
+    ordered = sorted(merged.values(), key=lambda e: (-e["score"], str(e["doc_id"]), e["chunk_index"] or 0))
+    for entry in ordered:
+        entry["score"] = round(entry["score"], 6)
+    return ordered[:top_k]
+
+
+def cache_key(query, top_k, filters, vector_backend):
+    return (" ".join(query.lower().split()), top_k, filters.get("category"), filters.get("entity"), vector_backend)
+
+
+def cache_get(key, stamp):
+    global _CACHE_STAMP
+    with _CACHE_LOCK:
+        if stamp != _CACHE_STAMP:
+            if _CACHE:
+                CACHE_STATS["invalidations"] += 1
+            _CACHE.clear()
+            _CACHE_STAMP = stamp
+        result = _CACHE.get(key)
+        if result is not None:
+            _CACHE.move_to_end(key)
+            CACHE_STATS["hits"] += 1
+        else:
+            CACHE_STATS["misses"] += 1
+        return result
+
+
+def cache_put(key, stamp, result):
+    with _CACHE_LOCK:
+        if stamp != _CACHE_STAMP or CACHE_SIZE <= 0:
+            return
+        _CACHE[key] = result
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+
+
+def timed_call(fn, *args):
+    start = time.perf_counter()
+    rows = fn(*args)
+    return rows, round((time.perf_counter() - start) * 1000.0, 3)
+
+
+def search(query, top_k=5, category=None, entity=None, vector_backend=None, use_cache=True, dsn=None):
+    """
+    Top chunks for query as {rows: [{doc_id, chunk_index, chunk_text, score, category, entity,
+    storage_path, ranks}]}. If one of the two queries fails the other's ranking is returned with
+    a warning.
+    """
+    start = time.perf_counter()
+    query = (query or "").strip()
+    if not query:
+        return {"status": "error", "message": "query is required"}
+    vector_backend = vector_backend or VECTOR_BACKEND
+    if vector_backend not in VECTOR_BACKENDS:
+        return {"status": "error", "message": f"Unknown vector backend: {vector_backend}"}
+
+    filters = {"category": category, "entity": entity}
+    key = cache_key(query, top_k, filters, vector_backend)
+    stamp = read_ingest_stamp()
+    if use_cache:
+        cached = cache_get(key, stamp)
+        if cached is not None:
+            return {**cached, "cached": True, "latency_ms": round((time.perf_counter() - start) * 1000.0, 3)}
+
+    limit = max(top_k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+    vector = embed_batch([query], dims=SEARCH_DIMS)[0]
+    futures = {
+        "vector": _EXECUTOR.submit(timed_call, VECTOR_BACKENDS[vector_backend], query, vector, limit, filters, dsn),
+        "lexical": _EXECUTOR.submit(timed_call, trigram_candidates, query, vector, limit, filters, dsn),
+    }
+    rankings = {}
+    timings = {}
+    warnings = []
+    for source, future in futures.items():
+        try:
+            rankings[source], timings[f"{source}_ms"] = future.result()
+        except Exception as e:
+            warnings.append(f"{source} query failed: {e}")
+    if not rankings:
+        return {"status": "error", "message": "; ".join(warnings)}
+
+    rows = fuse(rankings, top_k)
+    result = {
+        "status": "success",
+        "query": query,
+        "top_k": top_k,
+        "filters": {k: v for k, v in filters.items() if v is not None},
+        "vector_backend": vector_backend,
+        "count": len(rows),
+        "rows": rows,
+        "timings": timings,
+    }
+    if warnings:
+        result["warnings"] = warnings
+    else:
+        # Degraded results are not cached, so the next call retries the failed query.
+        cache_put(key, stamp, result)
+    return {**result, "cached": False, "latency_ms": round((time.perf_counter() - start) * 1000.0, 3)}
+
+
+def run_job(job):
+    return search(
+        job.get("query"),
+        top_k=int(job.get("top_k") or 5),
+        category=job.get("category"),
+        entity=job.get("entity"),
+        vector_backend=job.get("vector_backend"),
+    )
+
+
+def serve():
+    """
+    Long-lived worker speaking the pipeline_runner --serve protocol, so the API's worker pool can
+    host it and the result cache survives between requests.
+    Job: {"execution_id", "query", "top_k"?, "category"?, "entity"?} or {"command": "shutdown"}.
+    """
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(event):
+        protocol.write(json.dumps(event, default=str) + "\n")
+        protocol.flush()
+
+    emit({"event": "ready", "pid": os.getpid(), "vector_backend": VECTOR_BACKEND})
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError:
+            emit({"event": "error", "message": "Invalid job JSON."})
+            continue
+        if job.get("command") == "shutdown":
+            break
+
+        # A job that raises must still answer its execution_id, or the caller waits out its timeout.
+        stderr = ""
+        try:
+            result = run_job(job)
+        except Exception as exc:
+            result = {"status": "error", "message": str(exc)}
+            stderr = traceback.format_exc()
+        emit({
+            "event": "result",
+            "execution_id": job.get("execution_id"),
+            "exit_code": 0 if result.get("status") == "success" else 1,
+            "stdout": json.dumps(result, default=str),
+            "stderr": stderr,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IDMS hybrid chunk search")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--category")
+    parser.add_argument("--entity")
+    parser.add_argument("--vector-backend", choices=sorted(VECTOR_BACKENDS))
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived JSON-lines worker on stdin/stdout")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+
+    result = search(args.query, args.top_k, args.category, args.entity, args.vector_backend)
+    print(json.dumps(result, default=str))
+    if result.get("status") != "success":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()